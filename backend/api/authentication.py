@@ -0,0 +1,104 @@
+from hashlib import sha256
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from users.models import User
+
+from .caching import LOCAL_TIMEOUT, LRUCache, shared_cache
+
+
+def shared_key(key):
+    """Ключ в общем кеше: сам токен в имени ключа не хранится."""
+    return 'auth-token:{}'.format(sha256(key.encode()).hexdigest())
+
+
+# В общий кеш уходят поля юзера без хеша пароля; токен не хранится,
+# его ключ и так есть у того, кто предъявил токен.
+SHARED_FIELDS = [
+    field.attname for field in User._meta.concrete_fields
+    if field.attname != 'password'
+]
+
+
+def dump_credentials(credentials):
+    user, token = credentials
+    return [getattr(user, field) for field in SHARED_FIELDS]
+
+
+def load_credentials(key, values):
+    """(юзер, токен) из общего кеша; пароль читается из базы
+    при обращении, как отложенное поле."""
+    user = User.from_db(DEFAULT_DB_ALIAS, SHARED_FIELDS, values)
+    return user, Token(key=key, user=user)
+
+
+class TokenCache:
+    """Проверенные токены: (юзер, токен) по ключу токена.
+
+    Если включён TOKEN_CACHE_SHARED, поля юзера без пароля живут
+    в общем кеше TOKEN_CACHE_TIMEOUT секунд, а в кеше процесса -
+    LOCAL_TIMEOUT, поэтому выход в другом воркере виден не позже чем
+    через LOCAL_TIMEOUT. Без общего кеша запись живёт в процессе
+    весь TOKEN_CACHE_TIMEOUT.
+    """
+
+    def __init__(self):
+        self.shared = settings.TOKEN_CACHE_SHARED
+        self.local = LRUCache(
+            settings.TOKEN_CACHE_SIZE,
+            LOCAL_TIMEOUT if self.shared else settings.TOKEN_CACHE_TIMEOUT
+        )
+
+    def get(self, key):
+        credentials = self.local.get(key)
+        if credentials is None and self.shared:
+            values = shared_cache.get(shared_key(key))
+            if values is not None:
+                credentials = load_credentials(key, values)
+                self.local.set(key, credentials)
+        return credentials
+
+    def set(self, key, credentials):
+        self.local.set(key, credentials)
+        if self.shared:
+            shared_cache.set(
+                shared_key(key), dump_credentials(credentials),
+                settings.TOKEN_CACHE_TIMEOUT
+            )
+
+    def delete(self, key):
+        self.local.delete(key)
+        if self.shared:
+            shared_cache.delete(shared_key(key))
+
+    def forget_user(self, user_id):
+        for key in Token.objects.filter(user_id=user_id).values_list(
+            'key', flat=True
+        ):
+            self.delete(key)
+
+    def clear(self):
+        self.local.clear()
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication без запроса к базе, пока токен в кеше.
+
+    Записи сбрасываются сигналами (api/signals.py) при удалении токена,
+    в том числе при выходе через auth/token/logout/, и при изменении
+    или удалении юзера. update() сигналов не шлёт, поэтому поля,
+    которые меняются через него (счётчики, feed_fanout_on_read),
+    у request.user могут отставать: их нужно читать из базы.
+    """
+
+    def authenticate_credentials(self, key):
+        credentials = token_cache.get(key)
+        if credentials is None:
+            credentials = super().authenticate_credentials(key)
+            token_cache.set(key, credentials)
+        return credentials
@@ -0,0 +1,134 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from hashlib import md5
+
+from django.core.cache import caches
+
+from .replicas import primary
+from .versions import get_version
+
+PAGE_TIMEOUT = 300
+LOCAL_TIMEOUT = 5
+LOCK_TIMEOUT = 10
+LOCK_POLL_INTERVAL = 0.05
+IGNORED_ANONYMOUS_PARAMS = ('is_favorited', 'is_in_shopping_cart')
+
+local_cache = caches['default']
+shared_cache = caches['shared']
+
+
+def normalize_query(query_params, ignored=()):
+    """Канонический вид query string: порядок параметров и значений
+    не важен, пустые значения отбрасываются."""
+    items = []
+    for name in sorted(query_params):
+        if name in ignored:
+            continue
+        values = sorted(value for value in query_params.getlist(name) if value)
+        items.extend(f'{name}={value}' for value in values)
+    return '&'.join(items)
+
+
+def anonymous_page_key(request):
+    """Ключ страницы для анонима: в ответе абсолютные ссылки, поэтому
+    схема и хост входят в ключ вместе с путём и параметрами."""
+    renderer = getattr(request.accepted_renderer, 'format', '')
+    query = normalize_query(request.query_params, IGNORED_ANONYMOUS_PARAMS)
+    url = f'{request.scheme}://{request.get_host()}{request.path}?{query}'
+    return 'page:{}:{}:{}'.format(
+        get_version('catalog'), renderer, md5(url.encode()).hexdigest()
+    )
+
+
+def get_or_compute(key, compute, timeout=PAGE_TIMEOUT):
+    """Достаёт значение из кеша или считает его ровно в одном воркере.
+
+    Сначала проверяется кеш процесса, затем общий. При промахе воркер
+    берёт блокировку через cache.add; остальные ждут, пока значение
+    появится в общем кеше, и считают сами только по истечении
+    LOCK_TIMEOUT.
+
+    Исключительность блокировки держится на атомарном add() общего
+    кеша (Redis, Memcached). С FileBasedCache по умолчанию значение
+    иногда посчитают несколько воркеров, а одновременные сдвиги версий
+    (versions.bump_version) могут потеряться; об этом предупреждает
+    проверка api.W001 (manage.py check --deploy).
+    """
+    value = local_cache.get(key)
+    if value is not None:
+        return value
+    value = shared_cache.get(key)
+    if value is None:
+        value = _compute_once(key, compute, timeout)
+    local_cache.set(key, value, LOCAL_TIMEOUT)
+    return value
+
+
+def _compute_once(key, compute, timeout):
+    lock_key = f'{key}:lock'
+    if shared_cache.add(lock_key, 1, LOCK_TIMEOUT):
+        try:
+            # Под текущей версией кладётся только то, что прочитано
+            # с основной базы, а не с отстающей реплики.
+            with primary():
+                value = compute()
+            shared_cache.set(key, value, timeout)
+        finally:
+            shared_cache.delete(lock_key)
+        return value
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(LOCK_POLL_INTERVAL)
+        value = shared_cache.get(key)
+        if value is not None:
+            return value
+        if shared_cache.get(lock_key) is None:
+            break
+    with primary():
+        return compute()
+
+
+class LRUCache:
+    """Кеш процесса: не больше maxsize записей, каждая живёт timeout с.
+
+    При переполнении вытесняется запись, к которой дольше всего
+    не обращались. Значения хранятся в pickle, как в общем кеше:
+    каждый get() отдаёт свою копию, и изменения объекта в одном
+    запросе не видны другим.
+    """
+
+    def __init__(self, maxsize, timeout):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+        return pickle.loads(value)
+
+    def set(self, key, value):
+        value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + self.timeout)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+# Бэкенды, у которых add() и incr() не атомарны между процессами.
+NON_ATOMIC_BACKENDS = (
+    'django.core.cache.backends.filebased.FileBasedCache',
+    'django.core.cache.backends.locmem.LocMemCache',
+)
+
+
+@register(deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """Общий кеш держит блокировки заполнения и версии данных."""
+    backend = settings.CACHES['shared']['BACKEND']
+    if backend not in NON_ATOMIC_BACKENDS:
+        return []
+    return [Warning(
+        f'Общий кеш {backend} не поддерживает атомарные add() и incr().',
+        hint=(
+            'Блокировка заполнения кеша страниц перестаёт быть '
+            'исключительной, а одновременные сдвиги версий данных могут '
+            'теряться. Задайте SHARED_CACHE_BACKEND с Redis или Memcached.'
+        ),
+        id='api.W001',
+    )]
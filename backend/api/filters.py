@@ -1,5 +1,26 @@
 import django_filters
-from recipes.models import Ingredients, Recipes
+from django.db.models import Count
+from recipes.models import Ingredients, Recipes, RecipeTags, Tags
+from recipes.search import search_recipes
+from rest_framework.filters import OrderingFilter
+
+from .caching import get_or_compute
+from .versions import get_version
+
+TAGS_ANY = 'any'
+TAGS_ALL = 'all'
+
+
+def get_tag_ids():
+    """slug -> id всех тегов из кеша, сбрасывается с версией 'tags'."""
+    return get_or_compute(
+        'tag-ids:{}'.format(get_version('tags')),
+        lambda: dict(Tags.objects.values_list('slug', 'id'))
+    )
+
+
+def tag_choices():
+    return [(slug, slug) for slug in get_tag_ids()]
 
 
 class IngredientsFilter(django_filters.FilterSet):
@@ -11,16 +32,47 @@ class IngredientsFilter(django_filters.FilterSet):
 
 
 class RecipeFilter(django_filters.FilterSet):
-    """Фильтр рецептов по автору/тегу/подписке/наличию в списке покупок"""
-    tags = django_filters.AllValuesMultipleFilter(field_name='tags__slug')
+    """Фильтр рецептов по автору/тегу/подписке/наличию в списке покупок
+
+    tags_match=any (по умолчанию) - рецепты хотя бы с одним из тегов,
+    tags_match=all - со всеми. Теги проверяются подзапросом по
+    RecipeTags, поэтому рецепт не повторяется и DISTINCT не нужен.
+    """
+    tags = django_filters.MultipleChoiceFilter(
+        choices=tag_choices, method='filter_tags'
+    )
+    tags_match = django_filters.ChoiceFilter(
+        choices=((TAGS_ANY, TAGS_ANY), (TAGS_ALL, TAGS_ALL)),
+        method='filter_tags_match'
+    )
     is_favorited = django_filters.NumberFilter(method='filter_is_favorited')
     is_in_shopping_cart = django_filters.NumberFilter(
         method='filter_is_in_shopping_cart')
     author = django_filters.NumberFilter(field_name='author__id')
+    search = django_filters.CharFilter(method='filter_search')
 
     class Meta:
         model = Recipes
-        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart')
+        fields = (
+            'author', 'tags', 'tags_match', 'is_favorited',
+            'is_in_shopping_cart', 'search'
+        )
+
+    def filter_tags(self, queryset, name, value):
+        tag_ids = {get_tag_ids()[slug] for slug in value}
+        recipe_tags = RecipeTags.objects.filter(tag_id__in=tag_ids)
+        if self.form.cleaned_data.get('tags_match') == TAGS_ALL:
+            recipe_tags = recipe_tags.values('recipe_id').annotate(
+                matched=Count('tag_id')
+            ).filter(matched=len(tag_ids))
+        return queryset.filter(id__in=recipe_tags.values('recipe_id'))
+
+    def filter_tags_match(self, queryset, name, value):
+        """Режим учитывается в filter_tags."""
+        return queryset
+
+    def filter_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
 
     def filter_is_favorited(self, queryset, name, value):
         if value and self.request.user.is_authenticated:
@@ -31,3 +83,13 @@ class RecipeFilter(django_filters.FilterSet):
         if value and self.request.user.is_authenticated:
             return queryset.filter(shopping_cart__user=self.request.user)
         return queryset
+
+
+class RecipeOrderingFilter(OrderingFilter):
+    """При поиске без явного ordering сортирует по релевантности."""
+
+    def get_ordering(self, request, queryset, view):
+        if (request.query_params.get('search')
+                and not request.query_params.get(self.ordering_param)):
+            return ('-search_rank',) + tuple(view.ordering)
+        return super().get_ordering(request, queryset, view)
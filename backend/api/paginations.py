@@ -1,6 +1,134 @@
-from rest_framework.pagination import PageNumberPagination
+from hashlib import md5
+
+from django.core.cache import caches
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import Paginator
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (Cursor, CursorPagination,
+                                       PageNumberPagination)
+
+from .replicas import primary
+from .versions import get_version
+
+COUNT_CACHE_TIMEOUT = 30
+
+cache = caches['shared']
+
+
+class CachedCountPaginator(Paginator):
+    """Paginator, который кеширует COUNT(*) по тексту SQL-запроса.
+
+    Текст запроса включает все фильтры и id юзера, поэтому разные
+    выборки не смешиваются. Ключ содержит версию 'recipes', которую
+    сигналы сдвигают при изменении рецептов, избранного, списков
+    покупок и подписок; таймаут страхует от изменений в обход сигналов.
+    COUNT(*) всегда читается с основной базы.
+    """
+
+    @cached_property
+    def count(self):
+        try:
+            sql, params = self.object_list.query.sql_with_params()
+        except (AttributeError, EmptyResultSet):
+            return super().count
+        key = 'paginator-count:{}:{}'.format(
+            get_version('recipes'), md5(f'{sql}{params}'.encode()).hexdigest()
+        )
+        count = cache.get(key)
+        if count is None:
+            # Под версией кешируется только счёт с основной базы.
+            with primary():
+                count = super().count
+            cache.set(key, count, COUNT_CACHE_TIMEOUT)
+        return count
+
+
+class KeysetPagination(CursorPagination):
+    page_size = 6
+    page_size_query_param = 'limit'
+
+
+class FeedPagination(KeysetPagination):
+    """Курсор ленты подписок по ключу (pub_date, recipe_id).
+
+    Лента - объединение запросов, и фильтр по курсору к нему не
+    применить, поэтому строки страницы берутся функцией
+    timeline(before), которая ставит условие в каждую часть.
+    Выдача только вперёд: {next, previous: null, results}.
+    """
+
+    def paginate_timeline(self, timeline, request):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+        before = None if cursor is None else self.parse_position(
+            cursor.position
+        )
+        rows = list(timeline(before)[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        return self.page
+
+    def parse_position(self, position):
+        try:
+            pub_date, recipe_id = position.rsplit('|', 1)
+            key = parse_datetime(pub_date), int(recipe_id)
+        except (AttributeError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if key[0] is None:
+            raise NotFound(self.invalid_cursor_message)
+        return key
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        return self.encode_cursor(Cursor(
+            offset=0, reverse=False, position='{}|{}'.format(
+                last['pub_date'].isoformat(), last['recipe_id']
+            )
+        ))
+
+    def get_previous_link(self):
+        return None
 
 
 class CustomPagination(PageNumberPagination):
+    """Постраничная пагинация с опциональным режимом курсора.
+
+    Если у вьюсета задан cursor_ordering и в запросе есть параметр
+    cursor (для первой страницы - пустой), выдача строится по ключу
+    сортировки без COUNT(*) и OFFSET: {next, previous, results}.
+    """
     page_size = 6
     page_size_query_param = 'limit'
+    django_paginator_class = CachedCountPaginator
+    cursor_query_param = 'cursor'
+    cursor_ordering = None
+    cursor_paginator = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if (self.cursor_ordering
+                and self.cursor_query_param in request.query_params):
+            self.cursor_paginator = KeysetPagination()
+            self.cursor_paginator.ordering = self.cursor_ordering
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class RecipesPagination(CustomPagination):
+    cursor_ordering = ('-pub_date', 'id')
+
+
+class SubscriptionsPagination(CustomPagination):
+    cursor_ordering = ('-id',)
@@ -0,0 +1,165 @@
+"""Чтение с реплик базы.
+
+ReplicaMiddleware выбирает реплику для GET и HEAD к вьюхам с атрибутом
+replica_reads = True, ReplicaRouter отправляет на неё чтения этого
+запроса. Записи всегда идут на основную базу, и после первой записи
+чтения запроса тоже. После успешного небезопасного запроса клиент
+(по заголовку Authorization или сессии) REPLICA_PIN_SECONDS читает
+с основной базы: реплика могла ещё не получить его изменения.
+
+Реплика выбирается случайно с весами из DATABASE_REPLICAS. Реплика,
+к которой не удалось подключиться, пропускается
+REPLICA_RETRY_SECONDS секунд; если здоровых нет, читает основная база.
+"""
+import random
+import threading
+import time
+from contextlib import contextmanager
+from hashlib import sha256
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import (DEFAULT_DB_ALIAS, InterfaceError, OperationalError,
+                       connections)
+
+SAFE_METHODS = ('GET', 'HEAD')
+# Ошибки недоступной базы, после которых чтение можно повторить.
+CONNECTION_ERRORS = (InterfaceError, OperationalError)
+
+shared_cache = caches['shared']
+state = threading.local()
+
+
+def current_replica():
+    return getattr(state, 'replica', None)
+
+
+@contextmanager
+def primary():
+    """Чтения внутри блока идут на основную базу.
+
+    Нужно для всего, что кладётся в кеш под текущей версией данных:
+    отставшая реплика закешировала бы старое под новой версией.
+    """
+    replica = current_replica()
+    state.replica = None
+    try:
+        yield
+    finally:
+        state.replica = replica
+
+
+class ReplicaPool:
+    """Реплики с весами и отметками о недоступности."""
+
+    def __init__(self, weights, retry_seconds):
+        self.weights = dict(weights)
+        self.retry_seconds = retry_seconds
+        self.down_until = {}
+        self.rng = random.Random()
+        self.lock = threading.Lock()
+
+    def check(self, alias):
+        try:
+            connections[alias].ensure_connection()
+        except CONNECTION_ERRORS:
+            return False
+        return True
+
+    def is_healthy(self, alias):
+        if self.down_until.get(alias, 0) > time.monotonic():
+            return False
+        if self.check(alias):
+            return True
+        self.mark_down(alias)
+        return False
+
+    def mark_down(self, alias):
+        with self.lock:
+            self.down_until[alias] = time.monotonic() + self.retry_seconds
+
+    def choose(self):
+        """Здоровая реплика с учётом весов или None."""
+        candidates = dict(self.weights)
+        while candidates:
+            alias, = self.rng.choices(
+                list(candidates), weights=list(candidates.values())
+            )
+            if self.is_healthy(alias):
+                return alias
+            del candidates[alias]
+        return None
+
+
+def client_key(request):
+    """Ключ клиента для закрепления за основной базой или None."""
+    credentials = (
+        request.META.get('HTTP_AUTHORIZATION')
+        or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    )
+    if not credentials:
+        return None
+    return 'replica-pin:{}'.format(sha256(credentials.encode()).hexdigest())
+
+
+class ReplicaMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.pool = ReplicaPool(
+            settings.DATABASE_REPLICAS, settings.REPLICA_RETRY_SECONDS
+        )
+
+    def __call__(self, request):
+        state.replica = None
+        try:
+            response = self.get_response(request)
+        finally:
+            state.replica = None
+        if (self.pool.weights and request.method not in SAFE_METHODS
+                and response.status_code < 400):
+            key = client_key(request)
+            if key is not None:
+                shared_cache.set(key, 1, settings.REPLICA_PIN_SECONDS)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (not self.pool.weights or request.method not in SAFE_METHODS
+                or not getattr(
+                    getattr(view_func, 'cls', None), 'replica_reads', False
+                )):
+            return None
+        key = client_key(request)
+        if key is not None and shared_cache.get(key):
+            return None
+        state.replica = self.pool.choose()
+        request.replica_view = (view_func, view_args, view_kwargs)
+        return None
+
+    def process_exception(self, request, exception):
+        """Реплика отказала посреди запроса: повтор на основной базе."""
+        replica = current_replica()
+        if replica is None or not isinstance(exception, CONNECTION_ERRORS):
+            return None
+        self.pool.mark_down(replica)
+        state.replica = None
+        view_func, view_args, view_kwargs = request.replica_view
+        return view_func(request, *view_args, **view_kwargs)
+
+
+class ReplicaRouter:
+    """Чтения - на реплику, выбранную ReplicaMiddleware, остальное -
+    на основную базу. Миграции применяются только к основной."""
+
+    def db_for_read(self, model, **hints):
+        return current_replica()
+
+    def db_for_write(self, model, **hints):
+        state.replica = None
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
@@ -0,0 +1,143 @@
+import re
+import threading
+import time
+from bisect import bisect_left
+
+from recipes.models import Ingredients
+
+from .replicas import primary
+from .versions import get_version
+
+SEARCH_LIMIT = 30
+MAX_SEARCH_LIMIT = 100
+REFRESH_INTERVAL = 300
+NGRAM_SIZE = 2
+
+PREFIX, WORD_PREFIX, SUBSTRING = range(3)
+WORD_START = re.compile(r'(?<=[\s\-(,.«"])\w')
+
+
+def normalize(value):
+    """Приводит строку к виду для поиска: регистр, ё/е и пробелы."""
+    return ' '.join(value.lower().replace('ё', 'е').split())
+
+
+def ngrams(value):
+    return {
+        value[i:i + NGRAM_SIZE]
+        for i in range(len(value) - NGRAM_SIZE + 1)
+    }
+
+
+class IndexSnapshot:
+    """Неизменяемый срез индекса: поиск читает его без блокировки."""
+
+    def __init__(self, rows=()):
+        entries, names, prefixes, grams = [], [], [], {}
+        for idx, (pk, name, measurement_unit) in enumerate(rows):
+            entries.append({
+                'id': pk, 'name': name, 'measurement_unit': measurement_unit
+            })
+            normalized = normalize(name)
+            names.append(normalized)
+            prefixes.append((normalized, PREFIX, idx))
+            for match in WORD_START.finditer(normalized):
+                prefixes.append((normalized[match.start():], WORD_PREFIX, idx))
+            for gram in ngrams(normalized):
+                grams.setdefault(gram, []).append(idx)
+        prefixes.sort()
+        self.entries = entries
+        self.names = names
+        self.keys = [key for key, _, _ in prefixes]
+        self.refs = [(rank, idx) for _, rank, idx in prefixes]
+        self.grams = {gram: frozenset(ids) for gram, ids in grams.items()}
+        # Место названия среди всех: короткие раньше, затем по алфавиту.
+        self.order = [0] * len(names)
+        by_length = sorted(
+            range(len(names)), key=lambda idx: (len(names[idx]), names[idx])
+        )
+        for position, idx in enumerate(by_length):
+            self.order[idx] = position
+
+    def search(self, query, limit):
+        ranks = {}
+        keys = self.keys
+        position = bisect_left(keys, query)
+        while position < len(keys) and keys[position].startswith(query):
+            rank, idx = self.refs[position]
+            if rank < ranks.get(idx, SUBSTRING + 1):
+                ranks[idx] = rank
+            position += 1
+        if len(ranks) < limit:
+            for idx in self._substring_candidates(query):
+                if idx not in ranks and query in self.names[idx]:
+                    ranks[idx] = SUBSTRING
+        found = sorted(ranks, key=lambda idx: (
+            ranks[idx], self.names[idx] != query, self.order[idx]
+        ))
+        return [self.entries[idx] for idx in found[:limit]]
+
+    def _substring_candidates(self, query):
+        if len(query) < NGRAM_SIZE:
+            return ()
+        postings = []
+        for gram in ngrams(query):
+            ids = self.grams.get(gram)
+            if not ids:
+                return ()
+            postings.append(ids)
+        postings.sort(key=len)
+        return postings[0].intersection(*postings[1:])
+
+
+class IngredientIndex:
+    """Индекс для автодополнения ингредиентов по названию.
+
+    Совпадения по началу названия идут первыми, затем совпадения
+    по началу любого слова, затем вхождения в середину слова; внутри
+    группы - точное совпадение, затем названия покороче. Префиксы
+    ищутся бинарным поиском по отсортированным ключам, вхождения -
+    через пересечение n-грамм. Индекс перестраивается после изменения
+    таблицы ингредиентов и раз в REFRESH_INTERVAL секунд: новый срез
+    подменяет старый одним присваиванием. Изменения из других
+    процессов подхватываются по версии 'ingredients' в общем кеше.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._built_at = None
+        self._version = None
+        self._snapshot = IndexSnapshot()
+
+    def invalidate(self):
+        self._built_at = None
+
+    def refresh(self):
+        with self._lock:
+            if not self._is_stale():
+                return
+            version = get_version('ingredients')
+            with primary():
+                self._snapshot = IndexSnapshot(Ingredients.objects.order_by(
+                    'name', 'id'
+                ).values_list('id', 'name', 'measurement_unit'))
+            self._built_at = time.monotonic()
+            self._version = version
+
+    def _is_stale(self):
+        return (
+            self._built_at is None
+            or time.monotonic() - self._built_at > REFRESH_INTERVAL
+            or self._version != get_version('ingredients')
+        )
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        if self._is_stale():
+            self.refresh()
+        query = normalize(query)
+        if not query:
+            return []
+        return self._snapshot.search(query, limit)
+
+
+ingredient_index = IngredientIndex()
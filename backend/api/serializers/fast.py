@@ -0,0 +1,125 @@
+"""Быстрые сериализаторы для списков.
+
+Собирают тот же JSON, что и обычные сериализаторы, из строк .values()
+простыми словарями, без полей DRF. Теги и ингредиенты страницы
+читаются одним запросом каждые. Совпадение с обычными сериализаторами
+проверяет api/tests/test_fast_serializers.py.
+"""
+from djoser.serializers import UserSerializer
+from recipes.models import IngredientInRecipe, RecipeTags
+
+from .serializers_recipes import (IngredientInRecipeSerializer,
+                                  RecipesListSerializer, TagsSerializer,
+                                  build_url, image_urls)
+from .serializers_users import MyUserSerializer
+
+AUTHOR_FIELDS = UserSerializer.Meta.fields
+AUTHOR_COLUMNS = tuple(
+    (field, f'author__{field}') for field in AUTHOR_FIELDS
+)
+TAG_FIELDS = TagsSerializer.Meta.fields
+INGREDIENT_FIELDS = IngredientInRecipeSerializer.Meta.fields
+
+
+class FastSerializer:
+    """Поля и их порядок берутся у обычного сериализатора, с учётом
+    ?fields= и ?omit=.
+
+    values() превращает отфильтрованный queryset в запрос строк,
+    to_representation() - страницу строк в список словарей. По
+    умолчанию поле ответа - одноимённая колонка строки; поля, которые
+    собираются иначе, обрабатывает to_field().
+    """
+    serializer_class = None
+    # Колонки .values() для полей ответа; по умолчанию - одноимённая.
+    columns = {}
+
+    def __init__(self, context):
+        self.request = context.get('request')
+        selected = self.serializer_class.selected_fields(self.request)
+        self.fields = [
+            field for field in self.serializer_class.Meta.fields
+            if field in selected
+        ]
+
+    def values(self, queryset):
+        columns = ['id']
+        for field in self.fields:
+            columns.extend(self.columns.get(field, (field,)))
+        return queryset.prefetch_related(None).values(
+            *dict.fromkeys(columns)
+        )
+
+    def to_field(self, field, row):
+        return row[field]
+
+    def to_representation(self, rows):
+        return [
+            {field: self.to_field(field, row) for field in self.fields}
+            for row in rows
+        ]
+
+
+class FastRecipesListSerializer(FastSerializer):
+    serializer_class = RecipesListSerializer
+    columns = {
+        # pub_date нужен курсорной пагинации.
+        'id': ('id', 'pub_date'),
+        'author': tuple(column for field, column in AUTHOR_COLUMNS),
+        'tags': (),
+        'ingredients': (),
+        'images': ('image', 'image_derivatives_ready'),
+    }
+
+    def get_tags(self, recipe_ids):
+        tags = {recipe_id: [] for recipe_id in recipe_ids}
+        rows = RecipeTags.objects.filter(recipe_id__in=recipe_ids).order_by(
+            'tag_id'
+        ).values_list(
+            'recipe_id', *(f'tag__{field}' for field in TAG_FIELDS)
+        )
+        for recipe_id, *values in rows:
+            tags[recipe_id].append(dict(zip(TAG_FIELDS, values)))
+        return tags
+
+    def get_ingredients(self, recipe_ids):
+        ingredients = {recipe_id: [] for recipe_id in recipe_ids}
+        rows = IngredientInRecipe.objects.filter(
+            recipe_id__in=recipe_ids
+        ).order_by('id').values_list(
+            'recipe_id', 'ingredient_id', 'ingredient__name',
+            'ingredient__measurement_unit', 'amount'
+        )
+        for recipe_id, *values in rows:
+            ingredients[recipe_id].append(dict(zip(INGREDIENT_FIELDS, values)))
+        return ingredients
+
+    def to_field(self, field, row):
+        if field == 'author':
+            return {name: row[column] for name, column in AUTHOR_COLUMNS}
+        if field == 'tags':
+            return self.tags[row['id']]
+        if field == 'ingredients':
+            return self.ingredients[row['id']]
+        if field == 'image':
+            if not row['image']:
+                return None
+            return build_url(row['image'], self.request)
+        if field == 'images':
+            return image_urls(
+                row['image'], row['image_derivatives_ready'], self.request
+            )
+        return row[field]
+
+    def to_representation(self, rows):
+        recipe_ids = [row['id'] for row in rows]
+        if 'tags' in self.fields:
+            self.tags = self.get_tags(recipe_ids)
+        if 'ingredients' in self.fields:
+            self.ingredients = self.get_ingredients(recipe_ids)
+        return super().to_representation(rows)
+
+
+class FastUserSerializer(FastSerializer):
+    """is_subscribed берётся из аннотации queryset."""
+    serializer_class = MyUserSerializer
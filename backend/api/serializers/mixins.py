@@ -0,0 +1,46 @@
+from rest_framework.serializers import ListSerializer
+
+FIELDS_PARAM = 'fields'
+OMIT_PARAM = 'omit'
+
+
+def get_names(request, param):
+    """Имена полей из параметра вида name,image; пустой - None."""
+    if request is None:
+        return None
+    names = {
+        name.strip()
+        for name in request.query_params.get(param, '').split(',')
+    } - {''}
+    return names or None
+
+
+class SparseFieldsMixin:
+    """Выдача только нужных полей: ?fields=id,name,image или ?omit=text.
+
+    id выдаётся всегда. Отбор действует только на сериализатор верхнего
+    уровня: вложенные объекты (например, автор рецепта) выдаются
+    целиком. Вьюхи по selected_fields() сужают и сам запрос.
+    """
+
+    @classmethod
+    def selected_fields(cls, request):
+        fields = set(cls.Meta.fields)
+        requested = get_names(request, FIELDS_PARAM)
+        if requested is not None:
+            fields &= requested
+        fields -= get_names(request, OMIT_PARAM) or set()
+        return fields | {'id'}
+
+    def get_fields(self):
+        fields = super().get_fields()
+        parent = self.parent
+        if isinstance(parent, ListSerializer):
+            parent = parent.parent
+        if parent is not None:
+            return fields
+        selected = self.selected_fields(self.context.get('request'))
+        for name in list(fields):
+            if name not in selected:
+                del fields[name]
+        return fields
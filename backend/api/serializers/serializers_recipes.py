@@ -1,25 +1,98 @@
 import base64
+import binascii
+from tempfile import SpooledTemporaryFile
 
 import webcolors
-from django.core.files.base import ContentFile
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
 from django.db import transaction
-from recipes.models import (IngredientInRecipe, Ingredients, Recipes,
-                            RecipeTags, Tags)
+from recipes.images import derivative_names
+from recipes.models import (CartIngredient, IngredientInRecipe, Ingredients,
+                            Recipes, RecipeTags, Tags)
+from recipes.search import recipe_document, write_documents
 from rest_framework import serializers
 from rest_framework.validators import UniqueTogetherValidator
 
+from ..versions import bump_version
+from .mixins import SparseFieldsMixin
 from .serializers_users import UserSerializer
 
+DECODE_CHUNK_SIZE = 64 * 1024
+RECIPE_BATCH_LIMIT = 100
+SPOOL_SIZE = 1024 * 1024
+
 
 class Base64ImageField(serializers.ImageField):
-    """Поле для кодирования/декодирования цветов в base64."""
+    """Поле для кодирования/декодирования картинок в base64.
+
+    Размер проверяется по длине строки до декодирования, а сама строка
+    декодируется кусками во временный файл, без второй копии в памяти.
+    """
+    default_error_messages = {
+        'too_large': 'Картинка больше {max_size} байт.',
+        'invalid_base64': 'Некорректная строка base64.',
+    }
+
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
             format, imgstr = data.split(';base64,')
             ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+            data = File(self.decode(imgstr), name='temp.' + ext)
         return super().to_internal_value(data)
 
+    def decode(self, encoded):
+        max_size = settings.RECIPE_IMAGE_MAX_UPLOAD_SIZE
+        if len(encoded) // 4 * 3 > max_size + 2:
+            self.fail('too_large', max_size=max_size)
+        output = SpooledTemporaryFile(max_size=SPOOL_SIZE)
+        try:
+            for start in range(0, len(encoded), DECODE_CHUNK_SIZE):
+                output.write(base64.b64decode(
+                    encoded[start:start + DECODE_CHUNK_SIZE], validate=True
+                ))
+        except (binascii.Error, ValueError):
+            output.close()
+            self.fail('invalid_base64')
+        output.seek(0)
+        return output
+
+
+def build_url(name, request):
+    url = default_storage.url(name)
+    if request is not None:
+        return request.build_absolute_uri(url)
+    return url
+
+
+def image_urls(name, ready, request):
+    """Ссылки на уменьшенные копии картинки или None, пока их нет."""
+    if not name or not ready:
+        return None
+    names = derivative_names(name)
+    return {
+        'thumbnail': build_url(names['thumbnail'], request),
+        'webp': {
+            width: build_url(name, request)
+            for width, name in names['webp'].items()
+        },
+    }
+
+
+class RecipeImagesField(serializers.Field):
+    """Ссылки на уменьшенные копии картинки или None, пока их нет."""
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        return image_urls(
+            recipe.image.name, recipe.image_derivatives_ready,
+            self.context.get('request')
+        )
+
 
 class Hex2NameColor(serializers.Field):
     """Поле для конвертации цвета в hex-формате."""
@@ -77,9 +150,24 @@ class IngredientInRecipeSerializer(serializers.ModelSerializer):
         return f'{self.ingredient} in {self.recipe}'
 
 
+def resolve_ids(queryset, ids):
+    """Объекты по списку id одним запросом, в порядке списка."""
+    objects = queryset.in_bulk(set(ids))
+    missing = [pk for pk in ids if pk not in objects]
+    if missing:
+        raise serializers.ValidationError(
+            f'Недопустимый первичный ключ "{missing[0]}" - '
+            f'объект не существует.'
+        )
+    return [objects[pk] for pk in ids]
+
+
 class AddIngredient(serializers.ModelSerializer):
-    """Добавление и редактирование ингредиентов """
-    id = serializers.PrimaryKeyRelatedField(queryset=Ingredients.objects.all())
+    """Добавление и редактирование ингредиентов.
+
+    id проверяется не здесь, а в рецепте, одним запросом на все.
+    """
+    id = serializers.IntegerField()
     amount = serializers.IntegerField()
 
     class Meta:
@@ -90,12 +178,25 @@ class AddIngredient(serializers.ModelSerializer):
 class AddUpdateRecipesSerializer(serializers.ModelSerializer):
     """Добавление и редактирование рецепта."""
 
-    tags = serializers.PrimaryKeyRelatedField(
-        many=True,
-        queryset=Tags.objects.all())
+    tags = serializers.ListField(child=serializers.IntegerField())
     ingredients = AddIngredient(many=True)
     image = Base64ImageField(required=False, allow_null=True, use_url=True)
 
+    def validate_tags(self, tags):
+        return resolve_ids(Tags.objects.all(), list(dict.fromkeys(tags)))
+
+    def validate_ingredients(self, ingredients):
+        ids = [item['id'] for item in ingredients]
+        if len(set(ids)) != len(ids):
+            raise serializers.ValidationError(
+                'В рецепте не может быть повторяющихся ингредиентов'
+            )
+        for item, ingredient in zip(
+            ingredients, resolve_ids(Ingredients.objects.all(), ids)
+        ):
+            item['id'] = ingredient
+        return ingredients
+
     def validate(self, data):
         """Валидация ингредиентов и тегов."""
         ingredients = data.get('ingredients')
@@ -103,44 +204,30 @@ class AddUpdateRecipesSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(
                 'Добавьте ингрелиенты в рецепт'
             )
-        unique_ingredients = []
         for item in ingredients:
-            name_ingredient = item.get('id')
+            name_ingredient = item['id']
             amount = item.get('amount')
 
             if not amount:
                 raise serializers.ValidationError(
                     f'Не указано количество для {name_ingredient}'
                 )
-            if int(amount) <= 0:
+            if amount <= 0:
                 raise serializers.ValidationError(
                     f'Не корректное количество для {name_ingredient}'
                 )
-            if not isinstance(amount, int):
-                raise serializers.ValidationError(
-                    'Количество ингредиентов должно быть целым числом'
-                )
-            if name_ingredient not in unique_ingredients:
-                unique_ingredients.append(name_ingredient)
-            else:
-                raise serializers.ValidationError(
-                    'В рецепте не может быть повторяющихся ингредиентов'
-                )
 
         tags = data.get('tags')
         if not tags:
             raise serializers.ValidationError(
                 'добавьте тег рецепта'
             )
-        if self.instance:
-            queryset = Recipes.objects.exclude(pk=self.instance.pk)
-        else:
-            queryset = Recipes.objects.all()
-        if queryset.filter(
-            name=data.get('name')
-        ).exists():
-            raise serializers.ValidationError(
-                'Рецепт уже существует.')
+        if 'name' in data:
+            queryset = Recipes.objects.filter(name=data['name'])
+            if self.instance:
+                queryset = queryset.exclude(pk=self.instance.pk)
+            if queryset.exists():
+                raise serializers.ValidationError('Рецепт уже существует.')
 
         return data
 
@@ -178,25 +265,101 @@ class AddUpdateRecipesSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
+        validated_data['image_derivatives_ready'] = False
         recipe = Recipes.objects.create(**validated_data)
         self.get_tags(recipe, tags)
         self.get_ingredients(recipe, ingredients)
+        write_documents([recipe_document(
+            recipe, [item['id'] for item in ingredients], tags
+        )])
         return recipe
 
+    def update_ingredients(self, recipe, ingredients):
+        """Пишет только изменения состава: вставки, новые количества
+        и удаления. Возвращает старые и новые количества по id."""
+        links = {
+            link.ingredient_id: link
+            for link in recipe.ingredientinrecipe.all()
+        }
+        old_amounts = {
+            ingredient_id: link.amount
+            for ingredient_id, link in links.items()
+        }
+        new_amounts = {item['id'].id: item['amount'] for item in ingredients}
+        removed = old_amounts.keys() - new_amounts.keys()
+        if removed:
+            IngredientInRecipe.objects.filter(
+                recipe=recipe, ingredient_id__in=removed
+            ).delete()
+        changed = []
+        for ingredient_id, amount in new_amounts.items():
+            link = links.get(ingredient_id)
+            if link is not None and link.amount != amount:
+                link.amount = amount
+                changed.append(link)
+        if changed:
+            IngredientInRecipe.objects.bulk_update(changed, ['amount'])
+        self.get_ingredients(recipe, [
+            item for item in ingredients
+            if item['id'].id not in old_amounts
+        ])
+        return old_amounts, new_amounts, bool(removed or changed or (
+            new_amounts.keys() - old_amounts.keys()
+        ))
+
+    def update_tags(self, recipe, tags):
+        old_ids = {tag.id for tag in recipe.tags.all()}
+        new_ids = {tag.id for tag in tags}
+        if old_ids - new_ids:
+            RecipeTags.objects.filter(
+                recipe=recipe, tag_id__in=old_ids - new_ids
+            ).delete()
+        self.get_tags(recipe, [tag for tag in tags if tag.id not in old_ids])
+        return old_ids != new_ids
+
     @transaction.atomic
     def update(self, instance, validated_data):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
-        IngredientInRecipe.objects.filter(recipe=instance).delete()
-        RecipeTags.objects.filter(recipe=instance).delete()
-        instance = super().update(instance, validated_data)
-        self.get_tags(instance, tags)
-        self.get_ingredients(instance, ingredients)
+        if 'image' in validated_data:
+            validated_data['image_derivatives_ready'] = False
+        old_amounts, new_amounts, ingredients_changed = (
+            self.update_ingredients(instance, ingredients)
+        )
+        tags_changed = self.update_tags(instance, tags)
+        if ingredients_changed or tags_changed:
+            validated_data['similar_outdated'] = True
+        changed_fields = [
+            field for field, value in validated_data.items()
+            if getattr(instance, field) != value
+        ]
+        if changed_fields:
+            for field in changed_fields:
+                setattr(instance, field, validated_data[field])
+            instance.save(update_fields=changed_fields)
+        elif ingredients_changed or tags_changed:
+            # bulk-операции не шлют сигналы, а save() не было.
+            bump_version('catalog')
+            bump_version('recipes')
+        if (ingredients_changed or tags_changed
+                or {'name', 'text'} & set(changed_fields)):
+            write_documents([recipe_document(
+                instance, [item['id'] for item in ingredients], tags
+            )])
+        if old_amounts != new_amounts:
+            CartIngredient.objects.apply_recipe_change(
+                instance, old_amounts, new_amounts
+            )
         return instance
 
     def to_representation(self, instance):
-        context = {'request': self.context.get('request')}
-        return RecipesListSerializer(instance, context=context).data
+        request = self.context.get('request')
+        instance = Recipes.objects.with_related().with_user_flags(
+            request.user
+        ).get(pk=instance.pk)
+        return RecipesListSerializer(
+            instance, context={'request': request}
+        ).data
 
     class Meta:
         model = Recipes
@@ -210,18 +373,21 @@ class AddUpdateRecipesSerializer(serializers.ModelSerializer):
         )
 
 
-class RecipesListSerializer(serializers.ModelSerializer):
+class RecipesListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Получение рецептов: GET, RETRIEVE """
 
     tags = TagsSerializer(read_only=True, many=True)
     author = UserSerializer(read_only=True)
     image = Base64ImageField(required=False, allow_null=True, use_url=True)
+    images = RecipeImagesField()
     ingredients = IngredientInRecipeSerializer(read_only=True, many=True,
                                                source='ingredientinrecipe')
     is_favorited = serializers.SerializerMethodField(read_only=True)
     is_in_shopping_cart = serializers.SerializerMethodField(read_only=True)
 
     def get_is_favorited(self, object):
+        if hasattr(object, 'is_favorited'):
+            return object.is_favorited
         user = self.context.get('request').user
         return (
             not user.is_anonymous
@@ -229,6 +395,8 @@ class RecipesListSerializer(serializers.ModelSerializer):
         )
 
     def get_is_in_shopping_cart(self, object):
+        if hasattr(object, 'is_in_shopping_cart'):
+            return object.is_in_shopping_cart
         user = self.context.get('request').user
         return (
             not user.is_anonymous
@@ -246,6 +414,7 @@ class RecipesListSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'images',
             'text',
             'cooking_time',
         )
@@ -253,7 +422,17 @@ class RecipesListSerializer(serializers.ModelSerializer):
 
 class ShortRecipeSerializer(serializers.ModelSerializer):
     """Отображает краткую информацию о рецепте."""
+    images = RecipeImagesField()
 
     class Meta:
         model = Recipes
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'images', 'cooking_time')
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    """Список id рецептов для пакетных операций."""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=RECIPE_BATCH_LIMIT
+    )
@@ -1,3 +1,5 @@
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
 from django.forms import ValidationError
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from recipes.models import Recipes, Subscriptions
@@ -5,6 +7,51 @@ from rest_framework import serializers
 from users.models import User
 
 from . import serializers_recipes
+from .mixins import SparseFieldsMixin
+
+
+def get_recipes_limit(request):
+    """recipes_limit из запроса; recipe_limit - старое написание."""
+    value = request.query_params.get(
+        'recipes_limit', request.query_params.get('recipe_limit')
+    )
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return None
+    return value if value >= 0 else None
+
+
+def get_authors_recipes(author_ids, recipes_limit=None):
+    """Последние рецепты для набора авторов.
+
+    Рецепты берутся одним запросом с ROW_NUMBER() по автору.
+    """
+    if not author_ids:
+        # IN () не компилируется в SQL: Django бросает EmptyResultSet.
+        return {'authors_recipes': {}}
+    queryset = Recipes.objects.filter(author_id__in=author_ids).only(
+        'id', 'name', 'image', 'image_derivatives_ready', 'cooking_time',
+        'author_id', 'pub_date'
+    )
+    if recipes_limit is None:
+        recipes = queryset
+    else:
+        ranked = queryset.annotate(row_number=Window(
+            expression=RowNumber(),
+            partition_by=[F('author_id')],
+            order_by=[F('pub_date').desc(), F('id').desc()],
+        ))
+        sql, params = ranked.query.sql_with_params()
+        recipes = Recipes.objects.raw(
+            f'SELECT * FROM ({sql}) ranked WHERE row_number <= %s '
+            f'ORDER BY pub_date DESC, id DESC',
+            (*params, recipes_limit)
+        )
+    authors_recipes = {author_id: [] for author_id in author_ids}
+    for recipe in recipes:
+        authors_recipes[recipe.author_id].append(recipe)
+    return {'authors_recipes': authors_recipes}
 
 
 class MyUserCreateSerializer(UserCreateSerializer):
@@ -42,12 +89,14 @@ class MyUserCreateSerializer(UserCreateSerializer):
         return lower_username
 
 
-class MyUserSerializer(UserSerializer):
+class MyUserSerializer(SparseFieldsMixin, UserSerializer):
     """сериализатор для получения юзера и подписок"""
 
     is_subscribed = serializers.SerializerMethodField()
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request = self.context.get('request')
         if not request:
             return False
@@ -73,6 +122,9 @@ class SubscribeSerializer(serializers.ModelSerializer):
     def to_representation(self, instance):
         request = self.context.get('request')
         context = {'request': request}
+        context.update(get_authors_recipes(
+            [instance.author_id], get_recipes_limit(request)
+        ))
         serializer = SubscriptionSerializer(
             instance,
             context=context
@@ -97,9 +149,12 @@ class SubscribeSerializer(serializers.ModelSerializer):
         fields = ('user', 'author')
 
 
-class SubscriptionSerializer(serializers.ModelSerializer):
+class SubscriptionSerializer(SparseFieldsMixin,
+                             serializers.ModelSerializer):
     """сериализатор получения подписок и полных данных об авторе рецепта.
-    В выдачу добавляются рецепты"""
+    В выдачу добавляются рецепты. Рецепты берутся из контекста
+    (authors_recipes), см. get_authors_recipes.
+    """
     email = serializers.ReadOnlyField(source='author.email')
     id = serializers.ReadOnlyField(source='author.id')
     username = serializers.ReadOnlyField(source='author.username')
@@ -115,27 +170,21 @@ class SubscriptionSerializer(serializers.ModelSerializer):
 
     def get_is_subscribed(self, obj):
         request = self.context.get('request')
+        if obj.user_id == request.user.id:
+            return True
         return Subscriptions.objects.filter(
             author=obj.author, user=request.user
         ).exists()
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        if request.GET.get('recipe_limit'):
-            recipe_limit = int(request.GET.get('recipe_limit'))
-            queryset = Recipes.objects.filter(
-                author=obj.author)[:recipe_limit]
-        else:
-            queryset = Recipes.objects.filter(
-                author=obj.author)
-
         serializer = serializers_recipes.ShortRecipeSerializer(
-            queryset, read_only=True, many=True
+            self.context['authors_recipes'][obj.author_id],
+            read_only=True, many=True
         )
         return serializer.data
 
     def get_recipes_count(self, obj):
-        return obj.author.recipes.count()
+        return obj.author.recipes_count
 
     class Meta:
         model = Subscriptions
@@ -0,0 +1,112 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from recipes.models import (Favorite, IngredientInRecipe, Ingredients, Recipes,
+                            RecipeTags, ShoppingCart, Subscriptions, Tags)
+from recipes.search import index_recipes, unindex_recipes
+from recipes.signals import data_changed
+from rest_framework.authtoken.models import Token
+from users.models import User
+
+from .authentication import token_cache
+from .search import ingredient_index
+from .versions import bump_version
+
+
+@receiver((post_save, post_delete), sender=Ingredients)
+def invalidate_ingredient_index(**kwargs):
+    bump_version('ingredients')
+    bump_version('catalog')
+    transaction.on_commit(ingredient_index.invalidate)
+
+
+@receiver((post_save, post_delete), sender=Tags)
+def bump_tags_version(**kwargs):
+    bump_version('tags')
+    bump_version('catalog')
+
+
+@receiver((post_save, post_delete), sender=Recipes)
+@receiver((post_save, post_delete), sender=RecipeTags)
+@receiver((post_save, post_delete), sender=IngredientInRecipe)
+def bump_catalog_version(**kwargs):
+    """Сбрасывает кеш страниц рецептов для анонимов."""
+    bump_version('catalog')
+
+
+# Поля автора, которые выводятся в карточках рецептов.
+CATALOG_USER_FIELDS = ('username', 'first_name', 'last_name', 'email')
+
+
+@receiver(pre_save, sender=User)
+def remember_catalog_fields(instance, update_fields=None, **kwargs):
+    instance._catalog_fields = None
+    if instance.pk is None or (
+        update_fields and not set(update_fields) & set(CATALOG_USER_FIELDS)
+    ):
+        return
+    instance._catalog_fields = User.objects.filter(
+        pk=instance.pk
+    ).values_list(*CATALOG_USER_FIELDS).first()
+
+
+@receiver(post_save, sender=User)
+def bump_catalog_version_on_user_change(instance, **kwargs):
+    """Новый юзер без рецептов, а рецепты удалённого уходят каскадом
+    со своими сигналами: каталог меняют только поля автора."""
+    stored = getattr(instance, '_catalog_fields', None)
+    if stored is not None and stored != tuple(
+        getattr(instance, field) for field in CATALOG_USER_FIELDS
+    ):
+        bump_version('catalog')
+
+
+@receiver((post_save, post_delete), sender=Recipes)
+@receiver((post_save, post_delete), sender=RecipeTags)
+@receiver((post_save, post_delete), sender=IngredientInRecipe)
+@receiver((post_save, post_delete), sender=Favorite)
+@receiver((post_save, post_delete), sender=ShoppingCart)
+@receiver((post_save, post_delete), sender=Subscriptions)
+def bump_recipes_version(**kwargs):
+    bump_version('recipes')
+
+
+@receiver(data_changed)
+def bump_changed_versions(names, **kwargs):
+    """Изменения командами управления в обход сигналов моделей."""
+    for name in names:
+        bump_version(name)
+
+
+@receiver(post_save, sender=Ingredients)
+def reindex_ingredient_recipes(instance, created, **kwargs):
+    if not created:
+        index_recipes(IngredientInRecipe.objects.filter(
+            ingredient=instance
+        ).values_list('recipe_id', flat=True))
+
+
+@receiver(post_save, sender=Tags)
+def reindex_tag_recipes(instance, created, **kwargs):
+    if not created:
+        index_recipes(RecipeTags.objects.filter(
+            tag=instance
+        ).values_list('recipe_id', flat=True))
+
+
+@receiver(post_delete, sender=Recipes)
+def unindex_recipe(instance, **kwargs):
+    unindex_recipes([instance.id])
+
+
+@receiver(post_delete, sender=Token)
+def forget_token(instance, **kwargs):
+    token_cache.delete(instance.key)
+
+
+@receiver((post_save, post_delete), sender=User)
+def forget_user_tokens(instance, update_fields=None, **kwargs):
+    """Юзер в кеше токенов не должен пережить изменение или блокировку."""
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    token_cache.forget_user(instance.pk)
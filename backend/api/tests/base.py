@@ -0,0 +1,33 @@
+from django.core.cache import caches
+from django.test import TestCase
+from rest_framework.test import APIClient
+from users.models import User
+
+from ..authentication import token_cache
+from ..search import ingredient_index
+
+PASSWORD = 'pass12345!'
+
+
+def clear_caches():
+    """Сбрасывает кеши Django и процессные кеши api."""
+    for cache in caches.all():
+        cache.clear()
+    ingredient_index.invalidate()
+    token_cache.clear()
+
+
+class FoodgramTestCase(TestCase):
+    """Общая база тестов api: пустые кеши и свежий клиент в каждом тесте."""
+
+    @classmethod
+    def create_user(cls, username, **fields):
+        fields = {
+            'email': f'{username}@foodgram.ru', 'first_name': 'Имя',
+            'last_name': 'Фамилия', 'password': PASSWORD, **fields
+        }
+        return User.objects.create_user(username=username, **fields)
+
+    def setUp(self):
+        clear_caches()
+        self.client = APIClient()
@@ -0,0 +1,130 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase
+from recipes.models import Ingredients
+
+ROWS = [
+    ('мука', 'г'), ('соль', 'г'), ('мука', 'г'), (' яйца ', 'шт'),
+    ('мука', 'кг'),
+]
+
+
+class AddIngredientsTest(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def make_file(self, extension, rows):
+        path = os.path.join(self.directory, f'ingredients{extension}')
+        with open(path, 'w', encoding='utf-8') as f:
+            if extension == '.json':
+                json.dump([
+                    {'name': name, 'measurement_unit': unit}
+                    for name, unit in rows
+                ], f, ensure_ascii=False)
+            else:
+                f.writelines(f'{name},{unit}\n' for name, unit in rows)
+        return path
+
+    def load(self, path, **options):
+        stdout = StringIO()
+        call_command('add-ingredients', path, stdout=stdout, **options)
+        return stdout.getvalue().strip()
+
+    def stored(self):
+        return set(Ingredients.objects.values_list('name', 'measurement_unit'))
+
+    def test_load_and_reload(self):
+        for extension in ('.csv', '.json'):
+            with self.subTest(extension=extension):
+                Ingredients.objects.all().delete()
+                path = self.make_file(extension, ROWS)
+                self.assertEqual(self.load(path, batch_size=2), (
+                    'строк 5, добавлено 4, уже были в базе 0, '
+                    'повторов в файле 1'
+                ))
+                self.assertEqual(self.stored(), {
+                    ('мука', 'г'), ('соль', 'г'), ('яйца', 'шт'),
+                    ('мука', 'кг'),
+                })
+                self.assertEqual(self.load(path), (
+                    'строк 5, добавлено 0, уже были в базе 4, '
+                    'повторов в файле 1'
+                ))
+                self.assertEqual(Ingredients.objects.count(), 4)
+
+    def test_dry_run(self):
+        Ingredients.objects.create(name='соль', measurement_unit='г')
+        path = self.make_file('.csv', ROWS)
+        self.assertEqual(self.load(path, dry_run=True), (
+            'Dry run: строк 5, добавлено 3, уже были в базе 1, '
+            'повторов в файле 1'
+        ))
+        self.assertEqual(self.stored(), {('соль', 'г')})
+
+    def test_unsupported_format(self):
+        with self.assertRaises(CommandError):
+            self.load(self.make_file('.txt', ROWS))
+
+
+class MergeDuplicatesMigrationTest(TransactionTestCase):
+    before = [('recipes', '0005_counters'), ('users', '0003_counters')]
+    after = [('recipes', '0006_unique_ingredient_unit'),
+             ('users', '0003_counters')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_duplicates_merged(self):
+        apps = self.migrate(self.before)
+        ingredient_model = apps.get_model('recipes', 'Ingredients')
+        recipe_model = apps.get_model('recipes', 'Recipes')
+        link_model = apps.get_model('recipes', 'IngredientInRecipe')
+        user_model = apps.get_model('users', 'User')
+        author = user_model.objects.create(
+            email='author@foodgram.ru', username='author',
+            first_name='Имя', last_name='Фамилия'
+        )
+        keep, duplicate, other = (
+            ingredient_model.objects.create(name=name, measurement_unit='г')
+            for name in ('мука', 'мука', 'соль')
+        )
+        both, only_duplicate = (
+            recipe_model.objects.create(
+                author=author, name=name, text='описание', cooking_time=5
+            )
+            for name in ('оба', 'дубль')
+        )
+        link_model.objects.create(recipe=both, ingredient=keep, amount=100)
+        link_model.objects.create(recipe=both, ingredient=duplicate, amount=50)
+        link_model.objects.create(
+            recipe=only_duplicate, ingredient=duplicate, amount=30
+        )
+
+        apps = self.migrate(self.after)
+        ingredient_model = apps.get_model('recipes', 'Ingredients')
+        link_model = apps.get_model('recipes', 'IngredientInRecipe')
+        self.assertEqual(
+            sorted(ingredient_model.objects.values_list('id', flat=True)),
+            [keep.id, other.id]
+        )
+        self.assertEqual(sorted(link_model.objects.values_list(
+            'recipe_id', 'ingredient_id', 'amount'
+        )), sorted([
+            (both.id, keep.id, 150), (only_duplicate.id, keep.id, 30),
+        ]))
@@ -0,0 +1,80 @@
+from recipes.models import FeedItem, Ingredients, Subscriptions, Tags
+from rest_framework.authtoken.models import Token
+from users.models import User
+
+from ..authentication import shared_key, token_cache
+from ..caching import shared_cache
+from .base import PASSWORD, FoodgramTestCase
+
+
+class TokenCacheTest(FoodgramTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = cls.create_user('author')
+        cls.follower = cls.create_user('follower')
+        Subscriptions.objects.create(user=cls.follower, author=cls.author)
+        cls.token = Token.objects.create(user=cls.author)
+        cls.tag = Tags.objects.create(
+            name='Завтрак', slug='breakfast', color='#E26C2D'
+        )
+        cls.ingredient = Ingredients.objects.create(
+            name='мука', measurement_unit='г'
+        )
+
+    def setUp(self):
+        super().setUp()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def create_recipe(self):
+        response = self.client.post('/api/recipes/', {
+            'name': f'рецепт {FeedItem.objects.count()}',
+            'text': 'описание',
+            'cooking_time': 15,
+            'tags': [self.tag.id],
+            'ingredients': [{'id': self.ingredient.id, 'amount': 10}],
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.json()['id']
+
+    def feed_size(self):
+        return FeedItem.objects.filter(user=self.follower).count()
+
+    def test_cached_user_is_a_copy(self):
+        self.client.get('/api/users/me/')
+        user, token = token_cache.get(self.token.key)
+        user.first_name = 'Изменено'
+        cached, token = token_cache.get(self.token.key)
+        self.assertEqual(cached.first_name, 'Имя')
+        self.assertIsNot(cached, user)
+
+    def test_shared_entry_has_no_secrets(self):
+        self.client.get('/api/users/me/')
+        stored = repr(shared_cache.get(shared_key(self.token.key)))
+        self.assertIn('author@foodgram.ru', stored)
+        self.assertNotIn(self.token.key, stored)
+        self.assertNotIn(self.author.password, stored)
+        token_cache.local.clear()
+        user, token = token_cache.get(self.token.key)
+        self.assertEqual(user.pk, self.author.pk)
+        self.assertEqual(token.key, self.token.key)
+        self.assertIn('password', user.get_deferred_fields())
+        self.assertTrue(user.check_password(PASSWORD))
+
+    def test_fan_out_reads_flag_from_database(self):
+        self.create_recipe()
+        self.assertEqual(self.feed_size(), 1)
+        # Автор в кеше токенов не знает о смене флага.
+        User.objects.filter(pk=self.author.pk).update(
+            feed_fanout_on_read=True
+        )
+        user, token = token_cache.get(self.token.key)
+        self.assertFalse(user.feed_fanout_on_read)
+        self.create_recipe()
+        self.assertEqual(self.feed_size(), 1)
+
+    def test_forget_user(self):
+        self.client.get('/api/users/me/')
+        self.assertIsNotNone(token_cache.get(self.token.key))
+        token_cache.forget_user(self.author.pk)
+        self.assertIsNone(token_cache.get(self.token.key))
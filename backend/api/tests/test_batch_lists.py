@@ -0,0 +1,125 @@
+from recipes.models import (CartIngredient, Favorite, IngredientInRecipe,
+                            Ingredients, Recipes, ShoppingCart)
+
+from ..serializers.serializers_recipes import RECIPE_BATCH_LIMIT
+from .base import FoodgramTestCase
+
+URLS = {
+    Favorite: '/api/recipes/favorite/',
+    ShoppingCart: '/api/recipes/shopping_cart/',
+}
+
+
+class BatchListsTest(FoodgramTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = cls.create_user('viewer')
+        cls.flour = Ingredients.objects.create(
+            name='мука', measurement_unit='г'
+        )
+        cls.recipes = [
+            Recipes.objects.create(
+                author=cls.user, name=f'рецепт {index}', text='описание',
+                cooking_time=5
+            )
+            for index in range(3)
+        ]
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(recipe=recipe, ingredient=cls.flour,
+                               amount=100 * (index + 1))
+            for index, recipe in enumerate(cls.recipes)
+        )
+        cls.ids = [recipe.id for recipe in cls.recipes]
+        cls.missing = max(cls.ids) + 100
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+
+    def batch(self, model, method, ids, status=200):
+        response = getattr(self.client, method)(
+            URLS[model], {'ids': ids}, format='json'
+        )
+        self.assertEqual(response.status_code, status, response.content)
+        data = response.json()
+        if status != 200:
+            return data
+        return [(row['id'], row['status']) for row in data['results']]
+
+    def counters(self, model):
+        return list(Recipes.objects.filter(pk__in=self.ids).order_by(
+            'id'
+        ).values_list(model.counter_field, flat=True))
+
+    def cart_amount(self):
+        return sum(CartIngredient.objects.filter(
+            user=self.user, ingredient=self.flour
+        ).values_list('amount', flat=True))
+
+    def test_add_and_remove(self):
+        first, second, third = self.ids
+        for model in URLS:
+            with self.subTest(model=model.__name__):
+                self.assertEqual(
+                    self.batch(model, 'post', [first, self.missing, first]),
+                    [(first, 'added'), (self.missing, 'not_found')]
+                )
+                self.assertEqual(self.batch(model, 'post', self.ids), [
+                    (first, 'already_added'), (second, 'added'),
+                    (third, 'added'),
+                ])
+                self.assertEqual(self.counters(model), [1, 1, 1])
+                self.assertEqual(
+                    model.objects.filter(user=self.user).count(), 3
+                )
+
+                self.assertEqual(
+                    self.batch(model, 'delete', [second, self.missing]),
+                    [(second, 'removed'), (self.missing, 'not_in_list')]
+                )
+                self.assertEqual(
+                    self.batch(model, 'delete', [second]),
+                    [(second, 'not_in_list')]
+                )
+                self.assertEqual(self.counters(model), [1, 0, 1])
+
+    def test_cart_totals(self):
+        first, second, third = self.ids
+        self.batch(ShoppingCart, 'post', [first, second])
+        self.assertEqual(self.cart_amount(), 300)
+        self.batch(ShoppingCart, 'post', self.ids)
+        self.assertEqual(self.cart_amount(), 600)
+        self.batch(ShoppingCart, 'delete', [first, third])
+        self.assertEqual(self.cart_amount(), 200)
+        self.batch(ShoppingCart, 'delete', self.ids)
+        self.assertFalse(CartIngredient.objects.filter(user=self.user))
+
+    def test_invalid_ids(self):
+        for ids in ([], [0], list(range(1, RECIPE_BATCH_LIMIT + 2))):
+            errors = self.batch(Favorite, 'post', ids, status=400)
+            self.assertIn('ids', errors)
+        self.assertFalse(Favorite.objects.exists())
+
+    def test_anonymous(self):
+        self.client.force_authenticate(None)
+        self.batch(Favorite, 'post', self.ids, status=401)
+
+    def test_manager_reports_actual_writes(self):
+        first, second, third = self.ids
+        # Строку уже вставил параллельный запрос.
+        ShoppingCart.objects.bulk_create(
+            [ShoppingCart(user=self.user, recipe_id=first)]
+        )
+        self.assertEqual(
+            ShoppingCart.objects.add(self.user, [first, second]), [second]
+        )
+        self.assertEqual(self.counters(ShoppingCart), [0, 1, 0])
+        self.assertEqual(self.cart_amount(), 200)
+        self.assertEqual(
+            ShoppingCart.objects.remove(self.user, [second, third]), {second}
+        )
+        self.assertEqual(ShoppingCart.objects.remove(self.user, [second]),
+                         set())
+        self.assertEqual(self.counters(ShoppingCart), [0, 0, 0])
+        self.assertEqual(self.cart_amount(), 0)
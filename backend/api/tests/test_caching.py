@@ -0,0 +1,46 @@
+from django.test import SimpleTestCase, override_settings
+from recipes.models import Recipes
+
+from ..checks import check_shared_cache
+from .base import FoodgramTestCase
+
+FILE_CACHE = 'django.core.cache.backends.filebased.FileBasedCache'
+
+
+class AnonymousPageCacheTest(FoodgramTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = cls.create_user('author')
+        Recipes.objects.create(
+            author=author, name='рецепт', text='описание', cooking_time=5,
+            image='recipes/images/cake.jpg'
+        )
+
+    def image(self, **headers):
+        response = self.client.get('/api/recipes/', **headers)
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results'][0]['image']
+
+    def test_page_key_includes_host_and_scheme(self):
+        self.assertTrue(self.image().startswith('http://testserver/'))
+        self.assertTrue(self.image(HTTP_HOST='cdn.foodgram.ru').startswith(
+            'http://cdn.foodgram.ru/'
+        ))
+        self.assertTrue(self.image(
+            HTTP_HOST='cdn.foodgram.ru', secure=True
+        ).startswith('https://cdn.foodgram.ru/'))
+        self.assertTrue(self.image().startswith('http://testserver/'))
+
+
+class SharedCacheCheckTest(SimpleTestCase):
+
+    def test_non_atomic_backend_warns(self):
+        with override_settings(CACHES={'shared': {'BACKEND': FILE_CACHE}}):
+            self.assertEqual(
+                [error.id for error in check_shared_cache(None)], ['api.W001']
+            )
+        with override_settings(CACHES={'shared': {
+            'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache'
+        }}):
+            self.assertEqual(check_shared_cache(None), [])
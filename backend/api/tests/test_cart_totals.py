@@ -0,0 +1,237 @@
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from recipes.models import (CartIngredient, IngredientInRecipe, Ingredients,
+                            Recipes, ShoppingCart)
+from users.models import User
+
+from .base import FoodgramTestCase
+
+
+class CartTotalsTestCase(FoodgramTestCase):
+    """Два рецепта с пересекающимся составом и шесть юзеров."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ingredients = Ingredients.objects.bulk_create(
+            Ingredients(name=f'ингредиент {i}', measurement_unit='г')
+            for i in range(4)
+        )
+        cls.ingredients = list(Ingredients.objects.order_by('id'))
+        cls.author = cls.create_user('author')
+        cls.users = [cls.create_user(f'user{number}') for number in range(6)]
+        cls.recipes = []
+        for index in range(2):
+            recipe = Recipes.objects.create(
+                author=cls.author, name=f'рецепт {index}', text='описание',
+                cooking_time=10, image=''
+            )
+            IngredientInRecipe.objects.bulk_create(
+                IngredientInRecipe(
+                    recipe=recipe, ingredient=ingredient,
+                    amount=10 * (index + 1) + number
+                )
+                for number, ingredient in enumerate(
+                    cls.ingredients[index:index + 3]
+                )
+            )
+            cls.recipes.append(recipe)
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.author)
+
+    def add_to_carts(self, recipe, users):
+        for user in users:
+            ShoppingCart.objects.create(user=user, recipe=recipe)
+            CartIngredient.objects.add_recipes(user, [recipe.id])
+
+    def stored(self):
+        return {
+            (row.user_id, row.ingredient_id): row.amount
+            for row in CartIngredient.objects.all()
+        }
+
+    def live(self):
+        return {
+            (row['user_id'], row['ingredient_id']): row['total']
+            for row in CartIngredient.objects.live_totals()
+        }
+
+    def check_totals(self, **options):
+        out = StringIO()
+        call_command('rebuild-cart-totals', '--check', stdout=out, **options)
+        return out.getvalue()
+
+
+class CartTotalsTest(CartTotalsTestCase):
+    """Сводная таблица списков покупок совпадает с агрегацией."""
+
+    def delete_recipe(self, recipe):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.delete(f'/api/recipes/{recipe.id}/')
+        self.assertEqual(response.status_code, 204)
+        return len(context.captured_queries)
+
+    def test_destroy_updates_every_cart(self):
+        first, second = self.recipes
+        self.add_to_carts(first, self.users)
+        self.add_to_carts(second, self.users[:3])
+        self.delete_recipe(first)
+        self.assertEqual(self.stored(), self.live())
+        self.assertEqual(
+            {user_id for user_id, ingredient_id in self.stored()},
+            {user.id for user in self.users[:3]}
+        )
+        self.check_totals()
+
+    def test_destroy_queries_do_not_grow_with_carts(self):
+        first, second = self.recipes
+        self.add_to_carts(first, self.users[:1])
+        self.add_to_carts(second, self.users)
+        queries = self.delete_recipe(first)
+        self.assertEqual(self.delete_recipe(second), queries)
+
+    def test_check_reports_mismatches(self):
+        self.add_to_carts(self.recipes[0], self.users[:2])
+        self.assertIn('Расхождений нет', self.check_totals())
+        changed = CartIngredient.objects.filter(user=self.users[0]).first()
+        CartIngredient.objects.filter(pk=changed.pk).update(amount=1)
+        CartIngredient.objects.create(
+            user=self.users[1], ingredient=self.ingredients[3], amount=5
+        )
+        with self.assertRaisesMessage(CommandError, 'Расхождений: 2'):
+            self.check_totals()
+        with self.assertRaisesMessage(CommandError, 'Расхождений: 1'):
+            self.check_totals(user=self.users[0].id)
+
+    def test_rebuild(self):
+        self.add_to_carts(self.recipes[0], self.users[:2])
+        self.add_to_carts(self.recipes[1], self.users[1:3])
+        expected = self.live()
+        CartIngredient.objects.filter(user=self.users[0]).delete()
+        CartIngredient.objects.filter(user=self.users[1]).update(amount=1)
+        call_command(
+            'rebuild-cart-totals', user=self.users[0].id, stdout=StringIO()
+        )
+        self.assertEqual(
+            {
+                key: amount for key, amount in self.stored().items()
+                if key[0] == self.users[0].id
+            },
+            {
+                key: amount for key, amount in expected.items()
+                if key[0] == self.users[0].id
+            }
+        )
+        self.assertNotEqual(self.stored(), expected)
+        call_command('rebuild-cart-totals', stdout=StringIO())
+        self.assertEqual(self.stored(), expected)
+        self.check_totals()
+
+
+class CartTotalsOutsideApiTest(CartTotalsTestCase):
+    """Сводная таблица следует за правками из админки и каскадами."""
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.create_user(
+            'admin', is_staff=True, is_superuser=True
+        ))
+
+    def admin_post(self, url, data):
+        response = self.client.post(f'/admin/recipes/{url}', data)
+        self.assertEqual(response.status_code, 302, response.content)
+
+    def assert_totals(self):
+        self.assertEqual(self.stored(), self.live())
+
+    def test_admin_cart_rows(self):
+        first, second = self.recipes
+        for user in self.users[:3]:
+            self.admin_post('shoppingcart/add/', {
+                'user': user.id, 'recipe': first.id
+            })
+        self.admin_post('shoppingcart/add/', {
+            'user': self.users[0].id, 'recipe': second.id
+        })
+        self.assert_totals()
+        first.refresh_from_db()
+        self.assertEqual(first.in_carts_count, 3)
+
+        row = ShoppingCart.objects.get(user=self.users[0], recipe=second)
+        self.admin_post(f'shoppingcart/{row.pk}/delete/', {'post': 'yes'})
+        self.assert_totals()
+        self.admin_post('shoppingcart/', {
+            'action': 'delete_selected', 'post': 'yes',
+            '_selected_action': list(ShoppingCart.objects.filter(
+                user__in=self.users[:2]
+            ).values_list('pk', flat=True)),
+        })
+        self.assert_totals()
+        first.refresh_from_db()
+        self.assertEqual(first.in_carts_count, 1)
+
+    def test_admin_ingredient_edits(self):
+        first, second = self.recipes
+        self.add_to_carts(first, self.users[:2])
+        link = first.ingredientinrecipe.first()
+        self.admin_post(f'ingredientinrecipe/{link.pk}/change/', {
+            'recipe': first.id, 'ingredient': link.ingredient_id,
+            'amount': 99,
+        })
+        self.assert_totals()
+        # Ингредиент перенесён в другой рецепт.
+        self.admin_post(f'ingredientinrecipe/{link.pk}/change/', {
+            'recipe': second.id, 'ingredient': link.ingredient_id,
+            'amount': 5,
+        })
+        self.assert_totals()
+        link = first.ingredientinrecipe.first()
+        self.admin_post(f'ingredientinrecipe/{link.pk}/delete/', {
+            'post': 'yes'
+        })
+        self.assert_totals()
+
+    def test_admin_recipe_inline(self):
+        first, second = self.recipes
+        self.add_to_carts(first, self.users[:2])
+        links = list(first.ingredientinrecipe.order_by('id'))
+        data = {
+            'author': self.author.id, 'name': first.name, 'text': 'описание',
+            'cooking_time': 10, 'favorites_count': 0, 'in_carts_count': 2,
+            'ingredientinrecipe-TOTAL_FORMS': len(links) + 1,
+            'ingredientinrecipe-INITIAL_FORMS': len(links),
+            'recipe_tags-TOTAL_FORMS': 0, 'recipe_tags-INITIAL_FORMS': 0,
+            'recipe_tags-MIN_NUM_FORMS': 0,
+        }
+        for index, link in enumerate(links):
+            prefix = f'ingredientinrecipe-{index}-'
+            data.update({
+                prefix + 'id': link.pk, prefix + 'recipe': first.id,
+                prefix + 'ingredient': link.ingredient_id,
+                prefix + 'amount': link.amount + 1,
+            })
+        data['ingredientinrecipe-0-DELETE'] = 'on'
+        prefix = f'ingredientinrecipe-{len(links)}-'
+        data.update({
+            prefix + 'recipe': first.id,
+            prefix + 'ingredient': self.ingredients[3].id,
+            prefix + 'amount': 7,
+        })
+        self.admin_post(f'recipes/{first.id}/change/', data)
+        self.assertEqual(first.ingredientinrecipe.count(), len(links))
+        self.assert_totals()
+
+    def test_delete_outside_api(self):
+        first, second = self.recipes
+        self.add_to_carts(first, self.users)
+        self.add_to_carts(second, self.users[:2])
+        Recipes.objects.get(pk=first.pk).delete()
+        self.assert_totals()
+        # Рецепты удаляются каскадом вместе с автором.
+        User.objects.get(pk=self.author.pk).delete()
+        self.assertEqual(self.stored(), {})
+        self.check_totals()
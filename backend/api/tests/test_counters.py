@@ -0,0 +1,86 @@
+from recipes.models import Favorite, Recipes, ShoppingCart, Subscriptions
+from users.models import User
+
+from .base import FoodgramTestCase
+
+
+class CountersOutsideApiTest(FoodgramTestCase):
+    """Счётчики следуют за строками, записанными мимо API."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = cls.create_user('author')
+        cls.other = cls.create_user('other')
+        cls.follower = cls.create_user('follower')
+        cls.admin = cls.create_user('admin', is_staff=True, is_superuser=True)
+        cls.recipe = Recipes.objects.create(
+            author=cls.author, name='рецепт', text='описание',
+            cooking_time=10, image=''
+        )
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.admin)
+
+    def admin_post(self, url, data):
+        response = self.client.post(f'/admin/{url}', data)
+        self.assertEqual(response.status_code, 302, response.content)
+
+    def counters(self, user):
+        user = User.objects.get(pk=user.pk)
+        return user.recipes_count, user.followers_count
+
+    def test_recipes_count(self):
+        self.assertEqual(self.counters(self.author), (1, 0))
+        recipe = Recipes.objects.create(
+            author=self.author, name='второй', text='описание',
+            cooking_time=5, image=''
+        )
+        self.assertEqual(self.counters(self.author), (2, 0))
+        recipe.author = self.other
+        recipe.save()
+        self.assertEqual(self.counters(self.author), (1, 0))
+        self.assertEqual(self.counters(self.other), (1, 0))
+        recipe.name = 'переименован'
+        recipe.save()
+        self.assertEqual(self.counters(self.other), (1, 0))
+        self.admin_post(f'recipes/recipes/{recipe.pk}/delete/', {
+            'post': 'yes'
+        })
+        self.assertEqual(self.counters(self.other), (0, 0))
+
+    def test_followers_count(self):
+        self.admin_post('recipes/subscriptions/add/', {
+            'user': self.follower.id, 'author': self.author.id
+        })
+        Subscriptions.objects.create(user=self.other, author=self.author)
+        self.assertEqual(self.counters(self.author), (1, 2))
+        row = Subscriptions.objects.get(user=self.follower)
+        self.admin_post(f'recipes/subscriptions/{row.pk}/change/', {
+            'user': self.follower.id, 'author': self.other.id
+        })
+        self.assertEqual(self.counters(self.author), (1, 1))
+        self.assertEqual(self.counters(self.other), (0, 1))
+        User.objects.get(pk=self.follower.pk).delete()
+        self.assertEqual(self.counters(self.other), (0, 0))
+        self.assertEqual(self.counters(self.author), (1, 1))
+
+    def test_user_lists(self):
+        for model in (Favorite, ShoppingCart):
+            self.admin_post(f'recipes/{model._meta.model_name}/add/', {
+                'user': self.follower.id, 'recipe': self.recipe.id
+            })
+            model.objects.add(self.other, [self.recipe.id])
+        recipe = Recipes.objects.get(pk=self.recipe.pk)
+        self.assertEqual(
+            (recipe.favorites_count, recipe.in_carts_count), (2, 2)
+        )
+        row = Favorite.objects.get(user=self.other)
+        self.admin_post(f'recipes/favorite/{row.pk}/delete/', {
+            'post': 'yes'
+        })
+        User.objects.get(pk=self.follower.pk).delete()
+        recipe = Recipes.objects.get(pk=self.recipe.pk)
+        self.assertEqual(
+            (recipe.favorites_count, recipe.in_carts_count), (0, 1)
+        )
@@ -0,0 +1,96 @@
+import csv
+import re
+from io import StringIO
+
+from django.test import override_settings
+from recipes.models import CartIngredient, Ingredients
+
+from .. import utils
+from .base import FoodgramTestCase
+
+URL = '/api/recipes/download_shopping_cart/'
+
+
+class ShoppingListExportTest(FoodgramTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = cls.create_user(
+            'viewer', first_name='Иван', last_name='Иванов'
+        )
+        ingredients = Ingredients.objects.bulk_create(
+            Ingredients(name=name, measurement_unit=unit)
+            for name, unit in (('яйца', 'шт'), ('мука', 'г'), ('соль', 'г'))
+        )
+        ingredients = Ingredients.objects.order_by('id')
+        CartIngredient.objects.bulk_create(
+            CartIngredient(user=cls.user, ingredient=ingredient, amount=amount)
+            for ingredient, amount in zip(ingredients, (3, 500, 5))
+        )
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+
+    def download(self, file_format=None, status=200):
+        url = URL if file_format is None else f'{URL}?format={file_format}'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status)
+        if getattr(response, 'streaming', False):
+            return response, b''.join(response.streaming_content)
+        return response, response.content
+
+    def test_txt(self):
+        for file_format in (None, 'txt'):
+            response, content = self.download(file_format)
+            self.assertEqual(
+                content.decode().splitlines(),
+                ['мука (г) - 500', 'соль (г) - 5', 'яйца (шт) - 3']
+            )
+        self.assertIn('shopping_list.txt', response['Content-Disposition'])
+
+    def test_csv(self):
+        response, content = self.download('csv')
+        self.assertEqual(list(csv.reader(StringIO(content.decode()))), [
+            ['Ингредиент', 'Ед. изм.', 'Количество'],
+            ['мука', 'г', '500'],
+            ['соль', 'г', '5'],
+            ['яйца', 'шт', '3'],
+        ])
+        self.assertTrue(response['Content-Type'].startswith('text/csv'))
+
+    def test_pdf(self):
+        rows = CartIngredient.objects.count()
+        for extra in (0, 200):
+            CartIngredient.objects.bulk_create(
+                CartIngredient(
+                    user=self.user, amount=1,
+                    ingredient=Ingredients.objects.create(
+                        name=f'ингредиент {index}', measurement_unit='г'
+                    )
+                )
+                for index in range(rows, rows + extra)
+            )
+            rows += extra
+            response, content = self.download('pdf')
+            self.assertEqual(response['Content-Type'], 'application/pdf')
+            self.assertTrue(content.startswith(b'%PDF-1.4'))
+            self.assertTrue(content.endswith(b'%%EOF\n'))
+            pages = len(re.findall(rb'/Type /Page\b', content))
+            self.assertEqual(
+                pages, int(re.search(rb'/Count (\d+)', content).group(1))
+            )
+            self.assertEqual(pages > 1, bool(extra))
+            offset = int(re.search(rb'startxref\n(\d+)', content).group(1))
+            self.assertTrue(content[offset:].startswith(b'xref'))
+
+    @override_settings(SHOPPING_LIST_FONT='/nonexistent/font.ttf')
+    def test_pdf_without_font_fails_before_streaming(self):
+        response, content = self.download('pdf', status=503)
+        self.assertFalse(response.streaming)
+        self.assertEqual(
+            response.json()['detail'], utils.FontUnavailable.default_detail
+        )
+
+    def test_unknown_format(self):
+        self.download('docx', status=404)
@@ -0,0 +1,109 @@
+from unittest import mock
+
+from recipes.models import (Favorite, IngredientInRecipe, Ingredients, Recipes,
+                            RecipeTags, ShoppingCart, Subscriptions, Tags)
+
+from ..views import RecipesViewSet, UsersViewSet
+from .base import FoodgramTestCase, clear_caches
+
+RECIPE_URLS = (
+    '/api/recipes/?limit=100',
+    '/api/recipes/?limit=100&cursor=',
+    '/api/recipes/?limit=3&page=2',
+    '/api/recipes/?limit=100&ordering=-favorites_count',
+    '/api/recipes/?limit=100&tags=lunch&is_favorited=1',
+    '/api/recipes/?limit=100&fields=name,image,images,cooking_time',
+    '/api/recipes/?limit=100&omit=author,text',
+    '/api/recipes/?limit=100&fields=tags,ingredients',
+)
+USER_URLS = (
+    '/api/users/?limit=100',
+    '/api/users/?limit=100&fields=username,is_subscribed',
+    '/api/users/?limit=100&omit=email',
+)
+
+
+class FastSerializerContractTest(FoodgramTestCase):
+    """Быстрые сериализаторы отдают то же, что и сериализаторы DRF.
+
+    Каждый url запрашивается дважды - с быстрым путём и без него, -
+    и ответы сравниваются целиком, вместе с порядком ключей.
+    """
+    maxDiff = None
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = cls.create_user(
+            'viewer', first_name='Иван', last_name='Иванов'
+        )
+        tags = [
+            Tags.objects.create(name=name, slug=slug, color=color)
+            for name, slug, color in (
+                ('Завтрак', 'breakfast', '#E26C2D'),
+                ('Обед', 'lunch', '#49B64E'),
+                ('Ужин', 'dinner', '#8775D2'),
+            )
+        ]
+        ingredients = Ingredients.objects.bulk_create(
+            Ingredients(name=f'ингредиент {i}', measurement_unit='г')
+            for i in range(10)
+        )
+        ingredients = list(Ingredients.objects.all())
+        for number in range(3):
+            author = cls.create_user(
+                f'author{number}', first_name='Автор', last_name=str(number)
+            )
+            if number:
+                Subscriptions.objects.create(user=cls.user, author=author)
+            for index in range(3):
+                recipe = Recipes.objects.create(
+                    author=author, name=f'рецепт {number}-{index}',
+                    text='описание', cooking_time=index + 1,
+                    image=f'recipes/images/{number}-{index}.jpg' if index
+                    else '',
+                    image_derivatives_ready=index == 2,
+                    favorites_count=index,
+                )
+                RecipeTags.objects.bulk_create(
+                    RecipeTags(recipe=recipe, tag=tag)
+                    for tag in tags[index:] + tags[:index]
+                )
+                IngredientInRecipe.objects.bulk_create(
+                    IngredientInRecipe(
+                        recipe=recipe, ingredient=ingredient,
+                        amount=index + 1
+                    )
+                    for ingredient in ingredients[number:number + 4][::-1]
+                )
+                if index:
+                    Favorite.objects.create(user=cls.user, recipe=recipe)
+                if number:
+                    ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+
+    def assert_same_responses(self, viewset, urls):
+        for url in urls:
+            with self.subTest(url=url):
+                clear_caches()
+                with mock.patch.object(viewset, 'fast_serializer_class',
+                                       None):
+                    expected = self.client.get(url)
+                clear_caches()
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(
+                    response.content.decode(), expected.content.decode()
+                )
+
+    def test_recipes(self):
+        self.client.force_authenticate(self.user)
+        self.assert_same_responses(RecipesViewSet, RECIPE_URLS)
+
+    def test_recipes_anonymous(self):
+        self.assert_same_responses(RecipesViewSet, RECIPE_URLS[:3])
+
+    def test_users(self):
+        self.client.force_authenticate(self.user)
+        self.assert_same_responses(UsersViewSet, USER_URLS)
+
+    def test_users_anonymous(self):
+        self.assert_same_responses(UsersViewSet, USER_URLS)
@@ -0,0 +1,111 @@
+from datetime import datetime, timedelta, timezone
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import override_settings
+from recipes.models import FeedItem, Recipes
+
+from .base import FoodgramTestCase
+
+FEED_URL = '/api/users/subscriptions/feed/'
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+class FeedTest(FoodgramTestCase):
+    """Содержимое и порядок ленты подписок при обеих схемах раскладки."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = cls.create_user('viewer')
+        cls.authors = [cls.create_user(f'author{number}') for number in (0, 1)]
+        for index in range(8):
+            author = cls.authors[index % 2]
+            recipe = Recipes.objects.create(
+                author=author, name=f'рецепт {index}', text='описание',
+                cooking_time=5
+            )
+            # Пары рецептов с одинаковым временем: порядок по id.
+            Recipes.objects.filter(pk=recipe.pk).update(
+                pub_date=START + timedelta(hours=index // 2)
+            )
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.viewer)
+
+    def subscribe(self, author, user=None):
+        self.client.force_authenticate(user or self.viewer)
+        response = self.client.post(f'/api/users/{author.id}/subscribe/')
+        self.assertEqual(response.status_code, 201)
+        self.client.force_authenticate(self.viewer)
+
+    def expected(self, authors):
+        return list(Recipes.objects.filter(author__in=authors).order_by(
+            '-pub_date', '-id'
+        ).values_list('id', flat=True))
+
+    def read_feed(self, limit=3):
+        """id рецептов ленты, пройденной по ссылкам next."""
+        ids = []
+        url = f'{FEED_URL}?limit={limit}'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            self.assertIsNone(data['previous'])
+            self.assertLessEqual(len(data['results']), limit)
+            ids.extend(recipe['id'] for recipe in data['results'])
+            url = data['next']
+        return ids
+
+    def test_order_and_pages(self):
+        for author in self.authors:
+            self.subscribe(author)
+        expected = self.expected(self.authors)
+        self.assertEqual(self.read_feed(), expected)
+        self.assertEqual(self.read_feed(limit=100), expected)
+
+    def test_unsubscribe_trims_feed(self):
+        for author in self.authors:
+            self.subscribe(author)
+        response = self.client.delete(
+            f'/api/users/{self.authors[0].id}/subscribe/'
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(
+            FeedItem.objects.filter(author=self.authors[0]).exists()
+        )
+        self.assertEqual(self.read_feed(), self.expected(self.authors[1:]))
+
+    @override_settings(FEED_FANOUT_MAX_FOLLOWERS=1)
+    def test_switch_to_fan_out_on_read(self):
+        author = self.authors[0]
+        for subscribed in self.authors:
+            self.subscribe(subscribed)
+        self.subscribe(author, user=self.create_user('second'))
+        author.refresh_from_db()
+        self.assertTrue(author.feed_fanout_on_read)
+        # Строки автора удаляются не в запросе подписки, а командой.
+        self.assertTrue(FeedItem.objects.filter(author=author).exists())
+        self.assertEqual(self.read_feed(), self.expected(self.authors))
+
+        recipe = Recipes.objects.create(
+            author=author, name='новый', text='описание', cooking_time=5
+        )
+        FeedItem.objects.fan_out(recipe)
+        self.assertFalse(FeedItem.objects.filter(recipe=recipe).exists())
+        self.assertEqual(self.read_feed()[0], recipe.id)
+
+        call_command(
+            'rebuild-feeds', '--purge', batch_size=2, stdout=StringIO()
+        )
+        self.assertFalse(FeedItem.objects.filter(author=author).exists())
+        self.assertTrue(
+            FeedItem.objects.filter(author=self.authors[1]).exists()
+        )
+        self.assertEqual(self.read_feed(), self.expected(self.authors))
+
+    def test_invalid_cursor(self):
+        for cursor in ('bad', 'cD0x'):
+            response = self.client.get(f'{FEED_URL}?cursor={cursor}')
+            self.assertEqual(response.status_code, 404)
@@ -0,0 +1,78 @@
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+from recipes.models import (Favorite, Ingredients, Recipes, ShoppingCart,
+                            Subscriptions)
+from users.models import User
+
+OPTIONS = {'users': 15, 'recipes': 40, 'favorites': 5, 'carts': 3,
+           'subscriptions': 4}
+
+
+class GenerateDataTest(TestCase):
+
+    def generate(self, seed):
+        User.objects.all().delete()
+        call_command('generate-data', seed=seed, stdout=StringIO(), **OPTIONS)
+        return self.snapshot()
+
+    def snapshot(self):
+        """Данные без id: юзеры по username, рецепты по порядку."""
+        recipes = list(Recipes.objects.order_by('id').prefetch_related(
+            'ingredientinrecipe__ingredient', 'tags'
+        ).select_related('author'))
+        number = {recipe.id: index for index, recipe in enumerate(recipes)}
+        newest = max(recipe.pub_date for recipe in recipes)
+        return {
+            'users': sorted(User.objects.values_list(
+                'username', 'email', 'first_name', 'last_name'
+            )),
+            'recipes': [
+                (
+                    recipe.author.username, recipe.name, recipe.text,
+                    recipe.cooking_time,
+                    sorted(
+                        (link.ingredient.name, link.amount)
+                        for link in recipe.ingredientinrecipe.all()
+                    ),
+                    sorted(tag.slug for tag in recipe.tags.all()),
+                )
+                for recipe in recipes
+            ],
+            'lists': [
+                sorted(
+                    (username, number[recipe_id])
+                    for username, recipe_id in model.objects.values_list(
+                        'user__username', 'recipe_id'
+                    )
+                )
+                for model in (Favorite, ShoppingCart)
+            ],
+            # Даты отсчитываются от момента запуска, сравниваются сдвиги.
+            'ages': [newest - recipe.pub_date for recipe in recipes],
+            'subscriptions': sorted(Subscriptions.objects.values_list(
+                'user__username', 'author__username'
+            )),
+        }
+
+    def test_requires_ingredients(self):
+        with self.assertRaises(CommandError):
+            call_command('generate-data', stdout=StringIO(), **OPTIONS)
+
+    def test_same_seed_same_data(self):
+        Ingredients.objects.bulk_create(
+            Ingredients(name=f'ингредиент {i}', measurement_unit='г')
+            for i in range(30)
+        )
+        first = self.generate(seed=7)
+        self.assertEqual(len(first['users']), OPTIONS['users'])
+        self.assertEqual(len(first['recipes']), OPTIONS['recipes'])
+        self.assertTrue(all(first['lists']))
+        self.assertTrue(first['subscriptions'])
+        ages = first['ages']
+        self.assertEqual(ages, sorted(ages, reverse=True))
+        self.assertEqual(len(set(ages)), OPTIONS['recipes'])
+        self.assertGreater(ages[0].days, 100)
+        self.assertEqual(self.generate(seed=7), first)
+        self.assertNotEqual(self.generate(seed=8), first)
@@ -0,0 +1,98 @@
+import base64
+import os
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+
+from django.core.management import call_command
+from django.test import override_settings
+from PIL import Image
+from recipes.images import derivative_names
+from recipes.models import Ingredients, Recipes, Tags
+
+from .base import FoodgramTestCase
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def encode_image(width, height):
+    buffer = BytesIO()
+    Image.new('RGB', (width, height), 'orange').save(buffer, 'PNG')
+    encoded = base64.b64encode(buffer.getvalue()).decode()
+    return f'data:image/png;base64,{encoded}'
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class RecipeImagesTest(FoodgramTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = cls.create_user('author')
+        cls.tag = Tags.objects.create(
+            name='Завтрак', color='#E26C2D', slug='breakfast'
+        )
+        cls.ingredient = Ingredients.objects.create(
+            name='мука', measurement_unit='г'
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+
+    def payload(self, image):
+        return {
+            'name': 'рецепт', 'text': 'описание', 'cooking_time': 5,
+            'tags': [self.tag.id], 'image': image,
+            'ingredients': [{'id': self.ingredient.id, 'amount': 100}],
+        }
+
+    def create(self, image, status=201):
+        response = self.client.post(
+            '/api/recipes/', self.payload(image), format='json'
+        )
+        self.assertEqual(response.status_code, status, response.content)
+        return response.json()
+
+    def test_upload_and_derivatives(self):
+        recipe = self.create(encode_image(1600, 800))
+        self.assertIsNone(recipe['images'])
+        call_command('process-images', workers=1, stdout=StringIO())
+
+        stored = Recipes.objects.get(pk=recipe['id'])
+        self.assertTrue(stored.image_derivatives_ready)
+        names = derivative_names(stored.image.name)
+        with Image.open(os.path.join(MEDIA_ROOT, names['thumbnail'])) as jpg:
+            self.assertEqual((jpg.format, jpg.size), ('JPEG', (320, 160)))
+        for width, name in names['webp'].items():
+            with Image.open(os.path.join(MEDIA_ROOT, name)) as webp:
+                self.assertEqual(webp.format, 'WEBP')
+                self.assertEqual(webp.size, (int(width), int(width) // 2))
+
+        images = self.client.get(
+            f'/api/recipes/{recipe["id"]}/'
+        ).json()['images']
+        self.assertTrue(images['thumbnail'].endswith(names['thumbnail']))
+        self.assertEqual(set(images['webp']), set(names['webp']))
+
+        # Новая картинка снова ждёт обработки.
+        response = self.client.patch(
+            f'/api/recipes/{recipe["id"]}/',
+            self.payload(encode_image(100, 100)), format='json'
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertIsNone(response.json()['images'])
+
+    @override_settings(RECIPE_IMAGE_MAX_UPLOAD_SIZE=100)
+    def test_too_large(self):
+        errors = self.create(encode_image(300, 300), status=400)
+        self.assertEqual(errors['image'], ['Картинка больше 100 байт.'])
+        self.assertFalse(Recipes.objects.exists())
+
+    def test_invalid_base64(self):
+        errors = self.create('data:image/png;base64,!!!!', status=400)
+        self.assertEqual(errors['image'], ['Некорректная строка base64.'])
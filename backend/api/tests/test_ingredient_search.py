@@ -0,0 +1,57 @@
+from recipes.models import Ingredients
+
+from ..search import MAX_SEARCH_LIMIT, ingredient_index
+from .base import FoodgramTestCase
+
+NAMES = (
+    'ванильный сахар', 'мёд', 'медовик', 'сахар', 'сахарная пудра',
+    'тростниковый сахар', 'яблоки', 'Сахарин',
+)
+
+
+class IngredientSearchTest(FoodgramTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Ingredients.objects.bulk_create(
+            Ingredients(name=name, measurement_unit='г') for name in NAMES
+        )
+
+    def search(self, name, limit=None):
+        url = f'/api/ingredients/?name={name}'
+        if limit is not None:
+            url += f'&limit={limit}'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [ingredient['name'] for ingredient in response.json()]
+
+    def test_prefix_before_word_before_substring(self):
+        self.assertEqual(self.search('сахар'), [
+            'сахар', 'Сахарин', 'сахарная пудра',
+            'ванильный сахар', 'тростниковый сахар',
+        ])
+        self.assertEqual(self.search('ахар'), [
+            'сахар', 'Сахарин', 'сахарная пудра', 'ванильный сахар',
+            'тростниковый сахар',
+        ])
+        self.assertEqual(self.search('ябл'), ['яблоки'])
+        self.assertEqual(self.search('груш'), [])
+
+    def test_yo_folding_and_case(self):
+        self.assertEqual(self.search('мед'), ['мёд', 'медовик'])
+        self.assertEqual(self.search('МЁД'), ['мёд', 'медовик'])
+
+    def test_limit(self):
+        self.assertEqual(len(self.search('сахар', limit=2)), 2)
+        self.assertEqual(
+            self.search('сахар', limit=2), self.search('сахар')[:2]
+        )
+        self.assertEqual(len(self.search('сахар', limit='x')), 5)
+        Ingredients.objects.bulk_create(
+            Ingredients(name=f'сахар {index}', measurement_unit='г')
+            for index in range(MAX_SEARCH_LIMIT + 10)
+        )
+        ingredient_index.invalidate()
+        self.assertEqual(
+            len(self.search('сахар', limit=1000)), MAX_SEARCH_LIMIT
+        )
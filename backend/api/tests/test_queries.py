@@ -0,0 +1,430 @@
+import sys
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from recipes.models import (CartIngredient, Favorite, FeedItem,
+                            IngredientInRecipe, Ingredients, Recipes,
+                            RecipeTags, ShoppingCart, Subscriptions, Tags)
+from recipes.search import index_recipes
+from rest_framework.authtoken.models import Token
+from users.models import User
+
+from ..authentication import token_cache
+from .base import FoodgramTestCase, clear_caches
+
+QUERY_LOG = {}
+
+
+class QueryCountTest(FoodgramTestCase):
+    """Число SQL-запросов на эндпоинт не должно зависеть от числа строк.
+
+    Каждый запрос выполняется дважды: на исходном наборе данных и после
+    его увеличения. Количество запросов должно совпасть и не превышать
+    заданную верхнюю границу.
+    """
+    maxDiff = None
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = cls.create_user(
+            'viewer', first_name='Иван', last_name='Иванов'
+        )
+        cls.tags = [
+            Tags.objects.create(name=name, slug=slug, color=color)
+            for name, slug, color in (
+                ('Завтрак', 'breakfast', '#E26C2D'),
+                ('Обед', 'lunch', '#49B64E'),
+                ('Ужин', 'dinner', '#8775D2'),
+            )
+        ]
+        cls.ingredients = Ingredients.objects.bulk_create(
+            Ingredients(name=f'ингредиент {i}', measurement_unit='г')
+            for i in range(30)
+        )
+        cls.ingredients = list(Ingredients.objects.all())
+        cls.populate(authors=2, recipes_per_author=2)
+
+    @classmethod
+    def populate(cls, authors, recipes_per_author):
+        """Добавляет авторов с рецептами, избранным, покупками и подписками."""
+        start = User.objects.count()
+        for number in range(start, start + authors):
+            author = cls.create_user(
+                f'author{number}', first_name='Автор', last_name=str(number)
+            )
+            Subscriptions.objects.create(user=cls.user, author=author)
+            for index in range(recipes_per_author):
+                recipe = Recipes.objects.create(
+                    author=author, name=f'рецепт {number}-{index}',
+                    text='описание', cooking_time=10
+                )
+                RecipeTags.objects.bulk_create(
+                    RecipeTags(recipe=recipe, tag=tag) for tag in cls.tags
+                )
+                IngredientInRecipe.objects.bulk_create(
+                    IngredientInRecipe(
+                        recipe=recipe, ingredient=ingredient, amount=index + 1
+                    )
+                    for ingredient in cls.ingredients[index:index + 5]
+                )
+                Favorite.objects.create(user=cls.user, recipe=recipe)
+                ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+                CartIngredient.objects.add_recipe(cls.user, recipe)
+                index_recipes([recipe.id])
+            FeedItem.objects.backfill(cls.user, author)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        if not QUERY_LOG:
+            return
+        width = max(len(name) for name in QUERY_LOG)
+        lines = [
+            '',
+            f'{"endpoint".ljust(width)}  queries  db time, ms',
+        ]
+        for name, (count, db_time) in sorted(QUERY_LOG.items()):
+            lines.append(
+                f'{name.ljust(width)}  {count:>7}  {db_time * 1000:>11.2f}'
+            )
+        sys.stderr.write('\n'.join(lines) + '\n')
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+
+    def measure(self, name, method, url, data=None, status=200):
+        """Выполняет запрос и возвращает число SQL-запросов."""
+        with CaptureQueriesContext(connection) as context:
+            response = getattr(self.client, method)(url, data, format='json')
+            if getattr(response, 'streaming', False):
+                b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, status, msg=name)
+        QUERY_LOG[name] = (
+            len(context),
+            sum(float(query['time']) for query in context.captured_queries)
+        )
+        return len(context)
+
+    def assert_constant_queries(self, name, limit, request):
+        """Сравнивает число запросов до и после роста набора данных.
+
+        request вызывается без аргументов и возвращает аргументы
+        для measure(): метод, url и, при необходимости, тело и статус.
+        Оба замера идут с пустым кешем.
+        """
+        clear_caches()
+        before = self.measure(name, *request())
+        self.populate(authors=4, recipes_per_author=4)
+        clear_caches()
+        after = self.measure(name, *request())
+        self.assertEqual(before, after, msg=f'{name}: N+1')
+        self.assertLessEqual(after, limit, msg=name)
+
+    def free_recipe(self):
+        """Рецепт, которого ещё нет в избранном и в списке покупок."""
+        author = User.objects.exclude(pk=self.user.pk).last()
+        return Recipes.objects.create(
+            author=author, name=f'свободный {Recipes.objects.count()}',
+            text='описание', cooking_time=5
+        )
+
+    def recipe_payload(self, ingredients):
+        return {
+            'name': f'новый рецепт {Recipes.objects.count()}',
+            'text': 'описание',
+            'cooking_time': 15,
+            'tags': [tag.id for tag in self.tags],
+            'ingredients': [
+                {'id': ingredient.id, 'amount': 10}
+                for ingredient in ingredients
+            ],
+        }
+
+    def test_tags(self):
+        self.assert_constant_queries(
+            'tags list', 1, lambda: ('get', '/api/tags/'))
+        self.assert_constant_queries(
+            'tags detail', 1,
+            lambda: ('get', f'/api/tags/{self.tags[0].id}/'))
+
+    def test_ingredients(self):
+        self.assert_constant_queries(
+            'ingredients list', 1, lambda: ('get', '/api/ingredients/'))
+        self.assert_constant_queries(
+            'ingredients search', 1,
+            lambda: ('get', '/api/ingredients/?name=ингр'))
+        self.assertEqual(self.measure(
+            'ingredients search warm', 'get', '/api/ingredients/?name=ингр'
+        ), 0)
+        self.assert_constant_queries(
+            'ingredients detail', 1,
+            lambda: ('get', f'/api/ingredients/{self.ingredients[0].id}/'))
+
+    def test_recipes_list(self):
+        self.assert_constant_queries(
+            'recipes list', 4, lambda: ('get', '/api/recipes/?limit=100'))
+        self.assert_constant_queries(
+            'recipes list by popularity', 4,
+            lambda: ('get', '/api/recipes/?limit=100'
+                            '&ordering=-favorites_count'))
+        self.assert_constant_queries(
+            'recipes list filtered', 5,
+            lambda: ('get', '/api/recipes/?limit=100&tags=breakfast'
+                            '&tags=lunch&is_favorited=1'))
+        self.assert_constant_queries(
+            'recipes list all tags', 5,
+            lambda: ('get', '/api/recipes/?limit=100&tags=breakfast'
+                            '&tags=lunch&tags_match=all'))
+        self.assert_constant_queries(
+            'recipes list search', 4,
+            lambda: ('get', '/api/recipes/?limit=100&search=рецепты'))
+
+    def test_recipes_sparse_fields(self):
+        self.assert_constant_queries(
+            'recipes list card fields', 2,
+            lambda: ('get', '/api/recipes/?limit=100'
+                            '&fields=name,image,cooking_time'))
+        self.assert_constant_queries(
+            'recipes list omit', 2,
+            lambda: ('get', '/api/recipes/?limit=100'
+                            '&omit=text,ingredients,tags'))
+        recipe = self.client.get(
+            '/api/recipes/?fields=name,cooking_time&omit=cooking_time'
+        ).json()['results'][0]
+        self.assertEqual(set(recipe), {'id', 'name'})
+
+    def test_recipes_cursor(self):
+        self.assert_constant_queries(
+            'recipes cursor', 4,
+            lambda: ('get', '/api/recipes/?limit=100&cursor='))
+        self.client.get('/api/recipes/?limit=2&cursor=')
+        next_page = self.client.get(
+            '/api/recipes/?limit=2&cursor='
+        ).json()['next']
+        self.assert_constant_queries(
+            'recipes cursor next page', 4, lambda: ('get', next_page))
+
+    def test_recipes_batch_read(self):
+        def recipe_ids():
+            return list(Recipes.objects.order_by('-id').values_list(
+                'id', flat=True
+            )[:100])
+
+        self.assert_constant_queries(
+            'recipes by ids', 3, lambda: (
+                'get', '/api/recipes/?ids=' + ','.join(map(str, recipe_ids()))
+            ))
+        self.assert_constant_queries(
+            'recipes batch read', 3,
+            lambda: ('post', '/api/recipes/batch/', {'ids': recipe_ids()}))
+        ids = recipe_ids()[:3][::-1]
+        response = self.client.post(
+            '/api/recipes/batch/', {'ids': ids}, format='json'
+        )
+        self.assertEqual([recipe['id'] for recipe in response.json()], ids)
+
+    def test_recipes_list_anonymous(self):
+        self.client.force_authenticate(None)
+        self.assert_constant_queries(
+            'recipes list anonymous', 4,
+            lambda: ('get', '/api/recipes/?limit=100'))
+        self.client.get('/api/recipes/?tags=lunch&limit=100')
+        self.assertEqual(self.measure(
+            'recipes list anonymous cached',
+            'get', '/api/recipes/?limit=100&tags=lunch'
+        ), 0)
+
+    def test_recipe_detail(self):
+        self.assert_constant_queries(
+            'recipes detail', 4,
+            lambda: ('get', f'/api/recipes/{Recipes.objects.last().id}/'))
+
+    def test_recipe_create(self):
+        self.assert_constant_queries(
+            'recipes create', 17,
+            lambda: ('post', '/api/recipes/', self.recipe_payload(
+                self.ingredients[:Recipes.objects.count()]), 201))
+
+    def test_recipe_similar(self):
+        self.assert_constant_queries(
+            'recipes similar', 6,
+            lambda: ('get', f'/api/recipes/{Recipes.objects.first().id}/'
+                            'similar/'))
+        call_command('build-similar', workers=1, stdout=StringIO())
+        recipe = Recipes.objects.first()
+        self.assert_constant_queries(
+            'recipes similar precomputed', 5,
+            lambda: ('get', f'/api/recipes/{recipe.id}/similar/'))
+
+    def edited_recipe(self):
+        """Рецепт, в котором PATCH обновит, добавит и удалит связи."""
+        recipe = Recipes.objects.create(
+            author=self.user, name='мой рецепт', text='описание',
+            cooking_time=5
+        )
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(recipe=recipe, ingredient=ingredient, amount=5)
+            for ingredient in self.ingredients[:1] + self.ingredients[-1:]
+        )
+        RecipeTags.objects.create(recipe=recipe, tag=self.tags[-1])
+        return recipe
+
+    def test_recipe_update(self):
+        self.assert_constant_queries(
+            'recipes update', 21,
+            lambda: ('patch', f'/api/recipes/{self.edited_recipe().id}/',
+                     self.recipe_payload(
+                         self.ingredients[:Recipes.objects.count()])))
+
+    def test_recipe_delete(self):
+        self.assert_constant_queries(
+            'recipes delete', 18,
+            lambda: ('delete', '/api/recipes/{}/'.format(
+                Recipes.objects.create(
+                    author=self.user, name='удаляемый', text='описание',
+                    cooking_time=5
+                ).id), None, 204))
+
+    def test_favorite(self):
+        self.assert_constant_queries(
+            'favorite add', 7,
+            lambda: ('post', f'/api/recipes/{self.free_recipe().id}/favorite/',
+                     None, 201))
+        self.assert_constant_queries(
+            'favorite delete', 7,
+            lambda: ('delete', '/api/recipes/{}/favorite/'.format(
+                Favorite.objects.filter(user=self.user).last().recipe_id),
+                None, 204))
+
+    def test_shopping_cart(self):
+        self.assert_constant_queries(
+            'shopping_cart add', 8,
+            lambda: ('post',
+                     f'/api/recipes/{self.free_recipe().id}/shopping_cart/',
+                     None, 201))
+        self.assert_constant_queries(
+            'shopping_cart delete', 11,
+            lambda: ('delete', '/api/recipes/{}/shopping_cart/'.format(
+                ShoppingCart.objects.filter(
+                    user=self.user, recipe__ingredientinrecipe__isnull=False
+                ).last().recipe_id),
+                None, 204))
+
+    def free_recipe_ids(self):
+        """Свободные рецепты с ингредиентом, по два на юзера в базе."""
+        recipes = [self.free_recipe() for _ in range(User.objects.count() * 2)]
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(
+                recipe=recipe, amount=1,
+                ingredient=self.ingredients[index % len(self.ingredients)]
+            )
+            for index, recipe in enumerate(recipes)
+        )
+        return [recipe.id for recipe in recipes]
+
+    def test_batch_lists(self):
+        for name, limit in (('favorite', 7), ('shopping_cart', 11)):
+            self.assert_constant_queries(
+                f'{name} batch add', limit,
+                lambda: ('post', f'/api/recipes/{name}/',
+                         {'ids': self.free_recipe_ids()}))
+        self.assert_constant_queries(
+            'shopping_cart batch delete', 11,
+            lambda: ('delete', '/api/recipes/shopping_cart/', {
+                'ids': list(self.user.shopping_cart.values_list(
+                    'recipe_id', flat=True
+                ))
+            }))
+
+    def test_download_shopping_cart(self):
+        self.assert_constant_queries(
+            'download_shopping_cart', 1,
+            lambda: ('get', '/api/recipes/download_shopping_cart/'))
+
+    def test_subscriptions(self):
+        self.assert_constant_queries(
+            'subscriptions', 3,
+            lambda: ('get', '/api/users/subscriptions/?limit=100'
+                            '&recipes_limit=3'))
+        self.assert_constant_queries(
+            'subscriptions all recipes', 3,
+            lambda: ('get', '/api/users/subscriptions/?limit=100'))
+        self.assert_constant_queries(
+            'subscriptions cursor', 2,
+            lambda: ('get', '/api/users/subscriptions/?limit=100&cursor='))
+
+    def test_subscriptions_feed(self):
+        self.assert_constant_queries(
+            'subscriptions feed', 6,
+            lambda: ('get', '/api/users/subscriptions/feed/?limit=100'))
+        author = self.user.follower.first().author
+        FeedItem.objects.filter(author=author).delete()
+        User.objects.filter(pk=author.pk).update(feed_fanout_on_read=True)
+        self.assert_constant_queries(
+            'subscriptions feed with pulled authors', 6,
+            lambda: ('get', '/api/users/subscriptions/feed/?limit=100'))
+
+    def test_subscribe(self):
+        self.assert_constant_queries(
+            'subscribe', 10,
+            lambda: ('post', '/api/users/{}/subscribe/'.format(
+                self.create_user(
+                    f'new{User.objects.count()}',
+                    first_name='Новый', last_name='Автор'
+                ).id), None, 201))
+        self.assert_constant_queries(
+            'unsubscribe', 7,
+            lambda: ('delete', '/api/users/{}/subscribe/'.format(
+                Subscriptions.objects.filter(user=self.user).last().author_id
+            ), None, 204))
+
+    def test_users_list(self):
+        self.assert_constant_queries(
+            'users list', 2, lambda: ('get', '/api/users/?limit=100'))
+
+    def test_users_list_sparse_fields(self):
+        self.assert_constant_queries(
+            'users list without is_subscribed', 2,
+            lambda: ('get', '/api/users/?limit=100&omit=is_subscribed'))
+
+    def test_token_authentication(self):
+        token = Token.objects.create(user=self.user)
+        self.client.force_authenticate(None)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        miss = self.measure('token auth miss', 'get', '/api/users/me/')
+        self.assertEqual(
+            self.measure('token auth hit', 'get', '/api/users/me/'), miss - 1
+        )
+        token_cache.local.clear()
+        self.assertEqual(self.measure(
+            'token auth shared hit', 'get', '/api/users/me/'
+        ), miss - 1)
+        self.measure(
+            'token logout', 'post', '/api/auth/token/logout/', None, 204
+        )
+        self.measure('token after logout', 'get', '/api/users/me/',
+                     status=401)
+
+    def test_token_authentication_deactivated_user(self):
+        user = self.create_user(
+            'blocked', first_name='Пётр', last_name='Петров'
+        )
+        token = Token.objects.create(user=user)
+        self.client.force_authenticate(None)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.measure('token auth miss', 'get', '/api/users/me/')
+        user.is_active = False
+        user.save()
+        self.measure('token deactivated user', 'get', '/api/users/me/',
+                     status=401)
+
+    def test_users_detail(self):
+        self.assert_constant_queries(
+            'users detail', 2,
+            lambda: ('get', '/api/users/{}/'.format(
+                User.objects.exclude(pk=self.user.pk).first().id)))
+        self.assert_constant_queries(
+            'users me', 1, lambda: ('get', '/api/users/me/'))
@@ -0,0 +1,167 @@
+import random
+from collections import Counter
+from unittest import mock
+
+from django.core.cache import caches
+from django.db import OperationalError, connections
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from recipes.models import Recipes, Tags
+from users.models import User
+
+from ..paginations import CachedCountPaginator
+from ..replicas import (ReplicaMiddleware, ReplicaPool, ReplicaRouter, primary,
+                        state)
+from ..versions import get_version
+from ..views import RecipesViewSet, UsersViewSet
+from .base import FoodgramTestCase
+
+REPLICAS = {'replica_1': 3, 'replica_2': 1}
+
+
+@override_settings(DATABASE_REPLICAS=REPLICAS)
+class ReplicaRoutingTest(SimpleTestCase):
+    """Маршрутизация чтений без настоящих реплик: проверка здоровья
+    подменена, а вьюха только спрашивает роутер, куда пойдёт чтение."""
+
+    def setUp(self):
+        caches['shared'].clear()
+        self.factory = RequestFactory()
+        self.router = ReplicaRouter()
+        self.healthy = set(REPLICAS)
+        self.middleware = ReplicaMiddleware(self.get_response)
+        self.middleware.pool.check = lambda alias: alias in self.healthy
+        self.middleware.pool.rng = random.Random(0)
+
+    def tearDown(self):
+        state.replica = None
+
+    def get_response(self, request):
+        """Вместо обработчика Django: process_view и чтение во вьюхе."""
+        method = request.method.lower()
+        self.middleware.process_view(
+            request, self.view_class.as_view({method: 'list'}), (), {}
+        )
+        self.read_db = self.router.db_for_read(Recipes)
+        return HttpResponse(status=201 if method == 'post' else 200)
+
+    def request(self, method='get', view=RecipesViewSet, **headers):
+        """База, с которой вьюха прочитала бы данные."""
+        self.view_class = view
+        self.middleware(
+            getattr(self.factory, method)('/api/recipes/', **headers)
+        )
+        return self.read_db
+
+    def test_reads_go_to_replicas_by_weight(self):
+        picks = Counter(self.request() for _ in range(2000))
+        self.assertEqual(set(picks), set(REPLICAS))
+        self.assertAlmostEqual(
+            picks['replica_1'] / picks['replica_2'], 3, delta=0.5
+        )
+
+    def test_other_views_and_writes_use_primary(self):
+        self.assertIsNone(self.request(view=UsersViewSet))
+        self.assertIsNone(self.request(method='post'))
+        self.assertEqual(self.router.db_for_write(Recipes), 'default')
+
+    def test_write_pins_client_to_primary(self):
+        token = {'HTTP_AUTHORIZATION': 'Token 123'}
+        self.assertIsNone(self.request(method='post', **token))
+        self.assertIsNone(self.request(**token))
+        self.assertIsNotNone(self.request(HTTP_AUTHORIZATION='Token 456'))
+        caches['shared'].clear()
+        self.assertIsNotNone(self.request(**token))
+
+    def test_unhealthy_replica_is_skipped(self):
+        self.healthy = {'replica_2'}
+        self.assertEqual(
+            {self.request() for _ in range(50)}, {'replica_2'}
+        )
+        self.healthy = set()
+        self.assertIsNone(self.request())
+
+    def test_replica_failure_is_retried_on_primary(self):
+        request = self.factory.get('/api/recipes/')
+        view_func = mock.Mock(
+            cls=RecipesViewSet, return_value=HttpResponse('primary')
+        )
+        self.middleware.process_view(request, view_func, (), {})
+        self.assertIsNotNone(self.router.db_for_read(Recipes))
+        response = self.middleware.process_exception(
+            request, OperationalError('connection refused')
+        )
+        self.assertEqual(response.content, b'primary')
+        self.assertIsNone(self.router.db_for_read(Recipes))
+        self.assertEqual(len(self.middleware.pool.down_until), 1)
+
+    def test_primary_block_and_migrations(self):
+        self.middleware.process_view(
+            self.factory.get('/api/recipes/'),
+            RecipesViewSet.as_view({'get': 'list'}), (), {}
+        )
+        replica = self.router.db_for_read(Recipes)
+        with primary():
+            self.assertIsNone(self.router.db_for_read(Recipes))
+        self.assertEqual(self.router.db_for_read(Recipes), replica)
+        self.assertFalse(self.router.allow_migrate('replica_1', 'recipes'))
+        self.assertTrue(self.router.allow_migrate('default', 'recipes'))
+
+    def test_pool_rechecks_after_retry_interval(self):
+        pool = ReplicaPool({'replica_1': 1}, retry_seconds=0)
+        pool.check = lambda alias: False
+        self.assertIsNone(pool.choose())
+        pool.check = lambda alias: True
+        self.assertEqual(pool.choose(), 'replica_1')
+
+
+LAGGING = 'lagging'
+
+
+class LaggingReplicaTest(FoodgramTestCase):
+    """Реплика с пустыми таблицами: не получила ни одной записи."""
+    databases = {'default', LAGGING}
+
+    @classmethod
+    def setUpClass(cls):
+        connections.databases[LAGGING] = {
+            'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'
+        }
+        with connections[LAGGING].schema_editor() as editor:
+            editor.create_model(Tags)
+            editor.create_model(User)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections[LAGGING].close()
+        del connections[LAGGING]
+        del connections.databases[LAGGING]
+
+    def setUp(self):
+        super().setUp()
+        for number in range(3):
+            self.create_user(f'user{number}')
+
+    def tearDown(self):
+        state.replica = None
+
+    def test_replica_lags(self):
+        state.replica = LAGGING
+        self.assertEqual(User.objects.count(), 0)
+
+    def test_page_count_is_read_from_primary(self):
+        state.replica = LAGGING
+        paginator = CachedCountPaginator(User.objects.order_by('id'), 2)
+        self.assertEqual(paginator.count, 3)
+        self.assertEqual(state.replica, LAGGING)
+
+    @override_settings(DATABASE_REPLICAS={LAGGING: 1})
+    def test_versioned_views_read_from_primary(self):
+        Tags.objects.create(name='Завтрак', slug='breakfast', color='#FF0000')
+        response = self.client.get('/api/tags/')
+        self.assertEqual(len(response.json()), 1)
+        self.assertEqual(
+            response['ETag'], '"tags-{}-json"'.format(get_version('tags'))
+        )
@@ -0,0 +1,54 @@
+from recipes.models import IngredientInRecipe, Ingredients, Recipes
+from recipes.search import rebuild_index
+
+from .base import FoodgramTestCase
+
+RECIPES = (
+    ('Блины', 'тонкие, на сковороде', 'молоко'),
+    ('Сырники', 'подавать вместо блинов со сметаной', 'творог'),
+    ('Омлет', 'взбить яйца', 'молоко'),
+)
+
+
+class RecipeSearchTest(FoodgramTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = cls.create_user('author')
+        for name, text, ingredient in RECIPES:
+            recipe = Recipes.objects.create(
+                author=author, name=name, text=text, cooking_time=5
+            )
+            IngredientInRecipe.objects.create(
+                recipe=recipe, amount=100,
+                ingredient=Ingredients.objects.get_or_create(
+                    name=ingredient, measurement_unit='г'
+                )[0]
+            )
+        rebuild_index()
+
+    def search(self, query, **params):
+        response = self.client.get(
+            '/api/recipes/', {'search': query, **params}
+        )
+        self.assertEqual(response.status_code, 200)
+        return [recipe['name'] for recipe in response.json()['results']]
+
+    def test_name_ranks_above_text(self):
+        self.assertEqual(self.search('блины'), ['Блины', 'Сырники'])
+        self.assertEqual(self.search('блинами'), ['Блины', 'Сырники'])
+
+    def test_ingredients_and_words(self):
+        self.assertEqual(
+            sorted(self.search('молоко')), ['Блины', 'Омлет']
+        )
+        self.assertEqual(self.search('молоко яйца'), ['Омлет'])
+        self.assertEqual(self.search('ТВОРОГ'), ['Сырники'])
+        self.assertEqual(self.search('пицца'), [])
+
+    def test_explicit_ordering_wins(self):
+        Recipes.objects.filter(name='Сырники').update(favorites_count=5)
+        self.assertEqual(
+            self.search('блины', ordering='-favorites_count'),
+            ['Сырники', 'Блины']
+        )
@@ -0,0 +1,136 @@
+from importlib import import_module
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from recipes.models import (IngredientInRecipe, Ingredients, Recipes,
+                            SimilarRecipe)
+from recipes.similar import SimilarityIndex
+
+from .base import FoodgramTestCase
+
+COMPOSITION = {
+    'A': (1, 2, 3),
+    'B': (1, 2, 3),
+    'C': (1, 2),
+    'D': (7, 8),
+    'E': (8, 9),
+}
+
+
+class SimilarRecipesTest(FoodgramTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Ingredients.objects.bulk_create(
+            Ingredients(name=f'ингредиент {i}', measurement_unit='г')
+            for i in range(10)
+        )
+        cls.ingredients = list(Ingredients.objects.order_by('id'))
+        author = cls.create_user('author')
+        cls.recipes = {}
+        for name, composition in COMPOSITION.items():
+            recipe = Recipes.objects.create(
+                author=author, name=name, text='описание', cooking_time=5
+            )
+            cls.set_composition(recipe, composition)
+            cls.recipes[name] = recipe
+
+    @classmethod
+    def set_composition(cls, recipe, composition):
+        IngredientInRecipe.objects.filter(recipe=recipe).delete()
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(
+                recipe=recipe, ingredient=cls.ingredients[index], amount=1
+            )
+            for index in composition
+        )
+
+    def build(self, *args):
+        call_command('build-similar', *args, workers=1, stdout=StringIO())
+
+    def similar(self, name):
+        response = self.client.get(
+            f'/api/recipes/{self.recipes[name].id}/similar/'
+        )
+        self.assertEqual(response.status_code, 200)
+        names = {recipe.id: name for name, recipe in self.recipes.items()}
+        return [names[recipe['id']] for recipe in response.json()]
+
+    def test_neighbours(self):
+        self.build('--full')
+        self.assertEqual(self.similar('A'), ['B', 'C'])
+        self.assertEqual(self.similar('C'), ['A', 'B'])
+        self.assertEqual(self.similar('D'), ['E'])
+        stored = SimilarRecipe.objects.get(
+            recipe=self.recipes['A'], similar=self.recipes['B']
+        )
+        self.assertAlmostEqual(stored.score, 1.0)
+        self.assertEqual(stored.rank, 0)
+
+    def test_incremental_rebuild(self):
+        self.build('--full')
+        recipe = self.recipes['E']
+        self.set_composition(recipe, (1, 2, 3))
+        Recipes.objects.filter(pk=recipe.pk).update(similar_outdated=True)
+        self.build()
+        self.assertEqual(self.similar('E'), ['A', 'B', 'C'])
+        # Старый сосед забыл E, новые - узнали.
+        self.assertEqual(self.similar('D'), [])
+        self.assertEqual(self.similar('A'), ['B', 'E', 'C'])
+        self.assertFalse(
+            Recipes.objects.filter(similar_outdated=True).exists()
+        )
+
+    def test_full_rebuild_keeps_rows_on_failure(self):
+        self.build('--full')
+        before = list(SimilarRecipe.objects.values_list(
+            'recipe_id', 'similar_id', 'rank'
+        ).order_by('id'))
+        with mock.patch.object(
+            SimilarRecipe.objects, 'bulk_create', side_effect=RuntimeError
+        ):
+            with self.assertRaises(RuntimeError):
+                self.build('--full')
+        self.assertEqual(list(SimilarRecipe.objects.values_list(
+            'recipe_id', 'similar_id', 'rank'
+        ).order_by('id')), before)
+
+    def test_edit_during_build_stays_outdated(self):
+        self.build('--full')
+        recipe = self.recipes['E']
+        Recipes.objects.filter(pk=recipe.pk).update(similar_outdated=True)
+        command = import_module('recipes.management.commands.build-similar')
+
+        def edited_during_build(features):
+            Recipes.objects.filter(pk=recipe.pk).update(similar_outdated=True)
+            return SimilarityIndex(features)
+
+        with mock.patch.object(
+            command, 'SimilarityIndex', side_effect=edited_during_build
+        ):
+            self.build()
+        self.assertTrue(
+            Recipes.objects.get(pk=recipe.pk).similar_outdated
+        )
+
+    def test_failed_build_keeps_flags(self):
+        recipe = self.recipes['E']
+        Recipes.objects.filter(pk=recipe.pk).update(similar_outdated=True)
+        with mock.patch.object(
+            SimilarRecipe.objects, 'bulk_create', side_effect=RuntimeError
+        ):
+            with self.assertRaises(RuntimeError):
+                self.build()
+        self.assertTrue(
+            Recipes.objects.get(pk=recipe.pk).similar_outdated
+        )
+
+    def test_common_tag_is_kept(self):
+        """Тег у всех рецептов не отсекается вместе с частыми
+        ингредиентами."""
+        features = {
+            recipe_id: [-1, 1000 + recipe_id] for recipe_id in range(100)
+        }
+        index = SimilarityIndex(features)
+        self.assertEqual(len(index.top_k(0, 3)), 3)
@@ -0,0 +1,48 @@
+from recipes.models import Recipes, Subscriptions
+
+from .base import FoodgramTestCase
+
+URL = '/api/users/subscriptions/'
+
+
+class SubscriptionsTest(FoodgramTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = cls.create_user('viewer')
+        cls.author = cls.create_user('author')
+        for index in range(4):
+            Recipes.objects.create(
+                author=cls.author, name=f'рецепт {index}', text='описание',
+                cooking_time=5
+            )
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+
+    def subscriptions(self, query=''):
+        response = self.client.get(f'{URL}?{query}')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_without_subscriptions(self):
+        for query in ('', 'recipes_limit=3', 'recipe_limit=3'):
+            with self.subTest(query=query):
+                self.assertEqual(self.subscriptions(query), [])
+
+    def test_recipes_limit(self):
+        Subscriptions.objects.create(user=self.user, author=self.author)
+        latest = list(Recipes.objects.order_by(
+            '-pub_date', '-id'
+        ).values_list('name', flat=True))
+        for query, expected in (
+            ('recipes_limit=3', latest[:3]),
+            ('recipes_limit=0', []),
+            ('', latest),
+        ):
+            with self.subTest(query=query):
+                author, = self.subscriptions(query)
+                self.assertEqual(
+                    [recipe['name'] for recipe in author['recipes']], expected
+                )
@@ -0,0 +1,75 @@
+from recipes.models import Recipes, RecipeTags, Tags
+
+from .base import FoodgramTestCase
+
+RECIPES = {
+    'каша': ('breakfast',),
+    'суп': ('lunch',),
+    'омлет': ('breakfast', 'lunch'),
+    'пирог': ('breakfast', 'lunch', 'dinner'),
+    'салат': (),
+}
+
+
+class TagFilterTest(FoodgramTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = cls.create_user('author')
+        tags = {
+            slug: Tags.objects.create(name=slug, color=color, slug=slug)
+            for slug, color in (
+                ('breakfast', '#E26C2D'), ('lunch', '#49B64E'),
+                ('dinner', '#8775D2'),
+            )
+        }
+        for name, slugs in RECIPES.items():
+            recipe = Recipes.objects.create(
+                author=author, name=name, text='описание', cooking_time=5
+            )
+            RecipeTags.objects.bulk_create(
+                RecipeTags(recipe=recipe, tag=tags[slug]) for slug in slugs
+            )
+
+    def names(self, query, status=200):
+        response = self.client.get(f'/api/recipes/?limit=100&{query}')
+        self.assertEqual(response.status_code, status)
+        if status != 200:
+            return response.json()
+        data = response.json()
+        names = [recipe['name'] for recipe in data['results']]
+        self.assertEqual(data['count'], len(names))
+        self.assertEqual(len(set(names)), len(names))
+        return sorted(names)
+
+    def test_any(self):
+        self.assertEqual(
+            self.names('tags=breakfast'), ['каша', 'омлет', 'пирог']
+        )
+        for query in ('tags=breakfast&tags=lunch',
+                      'tags=breakfast&tags=lunch&tags_match=any'):
+            self.assertEqual(
+                self.names(query), ['каша', 'омлет', 'пирог', 'суп']
+            )
+
+    def test_all(self):
+        self.assertEqual(
+            self.names('tags=breakfast&tags=lunch&tags_match=all'),
+            ['омлет', 'пирог']
+        )
+        self.assertEqual(
+            self.names('tags=dinner&tags=lunch&tags_match=all'), ['пирог']
+        )
+        self.assertEqual(
+            self.names('tags=breakfast&tags=breakfast&tags_match=all'),
+            ['каша', 'омлет', 'пирог']
+        )
+
+    def test_without_tags(self):
+        self.assertEqual(self.names('tags_match=all'), sorted(RECIPES))
+
+    def test_unknown_slug(self):
+        self.assertIn('tags', self.names('tags=brunch', status=400))
+        self.assertIn(
+            'tags_match', self.names('tags=lunch&tags_match=some', status=400)
+        )
@@ -0,0 +1,80 @@
+from django.core.cache import caches
+from django.db import transaction
+from django.test import TransactionTestCase
+from recipes.models import Tags
+from recipes.signals import data_changed
+from users.models import User
+
+from ..versions import get_version
+
+
+class VersionBumpTest(TransactionTestCase):
+    """Версии сдвигаются только после COMMIT: TestCase держит тест
+    в транзакции и не выполняет on_commit, поэтому здесь
+    TransactionTestCase."""
+
+    def setUp(self):
+        caches['shared'].clear()
+
+    def create_tag(self):
+        return Tags.objects.create(
+            name='Завтрак', slug='breakfast', color='#FF0000'
+        )
+
+    def test_bump_waits_for_commit(self):
+        version = get_version('tags')
+        catalog = get_version('catalog')
+        with transaction.atomic():
+            self.create_tag()
+            self.assertEqual(get_version('tags'), version)
+        self.assertEqual(get_version('tags'), version + 1)
+        self.assertEqual(get_version('catalog'), catalog + 1)
+
+    def test_rollback_keeps_version(self):
+        version = get_version('tags')
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                self.create_tag()
+                raise RuntimeError
+        self.assertEqual(get_version('tags'), version)
+        self.assertFalse(Tags.objects.exists())
+
+    def test_autocommit_bumps_at_once(self):
+        version = get_version('tags')
+        tag = self.create_tag()
+        self.assertEqual(get_version('tags'), version + 1)
+        tag.delete()
+        self.assertEqual(get_version('tags'), version + 2)
+
+    def test_data_changed_signal(self):
+        versions = [get_version(name) for name in ('ingredients', 'catalog')]
+        with transaction.atomic():
+            data_changed.send(sender=None, names=('ingredients', 'catalog'))
+            self.assertEqual(
+                [get_version(name) for name in ('ingredients', 'catalog')],
+                versions
+            )
+        self.assertEqual(
+            [get_version(name) for name in ('ingredients', 'catalog')],
+            [version + 1 for version in versions]
+        )
+
+    def test_user_bumps_catalog_only_for_author_fields(self):
+        user = User.objects.create_user(
+            username='author', email='author@foodgram.ru',
+            first_name='Имя', last_name='Фамилия', password='pass12345!'
+        )
+        catalog = get_version('catalog')
+        user.set_password('other12345!')
+        user.feed_fanout_on_read = True
+        user.save()
+        user.save(update_fields=['first_name'])
+        self.assertEqual(get_version('catalog'), catalog)
+        user.first_name = 'Пётр'
+        user.save()
+        self.assertEqual(get_version('catalog'), catalog + 1)
+        user.last_name = 'Петров'
+        user.save(update_fields=['password'])
+        self.assertEqual(get_version('catalog'), catalog + 1)
+        user.save(update_fields=['last_name'])
+        self.assertEqual(get_version('catalog'), catalog + 2)
@@ -1,8 +1,9 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from .views import (IngredientsViewSet, RecipesViewSet, SubscribeView,
-                    SubscriptionViewSet, TagsViewSet)
+from .views import (FeedView, IngredientsViewSet, RecipesViewSet,
+                    SubscribeView, SubscriptionViewSet, TagsViewSet,
+                    UsersViewSet)
 
 app_name = 'api'
 
@@ -13,11 +14,17 @@ router.register('recipes', RecipesViewSet)
 
 users_urls = [
     path('subscriptions/', SubscriptionViewSet.as_view()),
+    path('subscriptions/feed/', FeedView.as_view()),
     path('<int:pk>/subscribe/', SubscribeView.as_view())
 ]
 
+# Вместо djoser.urls: тот же UserViewSet с суженным запросом. Маршруты
+# users/<id>/ идут после users/subscriptions/.
+users_router = DefaultRouter()
+users_router.register('users', UsersViewSet)
+
 djoser_urls = [
-    path('', include('djoser.urls')),
+    path('', include(users_router.urls)),
     path('auth/', include('djoser.urls.authtoken')),
 ]
 
@@ -1,16 +1,216 @@
-from django.http import HttpResponse
+import csv
+import zlib
 
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from PIL import Image, ImageDraw, ImageFont
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.renderers import BaseRenderer
 
-def convert_txt(ingredients):
-    file_name = 'shopping_list.txt'
+FILE_NAME = 'shopping_list'
+CHUNK_ROWS = 500
+ITERATOR_CHUNK_SIZE = 2000
+
+PAGE_SIZE = (827, 1169)
+PAGE_MARGIN = 60
+FONT_SIZE = 18
+POINTS_PER_PIXEL = 72 / 100
+
+
+class ExportRenderer(BaseRenderer):
+    """Рендерер-заглушка: ответ экспорта формируется во вьюхе.
+
+    Нужен, чтобы DRF принимал ?format=txt|csv|pdf при согласовании
+    контента.
+    """
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return data
+
+
+class TextRenderer(ExportRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+
+class CSVRenderer(ExportRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class PDFRenderer(ExportRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
+
+
+def iter_rows(ingredients):
+    for ing in ingredients.iterator(chunk_size=ITERATOR_CHUNK_SIZE):
+        yield (
+            ing['ingredient__name'],
+            ing['ingredient__measurement_unit'],
+            ing['ingredient_total'],
+        )
+
+
+def iter_txt(rows):
     lines = []
-    for ing in ingredients:
-        name = ing['ingredient__name']
-        measurement_unit = ing['ingredient__measurement_unit']
-        amount = ing['ingredient_total']
-        lines.append(f'{name} ({measurement_unit}) - {amount}')
-    content = '\n'.join(lines)
-    content_type = 'text/plain,charset=utf8'
-    response = HttpResponse(content, content_type=content_type)
-    response['Content-Disposition'] = f'attachment; filename={file_name}'
+    for name, measurement_unit, amount in rows:
+        lines.append(f'{name} ({measurement_unit}) - {amount}\n')
+        if len(lines) >= CHUNK_ROWS:
+            yield ''.join(lines).encode()
+            lines = []
+    if lines:
+        yield ''.join(lines).encode()
+
+
+class Echo:
+    """Буфер для csv.writer, который возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(rows):
+    writer = csv.writer(Echo())
+    lines = [writer.writerow(('Ингредиент', 'Ед. изм.', 'Количество'))]
+    for row in rows:
+        lines.append(writer.writerow(row))
+        if len(lines) >= CHUNK_ROWS:
+            yield ''.join(lines).encode()
+            lines = []
+    if lines:
+        yield ''.join(lines).encode()
+
+
+class FontUnavailable(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Выгрузка в PDF временно недоступна.'
+    default_code = 'font_unavailable'
+
+
+def get_font():
+    """Шрифт с кириллицей; встроенный шрифт Pillow её не содержит.
+
+    Загружается до начала ответа: ошибка посреди потока оборвала бы
+    уже отданный файл.
+    """
+    try:
+        return ImageFont.truetype(settings.SHOPPING_LIST_FONT, FONT_SIZE)
+    except OSError:
+        raise FontUnavailable
+
+
+def iter_pages(rows, font):
+    """Рисует страницы списка покупок по одной."""
+    left, top, right, bottom = font.getbbox('Ag')
+    line_height = int((bottom - top) * 1.6)
+    lines_per_page = (PAGE_SIZE[1] - 2 * PAGE_MARGIN) // line_height
+    page = draw = None
+    line = 0
+    lines = (
+        f'• {name} ({measurement_unit}) - {amount}'
+        for name, measurement_unit, amount in rows
+    )
+    for text in lines:
+        if page is None:
+            page = Image.new('L', PAGE_SIZE, 255)
+            draw = ImageDraw.Draw(page)
+            line = 0
+        draw.text(
+            (PAGE_MARGIN, PAGE_MARGIN + line * line_height),
+            text, fill=0, font=font
+        )
+        line += 1
+        if line == lines_per_page:
+            yield page
+            page = None
+    if page is not None:
+        yield page
+    elif not line:
+        yield Image.new('L', PAGE_SIZE, 255)
+
+
+def iter_pdf(rows, font):
+    """Пишет PDF постранично: в памяти одна страница и таблица смещений.
+
+    Объект 1 - каталог, 2 - дерево страниц, которое записывается
+    последним, когда известен список страниц.
+    """
+    offsets = {}
+    position = 0
+    width = PAGE_SIZE[0] * POINTS_PER_PIXEL
+    height = PAGE_SIZE[1] * POINTS_PER_PIXEL
+
+    def write_object(number, body):
+        nonlocal position
+        offsets[number] = position
+        data = b'%d 0 obj\n' % number + body + b'\nendobj\n'
+        position += len(data)
+        return data
+
+    def stream(dictionary, data):
+        return (
+            b'<< ' + dictionary + b' /Length %d >>\nstream\n' % len(data)
+            + data + b'\nendstream'
+        )
+
+    header = b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n'
+    position += len(header)
+    yield header
+    yield write_object(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+    page_ids = []
+    number = 3
+    for page in iter_pages(rows, font):
+        image_id, content_id, page_id = number, number + 1, number + 2
+        number += 3
+        image = stream(
+            b'/Type /XObject /Subtype /Image /Width %d /Height %d '
+            b'/ColorSpace /DeviceGray /BitsPerComponent 8 '
+            b'/Filter /FlateDecode' % page.size,
+            zlib.compress(page.tobytes())
+        )
+        content = b'q %.2f 0 0 %.2f 0 0 cm /Im Do Q' % (width, height)
+        yield write_object(image_id, image)
+        yield write_object(content_id, stream(b'', content))
+        yield write_object(page_id, (
+            b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %.2f %.2f] '
+            b'/Resources << /XObject << /Im %d 0 R >> >> /Contents %d 0 R >>'
+            % (width, height, image_id, content_id)
+        ))
+        page_ids.append(page_id)
+    kids = b' '.join(b'%d 0 R' % page_id for page_id in page_ids)
+    yield write_object(2, b'<< /Type /Pages /Kids [%s] /Count %d >>' % (
+        kids, len(page_ids)
+    ))
+    xref = [b'xref\n0 %d\n' % number, b'0000000000 65535 f \n']
+    xref.extend(b'%010d 00000 n \n' % offsets[obj] for obj in range(1, number))
+    yield b''.join(xref) + (
+        b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n'
+        % (number, position)
+    )
+
+
+EXPORTERS = {
+    'txt': (iter_txt, 'text/plain; charset=utf-8'),
+    'csv': (iter_csv, 'text/csv; charset=utf-8'),
+    'pdf': (iter_pdf, 'application/pdf'),
+}
+
+
+def export_shopping_list(ingredients, file_format='txt'):
+    """Отдаёт список покупок потоком, читая агрегацию курсором."""
+    if file_format not in EXPORTERS:
+        file_format = 'txt'
+    exporter, content_type = EXPORTERS[file_format]
+    rows = iter_rows(ingredients)
+    content = (
+        iter_pdf(rows, get_font()) if file_format == 'pdf'
+        else exporter(rows)
+    )
+    response = StreamingHttpResponse(content, content_type=content_type)
+    response['Content-Disposition'] = (
+        f'attachment; filename={FILE_NAME}.{file_format}'
+    )
     return response
@@ -0,0 +1,76 @@
+import time
+from datetime import datetime, timezone
+
+from django.core.cache import caches
+from django.db import transaction
+from django.views.decorators.http import condition
+
+VERSION_TIMEOUT = None
+
+cache = caches['shared']
+
+
+def get_version(name):
+    """Текущая версия набора данных, например 'recipes'.
+
+    Начальное значение - время первого обращения, чтобы после очистки
+    кеша версия не повторила уже выданную.
+    """
+    key = f'version:{name}'
+    version = cache.get(key)
+    if version is None:
+        version = int(time.time() * 1000)
+        if not cache.add(key, version, VERSION_TIMEOUT):
+            version = cache.get(key, version)
+    return version
+
+
+def get_modified(name):
+    """Время последнего изменения набора данных."""
+    key = f'modified:{name}'
+    modified = cache.get(key)
+    if modified is None:
+        modified = time.time()
+        if not cache.add(key, modified, VERSION_TIMEOUT):
+            modified = cache.get(key, modified)
+    return datetime.fromtimestamp(modified, tz=timezone.utc)
+
+
+def bump_version(name):
+    """Сдвигает версию набора данных после фиксации транзакции.
+
+    Сдвиг до COMMIT дал бы другому запросу прочитать старые данные и
+    закешировать их под новой версией, а после отката версия сдвинулась
+    бы зря. Вне транзакции версия сдвигается сразу.
+    """
+    transaction.on_commit(lambda: _bump_version(name))
+
+
+def _bump_version(name):
+    cache.set(f'modified:{name}', time.time(), VERSION_TIMEOUT)
+    key = f'version:{name}'
+    try:
+        return cache.incr(key)
+    except ValueError:
+        get_version(name)
+        return cache.incr(key)
+
+
+def versioned(name):
+    """Условный GET (ETag и Last-Modified) по версии набора данных.
+
+    Заголовки считаются без обращения к таблицам, при совпадении
+    версии отдаётся 304 Not Modified. Такие вьюхи не читают с реплик
+    (replica_reads): ответ отставшей реплики клиент закешировал бы
+    под новой версией.
+    """
+    def etag(request, *args, **kwargs):
+        renderer = getattr(request, 'accepted_renderer', None)
+        return '{}-{}-{}'.format(
+            name, get_version(name), getattr(renderer, 'format', '')
+        )
+
+    def last_modified(request, *args, **kwargs):
+        return get_modified(name)
+
+    return condition(etag_func=etag, last_modified_func=last_modified)
@@ -1,27 +1,100 @@
-from django.db.models import Sum
+from django.conf import settings
+from django.db import transaction
+from django.db.models import BooleanField, Exists, F, OuterRef, Value
+from django.http import Http404
 from django.shortcuts import get_object_or_404
+from django.utils.decorators import method_decorator
 from django_filters.rest_framework import DjangoFilterBackend
-from recipes.models import (Favorite, IngredientInRecipe, Ingredients, Recipes,
-                            ShoppingCart, Subscriptions, Tags)
+from djoser.views import UserViewSet
+from recipes.models import (CartIngredient, Favorite, FeedItem, Ingredients,
+                            Recipes, ShoppingCart, Subscriptions, Tags)
+from recipes.similar import similar_recipe_ids
 from rest_framework import generics, permissions, status, views, viewsets
 from rest_framework.decorators import action
 from rest_framework.exceptions import PermissionDenied
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from users.models import User
 
-from .filters import IngredientsFilter, RecipeFilter
-from .paginations import CustomPagination
+from .authentication import token_cache
+from .caching import anonymous_page_key, get_or_compute
+from .filters import IngredientsFilter, RecipeFilter, RecipeOrderingFilter
+from .paginations import (CustomPagination, FeedPagination, RecipesPagination,
+                          SubscriptionsPagination)
 from .permissions import IsOwnerOrReadOnly
+from .search import MAX_SEARCH_LIMIT, SEARCH_LIMIT, ingredient_index
+from .serializers.fast import FastRecipesListSerializer, FastUserSerializer
 from .serializers.serializers_recipes import (AddUpdateRecipesSerializer,
                                               IngredientsSerializer,
+                                              RecipeIdsSerializer,
                                               RecipesListSerializer,
                                               ShortRecipeSerializer,
                                               TagsSerializer)
 from .serializers.serializers_users import (SubscribeSerializer,
-                                            SubscriptionSerializer)
-from .utils import convert_txt
+                                            SubscriptionSerializer,
+                                            get_authors_recipes,
+                                            get_recipes_limit)
+from .utils import (CSVRenderer, ExportRenderer, PDFRenderer, TextRenderer,
+                    export_shopping_list)
+from .versions import bump_version, versioned
 
+ADDED = 'added'
+ALREADY_ADDED = 'already_added'
+REMOVED = 'removed'
+NOT_IN_LIST = 'not_in_list'
+NOT_FOUND = 'not_found'
+# Колонки рецепта, нужные полям RecipesListSerializer.
+RECIPE_COLUMNS = {
+    'author': ('author',),
+    'name': ('name',),
+    'image': ('image',),
+    'images': ('image', 'image_derivatives_ready'),
+    'text': ('text',),
+    'cooking_time': ('cooking_time',),
+}
+USER_COLUMNS = ('email', 'username', 'first_name', 'last_name')
 
+
+def recipes_for_request(request):
+    """Рецепты для RecipesListSerializer без колонок, связей и флагов,
+    которые клиент не запросил (?fields=, ?omit=)."""
+    fields = RecipesListSerializer.selected_fields(request)
+    columns = {'id', 'pub_date'}
+    for field in fields:
+        columns.update(RECIPE_COLUMNS.get(field, ()))
+    return Recipes.objects.with_related(
+        author='author' in fields,
+        tags='tags' in fields,
+        ingredients='ingredients' in fields,
+    ).with_user_flags(
+        request.user,
+        is_favorited='is_favorited' in fields,
+        is_in_shopping_cart='is_in_shopping_cart' in fields,
+    ).only(*columns)
+
+
+class FastListMixin:
+    """list() через быстрый сериализатор из .values(), если он задан.
+
+    fast_serializer_class = None возвращает обычный путь через DRF.
+    """
+    fast_serializer_class = None
+
+    def list(self, request, *args, **kwargs):
+        if self.fast_serializer_class is None:
+            return super().list(request, *args, **kwargs)
+        serializer = self.fast_serializer_class(self.get_serializer_context())
+        rows = serializer.values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        if page is None:
+            return Response(serializer.to_representation(list(rows)))
+        return self.get_paginated_response(
+            serializer.to_representation(page)
+        )
+
+
+@method_decorator(versioned('tags'), name='list')
+@method_decorator(versioned('tags'), name='retrieve')
 class TagsViewSet(viewsets.ReadOnlyModelViewSet):
     """Вьюсет для  тегов: ReadOnly."""
     queryset = Tags.objects.all()
@@ -30,8 +103,12 @@ class TagsViewSet(viewsets.ReadOnlyModelViewSet):
     pagination_class = None
 
 
+@method_decorator(versioned('ingredients'), name='list')
+@method_decorator(versioned('ingredients'), name='retrieve')
 class IngredientsViewSet(viewsets.ReadOnlyModelViewSet):
-    """Вьюсет для  рецептов: ReadOnly."""
+    """Вьюсет для  рецептов: ReadOnly.
+       Поиск по name идёт через индекс в памяти, без запросов к БД.
+    """
     queryset = Ingredients.objects.all()
     serializer_class = IngredientsSerializer
     permission_classes = (permissions.AllowAny, )
@@ -39,24 +116,75 @@ class IngredientsViewSet(viewsets.ReadOnlyModelViewSet):
     filterset_class = IngredientsFilter
     pagination_class = None
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if not name:
+            return super().list(request, *args, **kwargs)
+        try:
+            limit = int(request.query_params.get('limit', SEARCH_LIMIT))
+        except ValueError:
+            limit = SEARCH_LIMIT
+        limit = min(max(limit, 1), MAX_SEARCH_LIMIT)
+        return Response(ingredient_index.search(name, limit))
 
-class RecipesViewSet(viewsets.ModelViewSet):
+
+class RecipesViewSet(FastListMixin, viewsets.ModelViewSet):
     """Вьюсет для  рецептов.
        Action-функционал: избранное и список покупок.
     """
     queryset = Recipes.objects.all()
-    filter_backends = (DjangoFilterBackend,)
+    filter_backends = (DjangoFilterBackend, RecipeOrderingFilter)
     filterset_class = RecipeFilter
-    pagination_class = CustomPagination
+    ordering_fields = ('pub_date', 'favorites_count', 'in_carts_count')
+    ordering = ('-pub_date', 'id')
+    pagination_class = RecipesPagination
     permission_classes = (IsOwnerOrReadOnly,)
+    fast_serializer_class = FastRecipesListSerializer
+    replica_reads = True
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        # Ошибку выгрузки списка покупок не отрисовать в формате файла.
+        if getattr(response, 'exception', False) and isinstance(
+            getattr(request, 'accepted_renderer', None), ExportRenderer
+        ):
+            request.accepted_renderer = JSONRenderer()
+            request.accepted_media_type = JSONRenderer.media_type
+        return super().finalize_response(request, response, *args, **kwargs)
+
+    def get_queryset(self):
+        if self.action in ('list', 'retrieve', 'similar', 'read_batch'):
+            return recipes_for_request(self.request)
+        return Recipes.objects.with_related().with_user_flags(
+            self.request.user
+        )
+
+    def list(self, request, *args, **kwargs):
+        """Страницы для анонимов одинаковы для всех и берутся из кеша.
+
+        С параметром ids=1,5,9 отдаёт эти рецепты в заданном порядке.
+        """
+        if 'ids' in request.query_params:
+            return self._read_batch({'ids': [
+                pk for pk in request.query_params['ids'].split(',') if pk
+            ]})
+        if not request.user.is_anonymous:
+            return super().list(request, *args, **kwargs)
+        build_page = super().list
+        data = get_or_compute(
+            anonymous_page_key(request),
+            lambda: build_page(request, *args, **kwargs).data
+        )
+        return Response(data)
 
     def get_serializer_class(self):
         if self.action in ('list', 'retrieve'):
             return RecipesListSerializer
         return AddUpdateRecipesSerializer
 
+    @transaction.atomic
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        recipe = serializer.save(author=self.request.user)
+        FeedItem.objects.fan_out(recipe)
 
     def perform_update(self, serializer):
         serializer.save(author=self.request.user)
@@ -68,20 +196,96 @@ class RecipesViewSet(viewsets.ModelViewSet):
         self.perform_destroy(instance)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
-    def _add_recipe(self, model, request, pk):
+    @action(detail=True, methods=['get'])
+    def similar(self, request, pk):
+        """Рецепты с похожим составом и тегами."""
         recipe = get_object_or_404(Recipes, pk=pk)
-        user = self.request.user
-        model.objects.create(recipe=recipe, user=user)
-        serializer = ShortRecipeSerializer(recipe)
-        return Response(data=serializer.data, status=status.HTTP_201_CREATED)
+        similar_ids = similar_recipe_ids(
+            recipe.id, settings.SIMILAR_RECIPES_COUNT
+        )
+        recipes = self.get_queryset().in_bulk(similar_ids)
+        serializer = RecipesListSerializer(
+            [recipes[pk] for pk in similar_ids if pk in recipes],
+            many=True, context=self.get_serializer_context()
+        )
+        return Response(serializer.data)
+
+    def _add_recipes(self, model, recipe_ids):
+        """Добавляет рецепты в избранное или список покупок.
+
+        Возвращает статус по каждому id и найденные рецепты. Повторное
+        добавление не ошибка и счётчики не меняет.
+        """
+        recipes = Recipes.objects.in_bulk(recipe_ids)
+        added = model.objects.add(self.request.user, list(recipes))
+        if added:
+            bump_version('recipes')
+        statuses = {
+            pk: ADDED if pk in added else ALREADY_ADDED
+            for pk in recipes
+        }
+        return statuses, recipes
+
+    def _remove_recipes(self, model, recipe_ids):
+        """Убирает рецепты; отсутствующие - не ошибка."""
+        removed = model.objects.remove(self.request.user, recipe_ids)
+        return {
+            pk: REMOVED if pk in removed else NOT_IN_LIST
+            for pk in recipe_ids
+        }
+
+    def _read_batch(self, data):
+        serializer = RecipeIdsSerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = serializer.validated_data['ids']
+        recipes = self.get_queryset().in_bulk(recipe_ids)
+        return Response(RecipesListSerializer(
+            [recipes[pk] for pk in recipe_ids if pk in recipes],
+            many=True, context=self.get_serializer_context()
+        ).data)
+
+    @action(
+        detail=False, methods=('post',), url_path='batch',
+        permission_classes=(permissions.AllowAny,)
+    )
+    def read_batch(self, request):
+        """Рецепты по списку id из тела: {"ids": [1, 5, 9]}."""
+        return self._read_batch(request.data)
+
+    def _recipe_id(self, pk):
+        try:
+            return int(pk)
+        except ValueError:
+            raise Http404
+
+    def _add_recipe(self, model, request, pk):
+        statuses, recipes = self._add_recipes(model, [self._recipe_id(pk)])
+        if not recipes:
+            raise Http404
+        recipe, = recipes.values()
+        return Response(
+            data=ShortRecipeSerializer(recipe).data,
+            status=(status.HTTP_201_CREATED
+                    if statuses[recipe.pk] == ADDED else status.HTTP_200_OK)
+        )
 
     def _delete_recipe(self, model, request, pk):
-        recipe = get_object_or_404(Recipes, pk=pk)
-        user = self.request.user
-        obj = get_object_or_404(model, recipe=recipe, user=user)
-        obj.delete()
+        self._remove_recipes(model, [self._recipe_id(pk)])
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    def _batch(self, model, request):
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = list(dict.fromkeys(serializer.validated_data['ids']))
+        if request.method == 'POST':
+            statuses, recipes = self._add_recipes(model, recipe_ids)
+        else:
+            statuses = self._remove_recipes(model, recipe_ids)
+        return Response({'results': [
+            {'id': pk, 'status': statuses.get(pk, NOT_FOUND)}
+            for pk in recipe_ids
+        ]})
+
     @action(
         detail=True,
         methods=('post', 'delete'),
@@ -102,37 +306,123 @@ class RecipesViewSet(viewsets.ModelViewSet):
             return self._add_recipe(ShoppingCart, request, pk)
         return self._delete_recipe(ShoppingCart, request, pk)
 
+    @action(
+        detail=False,
+        methods=('post', 'delete'),
+        url_path='favorite',
+        permission_classes=(permissions.IsAuthenticated,)
+    )
+    def favorite_batch(self, request):
+        """Пакетное добавление и удаление: {"ids": [1, 2, 3]}."""
+        return self._batch(Favorite, request)
+
+    @action(
+        detail=False,
+        methods=('post', 'delete'),
+        url_path='shopping_cart',
+        permission_classes=(permissions.IsAuthenticated,)
+    )
+    def shopping_cart_batch(self, request):
+        """Пакетное добавление и удаление: {"ids": [1, 2, 3]}."""
+        return self._batch(ShoppingCart, request)
+
     @action(
         detail=False,
         methods=["GET"],
-        permission_classes=(IsOwnerOrReadOnly, ),
-        pagination_class=None
+        permission_classes=(permissions.IsAuthenticated, ),
+        pagination_class=None,
+        renderer_classes=(JSONRenderer, TextRenderer, CSVRenderer,
+                          PDFRenderer)
     )
     def download_shopping_cart(self, request):
-        ingredients = IngredientInRecipe.objects.filter(
-            recipe__shopping_cart__user=request.user
+        ingredients = CartIngredient.objects.filter(
+            user=request.user
         ).values(
-            'ingredient__name', 'ingredient__measurement_unit'
-        ).order_by(
-            'ingredient__name'
-        ).annotate(ingredient_total=Sum('amount'))
-        return convert_txt(ingredients)
+            'ingredient__name', 'ingredient__measurement_unit',
+            ingredient_total=F('amount')
+        ).order_by('ingredient__name')
+        return export_shopping_list(
+            ingredients, request.query_params.get('format', 'txt')
+        )
+
+
+class UsersViewSet(FastListMixin, UserViewSet):
+    """Юзеры djoser; список и профиль читают только выдаваемые колонки,
+    is_subscribed считается в том же запросе."""
+    fast_serializer_class = FastUserSerializer
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action not in ('list', 'retrieve'):
+            return queryset
+        fields = self.get_serializer_class().selected_fields(self.request)
+        queryset = queryset.only(
+            'id', *(column for column in USER_COLUMNS if column in fields)
+        )
+        if 'is_subscribed' not in fields:
+            return queryset
+        user = self.request.user
+        if user.is_anonymous:
+            return queryset.annotate(
+                is_subscribed=Value(False, BooleanField())
+            )
+        return queryset.annotate(is_subscribed=Exists(
+            Subscriptions.objects.filter(user=user, author=OuterRef('pk'))
+        ))
 
 
 class SubscriptionViewSet(generics.ListAPIView):
+    replica_reads = True
     serializer_class = SubscriptionSerializer
-    pagination_class = CustomPagination
+    pagination_class = SubscriptionsPagination
     permission_classes = (permissions.IsAuthenticated,)
 
     def get_queryset(self):
         user = self.request.user
-        return user.follower.all()
+        return user.follower.select_related('author').order_by('-id')
+
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.get_queryset())
+        context = self.get_serializer_context()
+        if 'recipes' in SubscriptionSerializer.selected_fields(request):
+            context.update(get_authors_recipes(
+                [subscription.author_id for subscription in page],
+                get_recipes_limit(request)
+            ))
+        serializer = self.get_serializer_class()(
+            page, many=True, context=context
+        )
+        return self.get_paginated_response(serializer.data)
+
+
+class FeedView(generics.ListAPIView):
+    """Лента рецептов авторов из подписок, новые первыми."""
+    replica_reads = True
+    serializer_class = RecipesListSerializer
+    pagination_class = FeedPagination
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def get_queryset(self):
+        return self.get_timeline(None)
+
+    def get_timeline(self, before):
+        return FeedItem.objects.timeline(self.request.user, before)
+
+    def list(self, request, *args, **kwargs):
+        page = self.paginator.paginate_timeline(self.get_timeline, request)
+        recipe_ids = [row['recipe_id'] for row in page]
+        recipes = recipes_for_request(request).in_bulk(recipe_ids)
+        serializer = self.get_serializer(
+            [recipes[pk] for pk in recipe_ids if pk in recipes], many=True
+        )
+        return self.get_paginated_response(serializer.data)
 
 
 class SubscribeView(views.APIView):
     pagination_class = CustomPagination
     permission_classes = (permissions.IsAuthenticated,)
 
+    @transaction.atomic
     def post(self, request, pk):
         author = get_object_or_404(User, pk=pk)
         user = self.request.user
@@ -142,8 +432,17 @@ class SubscribeView(views.APIView):
         )
         serializer.is_valid(raise_exception=True)
         serializer.save()
+        # Счётчик в базе увеличил сигнал, здесь - копия для проверки.
+        author.followers_count += 1
+        if FeedItem.objects.switch_to_read(author):
+            # update() не шлёт сигналов: автор в кеше токенов устарел.
+            transaction.on_commit(
+                lambda: token_cache.forget_user(author.pk)
+            )
+        FeedItem.objects.backfill(user, author)
         return Response(data=serializer.data, status=status.HTTP_201_CREATED)
 
+    @transaction.atomic
     def delete(self, request, pk):
         author = get_object_or_404(User, pk=pk)
         user = self.request.user
@@ -151,4 +450,5 @@ class SubscribeView(views.APIView):
             Subscriptions, user=user, author=author
         )
         subscription.delete()
+        FeedItem.objects.trim(user, author)
         return Response(status=status.HTTP_204_NO_CONTENT)
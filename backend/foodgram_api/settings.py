@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 from dotenv import load_dotenv
 
@@ -37,6 +38,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'api.replicas.ReplicaMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -61,6 +63,8 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'foodgram_api.wsgi.application'
 
+# Полнотекстовый поиск рецептов (recipes/search.py) на SQLite идёт через
+# FTS5, на PostgreSQL - через tsvector с русской морфологией.
 if DEBUG:
     DATABASES = {
         'default': {
@@ -80,6 +84,51 @@ else:
         }
     }
 
+# Реплики только для чтения (api/replicas.py): DB_REPLICAS="хост:вес,...".
+# Для проверки на SQLite SQLITE_REPLICAS=N заводит N подключений
+# к тому же файлу базы.
+DATABASE_REPLICAS = {}
+if DEBUG:
+    replicas = [('', 1)] * int(os.getenv('SQLITE_REPLICAS', 0))
+else:
+    replicas = [
+        (host, int(weight or 1))
+        for host, _, weight in (
+            replica.partition(':')
+            for replica in os.getenv('DB_REPLICAS', '').split(',') if replica
+        )
+    ]
+for number, (host, weight) in enumerate(replicas, 1):
+    alias = f'replica_{number}'
+    DATABASES[alias] = dict(DATABASES['default'], TEST={'MIRROR': 'default'})
+    if host:
+        DATABASES[alias]['HOST'] = host
+    DATABASE_REPLICAS[alias] = weight
+
+DATABASE_ROUTERS = ['api.replicas.ReplicaRouter']
+# После записи клиент столько секунд читает с основной базы.
+REPLICA_PIN_SECONDS = 5
+REPLICA_RETRY_SECONDS = 30
+
+# Общий кеш воркеров: страницы, версии данных, блокировки заполнения.
+# В продакшене нужен бэкенд с атомарными add() и incr() (Redis,
+# Memcached), см. проверку api.W001.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': os.getenv(
+            'SHARED_CACHE_BACKEND',
+            'django.core.cache.backends.filebased.FileBasedCache'
+        ),
+        'LOCATION': os.getenv(
+            'SHARED_CACHE_LOCATION',
+            os.path.join(tempfile.gettempdir(), 'foodgram_cache')
+        ),
+    },
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -106,7 +155,7 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 6,
@@ -135,6 +184,29 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Авторы с большим числом подписчиков не раскладывают рецепты по лентам,
+# а подмешиваются в ленту при чтении.
+FEED_FANOUT_MAX_FOLLOWERS = 5000
+FEED_BACKFILL_RECIPES = 200
+
+SIMILAR_RECIPES_COUNT = 12
+
+# Кеш проверенных токенов (api/authentication.py): до TOKEN_CACHE_SIZE
+# записей в процессе, в общем кеше - TOKEN_CACHE_TIMEOUT секунд.
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', 10000))
+TOKEN_CACHE_TIMEOUT = int(os.getenv('TOKEN_CACHE_TIMEOUT', 300))
+TOKEN_CACHE_SHARED = os.getenv('TOKEN_CACHE_SHARED', 'True') == 'True'
+
+RECIPE_IMAGE_MAX_UPLOAD_SIZE = int(
+    os.getenv('RECIPE_IMAGE_MAX_UPLOAD_SIZE', 5 * 1024 * 1024)
+)
+RECIPE_IMAGE_MAX_PIXELS = 40_000_000
+RECIPE_IMAGE_WIDTHS = (320, 640, 1280)
+
+SHOPPING_LIST_FONT = os.getenv(
+    'SHOPPING_LIST_FONT', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
 DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
 
 LANGUAGE_CODE = 'ru-ru'
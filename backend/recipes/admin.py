@@ -1,7 +1,10 @@
 from django.contrib import admin
+from django.db import transaction
+from users.models import User
 
-from .models import (Favorite, IngredientInRecipe, Ingredients, Recipes,
-                     RecipeTags, ShoppingCart, Subscriptions, Tags)
+from .models import (CartIngredient, Favorite, IngredientInRecipe, Ingredients,
+                     Recipes, RecipeTags, ShoppingCart, Subscriptions, Tags)
+from .search import index_recipes
 
 
 class QuantityInline(admin.TabularInline):
@@ -16,8 +19,35 @@ class TagsInline(admin.TabularInline):
     extra = 0
 
 
+class UserRecipeListAdmin(admin.ModelAdmin):
+    """Избранное и списки покупок пишутся через менеджер модели:
+    вместе со строкой меняются счётчики рецепта и сводный список
+    покупок. Строку можно добавить или удалить, но не изменить."""
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def save_model(self, request, obj, form, change):
+        self.model.objects.add(obj.user, [obj.recipe_id])
+        obj.pk = self.model.objects.get(
+            user=obj.user, recipe_id=obj.recipe_id
+        ).pk
+
+    def delete_model(self, request, obj):
+        self.model.objects.remove(obj.user, [obj.recipe_id])
+
+    @transaction.atomic
+    def delete_queryset(self, request, queryset):
+        recipe_ids = {}
+        for user_id, recipe_id in queryset.values_list('user', 'recipe'):
+            recipe_ids.setdefault(user_id, []).append(recipe_id)
+        for user in User.objects.filter(pk__in=recipe_ids):
+            self.model.objects.remove(user, recipe_ids[user.pk])
+
+
 @admin.register(IngredientInRecipe)
 class IngredientInRecipeAdmin(admin.ModelAdmin):
+    """Изменения состава переносятся в сводные списки покупок."""
     list_display = (
         'pk',
         'ingredient',
@@ -26,6 +56,25 @@ class IngredientInRecipeAdmin(admin.ModelAdmin):
     )
     search_fields = ('recipe__name', 'ingredient__name')
 
+    def save_model(self, request, obj, form, change):
+        recipe_ids = {obj.recipe_id}
+        if change:
+            recipe_ids.update(IngredientInRecipe.objects.filter(
+                pk=obj.pk
+            ).values_list('recipe_id', flat=True))
+        with CartIngredient.objects.recipe_changes(recipe_ids):
+            super().save_model(request, obj, form, change)
+
+    def delete_model(self, request, obj):
+        with CartIngredient.objects.recipe_changes([obj.recipe_id]):
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        with CartIngredient.objects.recipe_changes(
+            queryset.values_list('recipe_id', flat=True)
+        ):
+            super().delete_queryset(request, queryset)
+
 
 @admin.register(Ingredients)
 class IngredientsAdmin(admin.ModelAdmin):
@@ -52,6 +101,7 @@ class RecipesAdmin(admin.ModelAdmin):
         'name',
         'author',
         'display_tags',
+        'favorites_count',
     )
     list_filter = ('name', 'author', 'tags')
     search_fields = (
@@ -59,10 +109,20 @@ class RecipesAdmin(admin.ModelAdmin):
         'author__username',
         'author__email'
     )
-    readonly_fields = ('is_favorited',)
+    readonly_fields = ('is_favorited', 'image_derivatives_ready')
+
+    def save_model(self, request, obj, form, change):
+        if 'image' in form.changed_data:
+            obj.image_derivatives_ready = False
+        super().save_model(request, obj, form, change)
+
+    def save_related(self, request, form, formsets, change):
+        with CartIngredient.objects.recipe_changes([form.instance.id]):
+            super().save_related(request, form, formsets, change)
+        index_recipes([form.instance.id])
 
     def is_favorited(self, obj):
-        return obj.favorite.count()
+        return obj.favorites_count
     is_favorited.short_description = 'Раз в избранном'
 
     def display_tags(self, obj):
@@ -71,18 +131,25 @@ class RecipesAdmin(admin.ModelAdmin):
 
 
 @admin.register(Favorite)
-class FavoriteAdmin(admin.ModelAdmin):
+class FavoriteAdmin(UserRecipeListAdmin):
     list_display = ('pk', 'user', 'recipe')
     search_fields = ('user', 'recipe', )
     empty_value_display = '-пусто-'
 
 
 @admin.register(ShoppingCart)
-class ShoppingCartAdmin(admin.ModelAdmin):
+class ShoppingCartAdmin(UserRecipeListAdmin):
     list_display = ('user', 'recipe')
     search_fields = ('user', 'recipe', )
 
 
+@admin.register(CartIngredient)
+class CartIngredientAdmin(admin.ModelAdmin):
+    list_display = ('user', 'ingredient', 'amount')
+    search_fields = ('user__username', 'ingredient__name')
+    readonly_fields = ('user', 'ingredient', 'amount')
+
+
 @admin.register(Subscriptions)
 class SubscriptionAdmin(admin.ModelAdmin):
     list_display = ('pk', 'user', 'author')
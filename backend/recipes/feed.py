@@ -0,0 +1,51 @@
+from django.apps import apps as global_apps
+from django.conf import settings
+
+
+def rebuild_feeds(apps=global_apps, batch_size=5000):
+    """Пересобирает ленты подписок с нуля, возвращает число строк.
+
+    Флаг feed_fanout_on_read выставляется заново по числу подписчиков;
+    в ленты попадают последние FEED_BACKFILL_RECIPES рецептов каждого
+    из остальных авторов.
+    """
+    user_model = apps.get_model('users', 'User')
+    recipes = apps.get_model('recipes', 'Recipes')
+    subscriptions = apps.get_model('recipes', 'Subscriptions')
+    feed_item = apps.get_model('recipes', 'FeedItem')
+
+    limit = settings.FEED_FANOUT_MAX_FOLLOWERS
+    user_model.objects.filter(followers_count__gt=limit).update(
+        feed_fanout_on_read=True
+    )
+    user_model.objects.filter(followers_count__lte=limit).update(
+        feed_fanout_on_read=False
+    )
+    feed_item.objects.all().delete()
+
+    rows = []
+    total = 0
+    author_id = latest = None
+    for user_id, subscription_author_id in subscriptions.objects.filter(
+        author__feed_fanout_on_read=False
+    ).order_by('author_id').values_list('user_id', 'author_id').iterator():
+        if subscription_author_id != author_id:
+            author_id = subscription_author_id
+            latest = list(recipes.objects.filter(
+                author_id=author_id
+            ).order_by('-pub_date', '-id').values_list(
+                'id', 'pub_date'
+            )[:settings.FEED_BACKFILL_RECIPES])
+        rows.extend(
+            feed_item(
+                user_id=user_id, recipe_id=recipe_id,
+                author_id=author_id, pub_date=pub_date
+            )
+            for recipe_id, pub_date in latest
+        )
+        if len(rows) >= batch_size:
+            feed_item.objects.bulk_create(rows)
+            total += len(rows)
+            rows = []
+    feed_item.objects.bulk_create(rows)
+    return total + len(rows)
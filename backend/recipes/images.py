@@ -0,0 +1,73 @@
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image
+
+DERIVATIVES_DIR = 'derivatives'
+THUMBNAIL_WIDTH = 320
+
+
+def derivative_name(image_name, width, ext):
+    """Имя производного файла, например recipes/derivatives/pie_640.webp."""
+    directory, filename = os.path.split(image_name)
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(directory, DERIVATIVES_DIR, f'{stem}_{width}.{ext}')
+
+
+def derivative_names(image_name):
+    names = {'thumbnail': derivative_name(image_name, THUMBNAIL_WIDTH, 'jpg')}
+    names['webp'] = {
+        str(width): derivative_name(image_name, width, 'webp')
+        for width in settings.RECIPE_IMAGE_WIDTHS
+    }
+    return names
+
+
+def open_bounded(file, width):
+    """Открывает картинку, декодируя JPEG сразу в уменьшенном размере."""
+    image = Image.open(file)
+    if image.width * image.height > settings.RECIPE_IMAGE_MAX_PIXELS:
+        raise ValueError(f'Слишком большое изображение: {image.size}')
+    image.draft('RGB', (width, width * image.height // image.width))
+    return image.convert('RGB')
+
+
+def resized(image, width):
+    if image.width <= width:
+        return image
+    height = max(1, round(image.height * width / image.width))
+    return image.resize((width, height), Image.LANCZOS, reducing_gap=3.0)
+
+
+def save_image(image, name, format, **params):
+    buffer = BytesIO()
+    image.save(buffer, format, **params)
+    if default_storage.exists(name):
+        default_storage.delete(name)
+    default_storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def make_derivatives(image_name):
+    """Создаёт WebP нескольких ширин и JPEG-миниатюру.
+
+    Вызывается в процессе-воркере команды process-images и не
+    обращается к базе данных.
+    """
+    widths = sorted(settings.RECIPE_IMAGE_WIDTHS, reverse=True)
+    with default_storage.open(image_name) as file:
+        image = open_bounded(file, widths[0])
+    for width in widths:
+        image = resized(image, width)
+        save_image(
+            image, derivative_name(image_name, width, 'webp'), 'WEBP',
+            quality=80, method=4
+        )
+    save_image(
+        resized(image, THUMBNAIL_WIDTH),
+        derivative_name(image_name, THUMBNAIL_WIDTH, 'jpg'), 'JPEG',
+        quality=80, optimize=True, progressive=True
+    )
+    return image_name
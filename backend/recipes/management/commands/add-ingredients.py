@@ -1,32 +1,113 @@
 import csv
+import json
 import os
 
 from django.conf import settings
-from django.core.management import BaseCommand
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
 from recipes.models import Ingredients
+from recipes.signals import data_changed
+
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if row:
+            yield row[0], row[1]
+
+
+def read_json(file):
+    """Читает JSON-массив объектов по одному, не загружая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    started = False
+    while True:
+        chunk = file.read(READ_CHUNK_SIZE)
+        buffer = buffer[position:] + chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if not started and buffer[position:position + 1] == '[':
+                started = True
+                position += 1
+                continue
+            if buffer[position:position + 1] in (']', ''):
+                break
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except ValueError:
+                if not chunk:
+                    raise CommandError('Некорректный JSON')
+                break
+            yield item['name'], item['measurement_unit']
+        if not chunk or buffer[position:position + 1] == ']':
+            return
+
+
+READERS = {'.csv': read_csv, '.json': read_json}
 
 
 class Command(BaseCommand):
-    help = 'Загрузка из csv файла'
+    help = 'Загрузка ингредиентов из csv или json файла'
 
     def add_arguments(self, parser):
         parser.add_argument('filename', default='ingredients.csv', nargs='?',
                             type=str)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только посчитать, что будет загружено')
 
     def handle(self, *args, **options):
+        path = os.path.join(settings.BASE_DIR, 'data', options['filename'])
+        reader = READERS.get(os.path.splitext(path)[1].lower())
+        if reader is None:
+            raise CommandError('Поддерживаются только файлы .csv и .json')
+
+        existing = set(
+            Ingredients.objects.values_list('name', 'measurement_unit')
+        )
+        seen = set()
+        total = duplicates = skipped = pending = 0
+        batch = []
+        with open(path, 'r', encoding='utf-8') as f, transaction.atomic():
+            count_before = Ingredients.objects.count()
+            for name, measurement_unit in reader(f):
+                total += 1
+                key = (name.strip(), measurement_unit.strip())
+                if key in seen:
+                    duplicates += 1
+                    continue
+                seen.add(key)
+                if key in existing:
+                    skipped += 1
+                    continue
+                pending += 1
+                batch.append(Ingredients(
+                    name=key[0], measurement_unit=key[1]
+                ))
+                if len(batch) >= options['batch_size']:
+                    self.write(batch, options['dry_run'])
+            self.write(batch, options['dry_run'])
+            inserted = pending
+            if not options['dry_run']:
+                inserted = Ingredients.objects.count() - count_before
+                skipped += pending - inserted
+        if inserted and not options['dry_run']:
+            data_changed.send(
+                sender=self.__class__, names=('ingredients', 'catalog')
+            )
+
+        prefix = 'Dry run: ' if options['dry_run'] else ''
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefix}строк {total}, добавлено {inserted}, '
+            f'уже были в базе {skipped}, повторов в файле {duplicates}'
+        ))
 
-        with open(os.path.join(
-                settings.BASE_DIR,
-                'data',
-                options['filename']),
-                'r',
-                encoding='utf-8') as f:
-            data = csv.reader(f)
-            for row in data:
-                name, measurement_unit = row
-                Ingredients.objects.get_or_create(
-                    name=name,
-                    measurement_unit=measurement_unit,
-                )
-
-        self.stdout.write(self.style.SUCCESS('Все ингридиенты загружены!'))
+    def write(self, batch, dry_run):
+        """Пишет пачку; строки, добавленные параллельно, пропускаются."""
+        if batch and not dry_run:
+            Ingredients.objects.bulk_create(batch, ignore_conflicts=True)
+        batch.clear()
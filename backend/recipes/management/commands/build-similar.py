@@ -0,0 +1,142 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.db import connections, transaction
+from recipes.models import Recipes, SimilarRecipe
+from recipes.similar import (SimilarityIndex, load_features, set_index,
+                             top_k_batch)
+
+
+class Command(BaseCommand):
+    help = 'Пересчёт похожих рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Пересчитать все рецепты, а не только '
+                                 'изменённые')
+        parser.add_argument('--count', type=int,
+                            default=settings.SIMILAR_RECIPES_COUNT)
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Число процессов, по умолчанию - по ядрам; '
+                                 '1 - без отдельных процессов')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        self.count = options['count']
+        self.batch_size = options['batch_size']
+        self.full = options['full']
+        # Флаги снимаются в одной транзакции с чтением признаков: правка,
+        # сделанная во время пересчёта, снова поднимет флаг и попадёт
+        # в следующий запуск.
+        with transaction.atomic():
+            flagged = Recipes.objects.select_for_update().filter(
+                similar_outdated=True
+            )
+            outdated = set(flagged.values_list('id', flat=True))
+            flagged.update(similar_outdated=False)
+            features = load_features()
+        try:
+            computed = self.build(features, outdated, options['workers'])
+        except BaseException:
+            self.restore_flags(outdated)
+            raise
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитано рецептов: {len(computed)} '
+            f'за {time.monotonic() - started:.1f} с'
+        ))
+
+    def build(self, features, outdated, workers):
+        set_index(SimilarityIndex(features))
+        # При --full строки копятся в памяти и заменяют старые одной
+        # транзакцией: до её конца эндпоинт отдаёт прежних соседей.
+        self.pending = []
+        if self.full:
+            targets = set(features)
+        else:
+            # Соседи изменённых рецептов тоже могли устареть.
+            targets = outdated | self.related(outdated, 'similar', 'recipe')
+
+        # Воркеры не работают с базой, но не должны получить открытое
+        # соединение родителя при fork.
+        connections.close_all()
+        pool = None
+        map_function = map
+        if workers != 1:
+            pool = ProcessPoolExecutor(max_workers=workers)
+            map_function = pool.map
+        try:
+            computed = self.compute(map_function, targets)
+            if not self.full:
+                # Изменённый рецепт мог войти в топ своих новых соседей.
+                computed |= self.compute(
+                    map_function,
+                    self.related(outdated, 'recipe', 'similar') - computed
+                )
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        if self.full:
+            size = self.batch_size * self.count
+            with transaction.atomic():
+                SimilarRecipe.objects.all().delete()
+                for start in range(0, len(self.pending), size):
+                    SimilarRecipe.objects.bulk_create(
+                        self.make_rows(self.pending[start:start + size])
+                    )
+        return computed
+
+    def restore_flags(self, recipe_ids):
+        """Пересчёт не удался: изменённые рецепты ждут следующего."""
+        for chunk in self.chunks(sorted(recipe_ids)):
+            Recipes.objects.filter(id__in=chunk).update(
+                similar_outdated=True
+            )
+
+    def chunks(self, recipe_ids):
+        return [
+            recipe_ids[start:start + self.batch_size]
+            for start in range(0, len(recipe_ids), self.batch_size)
+        ]
+
+    def related(self, recipe_ids, by_field, field):
+        """id из SimilarRecipe.field у строк, где by_field в recipe_ids."""
+        found = set()
+        for chunk in self.chunks(sorted(recipe_ids)):
+            found.update(SimilarRecipe.objects.filter(
+                **{f'{by_field}_id__in': chunk}
+            ).values_list(f'{field}_id', flat=True))
+        return found
+
+    def compute(self, map_function, recipe_ids):
+        recipe_ids = sorted(recipe_ids)
+        batches = self.chunks(recipe_ids)
+        for batch, result in zip(batches, map_function(
+            top_k_batch, batches, [self.count] * len(batches)
+        )):
+            rows = [
+                (recipe_id, similar_id, score, rank)
+                for recipe_id, neighbours in result
+                for rank, (similar_id, score) in enumerate(neighbours)
+            ]
+            if self.full:
+                self.pending.extend(rows)
+            else:
+                self.save(batch, rows)
+        return set(recipe_ids)
+
+    def make_rows(self, rows):
+        return [
+            SimilarRecipe(
+                recipe_id=recipe_id, similar_id=similar_id,
+                score=score, rank=rank
+            )
+            for recipe_id, similar_id, score, rank in rows
+        ]
+
+    @transaction.atomic
+    def save(self, batch, rows):
+        SimilarRecipe.objects.filter(recipe_id__in=batch).delete()
+        SimilarRecipe.objects.bulk_create(self.make_rows(rows))
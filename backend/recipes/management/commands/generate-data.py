@@ -0,0 +1,267 @@
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import BaseCommand, CommandError, call_command
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from recipes.models import (CartIngredient, Favorite, IngredientInRecipe,
+                            Ingredients, Recipes, RecipeTags, ShoppingCart,
+                            Subscriptions, Tags)
+from recipes.signals import data_changed
+from users.models import User
+
+TAG_NAMES = (
+    ('Завтрак', 'breakfast', '#E26C2D'),
+    ('Обед', 'lunch', '#49B64E'),
+    ('Ужин', 'dinner', '#8775D2'),
+    ('Десерт', 'dessert', '#F2C94C'),
+    ('Выпечка', 'bakery', '#BB6BD9'),
+    ('Салат', 'salad', '#27AE60'),
+    ('Суп', 'soup', '#EB5757'),
+    ('Напиток', 'drink', '#2D9CDB'),
+)
+WORDS = (
+    'нарезать', 'смешать', 'добавить', 'посолить', 'обжарить', 'варить',
+    'остудить', 'подавать', 'минут', 'до', 'готовности', 'на', 'сковороде',
+    'в', 'кастрюле', 'огне', 'среднем', 'духовке', 'вместе', 'с',
+)
+
+
+def skewed_index(rng, size, skew):
+    """Индекс из range(size), смещённый к началу при skew > 1.
+
+    При skew = 1 распределение равномерное; чем больше skew, тем чаще
+    выбираются первые элементы (популярные авторы и рецепты).
+    """
+    return min(int(size * rng.random() ** skew), size - 1)
+
+
+class Command(BaseCommand):
+    help = 'Генерация большого набора тестовых данных'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--tags', type=int, default=len(TAG_NAMES))
+        parser.add_argument('--ingredients-per-recipe', type=int, nargs=2,
+                            default=(3, 12), metavar=('MIN', 'MAX'))
+        parser.add_argument('--tags-per-recipe', type=int, nargs=2,
+                            default=(1, 3), metavar=('MIN', 'MAX'))
+        parser.add_argument('--favorites', type=int, default=20,
+                            help='Максимум рецептов в избранном у юзера')
+        parser.add_argument('--carts', type=int, default=10,
+                            help='Максимум рецептов в списке покупок')
+        parser.add_argument('--subscriptions', type=int, default=15,
+                            help='Максимум подписок у юзера')
+        parser.add_argument('--days', type=int, default=365,
+                            help='Рецепты публикуются за столько '
+                                 'последних дней')
+        parser.add_argument('--author-skew', type=float, default=3.0,
+                            help='Концентрация рецептов у популярных '
+                                 'авторов, 1 - равномерно')
+        parser.add_argument('--popularity-skew', type=float, default=2.0,
+                            help='Концентрация избранного, покупок и '
+                                 'подписок на популярных рецептах/авторах')
+        parser.add_argument('--heavy-users', type=float, default=1.5,
+                            help='Параметр Парето для размера избранного, '
+                                 'покупок и подписок: меньше - больше '
+                                 '«тяжёлых» юзеров')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.buffers = {}
+        self.created = {}
+        self.now = timezone.now()
+        started = time.monotonic()
+
+        ingredient_ids = list(
+            Ingredients.objects.order_by('id').values_list('id', flat=True)
+        )
+        if not ingredient_ids:
+            raise CommandError(
+                'Нет ингредиентов, сначала выполните add-ingredients'
+            )
+        with transaction.atomic():
+            tag_ids = self.get_tags(options['tags'])
+            user_ids = self.generate_users(options['users'])
+            recipe_ids, authors = self.generate_recipes(
+                options, user_ids, ingredient_ids, tag_ids
+            )
+            self.generate_user_lists(options, user_ids, recipe_ids, authors)
+            self.flush_all()
+            self.reset_sequences()
+            CartIngredient.objects.rebuild()
+            call_command('recount-counters', stdout=self.stdout)
+            call_command('rebuild-search-index', stdout=self.stdout)
+            call_command('rebuild-feeds', stdout=self.stdout)
+        data_changed.send(
+            sender=self.__class__, names=('catalog', 'recipes', 'tags')
+        )
+
+        for model, count in self.created.items():
+            self.stdout.write(f'{model._meta.verbose_name_plural}: {count}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Данные сгенерированы за {time.monotonic() - started:.1f} с'
+        ))
+
+    def next_id(self, model):
+        return (model.objects.aggregate(max_id=Max('id'))['max_id'] or 0) + 1
+
+    def add(self, obj):
+        """Буферизует объект и пишет пачку через bulk_create."""
+        model = type(obj)
+        buffer = self.buffers.setdefault(model, [])
+        buffer.append(obj)
+        if len(buffer) >= self.batch_size:
+            self.flush_all()
+
+    def flush(self, model):
+        buffer = self.buffers.get(model)
+        if buffer:
+            model.objects.bulk_create(buffer)
+            self.created[model] = self.created.get(model, 0) + len(buffer)
+            buffer.clear()
+
+    def flush_all(self):
+        """Пишет все буферы, родительские таблицы раньше дочерних."""
+        for model in (User, Recipes, RecipeTags, IngredientInRecipe,
+                      Favorite, ShoppingCart, Subscriptions):
+            self.flush(model)
+
+    def reset_sequences(self):
+        """Сдвигает sequence в PostgreSQL после вставки с явными id."""
+        statements = connection.ops.sequence_reset_sql(
+            no_style(), [User, Recipes]
+        )
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+    def get_tags(self, count):
+        existing = {tag.slug: tag.id for tag in Tags.objects.all()}
+        for number in range(count):
+            name, slug, color = TAG_NAMES[number % len(TAG_NAMES)]
+            if number >= len(TAG_NAMES):
+                round_number = number // len(TAG_NAMES)
+                name = f'{name} {round_number}'
+                slug = f'{slug}-{round_number}'
+            if slug not in existing:
+                existing[slug] = Tags.objects.create(
+                    name=name, slug=slug, color=color
+                ).id
+        return sorted(existing.values())
+
+    def generate_users(self, count):
+        password = make_password('foodgram-password')
+        first_id = self.next_id(User)
+        for user_id in range(first_id, first_id + count):
+            self.add(User(
+                id=user_id,
+                username=f'user{user_id}',
+                email=f'user{user_id}@foodgram.test',
+                first_name='Имя',
+                last_name=f'Фамилия{user_id}',
+                password=password,
+            ))
+        self.flush(User)
+        return range(first_id, first_id + count)
+
+    def generate_recipes(self, options, user_ids, ingredient_ids, tag_ids):
+        rng = self.rng
+        first_id = self.next_id(Recipes)
+        min_ingredients, max_ingredients = options['ingredients_per_recipe']
+        min_tags, max_tags = options['tags_per_recipe']
+        max_ingredients = min(max_ingredients, len(ingredient_ids))
+        max_tags = min(max_tags, len(tag_ids))
+        authors = set()
+        for recipe_id in range(first_id, first_id + options['recipes']):
+            author_id = user_ids[skewed_index(
+                rng, len(user_ids), options['author_skew']
+            )]
+            authors.add(author_id)
+            self.add(Recipes(
+                id=recipe_id,
+                author_id=author_id,
+                name=f'Рецепт {recipe_id}',
+                text=' '.join(rng.choices(WORDS, k=rng.randint(10, 60))),
+                cooking_time=rng.randint(1, 180),
+            ))
+            for tag_id in rng.sample(
+                tag_ids, rng.randint(min(min_tags, max_tags), max_tags)
+            ):
+                self.add(RecipeTags(recipe_id=recipe_id, tag_id=tag_id))
+            for ingredient_id in rng.sample(
+                ingredient_ids,
+                rng.randint(min(min_ingredients, max_ingredients),
+                            max_ingredients)
+            ):
+                self.add(IngredientInRecipe(
+                    recipe_id=recipe_id,
+                    ingredient_id=ingredient_id,
+                    amount=rng.randint(1, 500),
+                ))
+        self.flush_all()
+        recipe_ids = range(first_id, first_id + options['recipes'])
+        self.set_pub_dates(recipe_ids, options['days'])
+        return recipe_ids, authors
+
+    def set_pub_dates(self, recipe_ids, days):
+        """Даты публикации из seed, разнесённые по последним days дням;
+        у рецептов с большим id дата позже.
+
+        pub_date - auto_now_add, bulk_create ставит всем текущее время,
+        поэтому даты проставляются после вставки.
+        """
+        span = timedelta(days=days).total_seconds()
+        offsets = sorted(self.rng.uniform(0, span) for _ in recipe_ids)
+        Recipes.objects.bulk_update(
+            [
+                Recipes(id=recipe_id, pub_date=self.now - timedelta(
+                    seconds=span - offset
+                ))
+                for recipe_id, offset in zip(recipe_ids, offsets)
+            ],
+            ['pub_date'], batch_size=self.batch_size
+        )
+
+    def list_size(self, maximum, alpha):
+        """Размер списка юзера: у большинства мало, у немногих много."""
+        return min(int(self.rng.paretovariate(alpha)) - 1, maximum)
+
+    def pick_unique(self, size, population, skew, exclude=None):
+        picked = set()
+        attempts = size * 3
+        while len(picked) < size and attempts:
+            attempts -= 1
+            value = population[skewed_index(self.rng, len(population), skew)]
+            if value != exclude:
+                picked.add(value)
+        return sorted(picked)
+
+    def generate_user_lists(self, options, user_ids, recipe_ids, authors):
+        if not recipe_ids:
+            return
+        author_ids = sorted(authors)
+        skew = options['popularity_skew']
+        alpha = options['heavy_users']
+        for user_id in user_ids:
+            for recipe_id in self.pick_unique(
+                self.list_size(options['favorites'], alpha), recipe_ids, skew
+            ):
+                self.add(Favorite(user_id=user_id, recipe_id=recipe_id))
+            for recipe_id in self.pick_unique(
+                self.list_size(options['carts'], alpha), recipe_ids, skew
+            ):
+                self.add(ShoppingCart(user_id=user_id, recipe_id=recipe_id))
+            for author_id in self.pick_unique(
+                self.list_size(options['subscriptions'], alpha),
+                author_ids, skew, exclude=user_id
+            ):
+                self.add(Subscriptions(user_id=user_id, author_id=author_id))
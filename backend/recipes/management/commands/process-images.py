@@ -0,0 +1,79 @@
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management import BaseCommand
+from django.db import connections
+from recipes.images import make_derivatives
+from recipes.models import Recipes
+from recipes.signals import data_changed
+
+
+class Command(BaseCommand):
+    help = 'Создание уменьшенных копий картинок рецептов (WebP и JPEG)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Число процессов, по умолчанию - по ядрам')
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--force', action='store_true',
+                            help='Пересоздать копии для всех рецептов')
+        parser.add_argument('--loop', action='store_true',
+                            help='Работать постоянно, ожидая новые картинки')
+        parser.add_argument('--interval', type=float, default=5.0,
+                            help='Пауза между проверками в режиме --loop')
+
+    def handle(self, *args, **options):
+        if options['force']:
+            Recipes.objects.exclude(image='').update(
+                image_derivatives_ready=False
+            )
+        # Процессы-воркеры не работают с базой, но не должны получить
+        # открытое соединение родителя при fork.
+        connections.close_all()
+        processed = failed = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            while True:
+                done, errors = self.process_batch(pool, options['batch_size'])
+                processed += done
+                failed += errors
+                if done:
+                    data_changed.send(
+                        sender=self.__class__, names=('catalog',)
+                    )
+                if done + errors < options['batch_size']:
+                    if not options['loop']:
+                        break
+                    time.sleep(options['interval'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано картинок: {processed}, с ошибками: {failed}'
+        ))
+
+    def process_batch(self, pool, batch_size):
+        pending = dict(
+            Recipes.objects.filter(image_derivatives_ready=False)
+            .exclude(image='')
+            .order_by('id')
+            .values_list('id', 'image')[:batch_size]
+        )
+        futures = {
+            pool.submit(make_derivatives, image): recipe_id
+            for recipe_id, image in pending.items()
+        }
+        ready = []
+        errors = 0
+        for future in as_completed(futures):
+            recipe_id = futures[future]
+            try:
+                future.result()
+            except Exception as error:
+                errors += 1
+                self.stderr.write(f'Рецепт {recipe_id}: {error}')
+            else:
+                ready.append(recipe_id)
+        # Картинку могли заменить, пока шла обработка: отмечаем только
+        # рецепты, у которых она осталась прежней.
+        for recipe_id in ready:
+            Recipes.objects.filter(
+                id=recipe_id, image=pending[recipe_id]
+            ).update(image_derivatives_ready=True)
+        return len(ready), errors
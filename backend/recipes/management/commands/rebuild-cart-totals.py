@@ -0,0 +1,55 @@
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+from recipes.models import CartIngredient
+
+
+class Command(BaseCommand):
+    help = 'Пересборка и проверка сводной таблицы списков покупок'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Только сравнить таблицу с агрегацией')
+        parser.add_argument('--user', type=int,
+                            help='id юзера, по умолчанию - все')
+
+    def handle(self, *args, **options):
+        if options['check']:
+            self.check_totals(options['user'])
+            return
+        with transaction.atomic():
+            CartIngredient.objects.rebuild(user=options['user'])
+        self.stdout.write(self.style.SUCCESS(
+            'Сводная таблица списков покупок пересобрана'
+        ))
+
+    def check_totals(self, user):
+        stored = CartIngredient.objects.all()
+        if user is not None:
+            stored = stored.filter(user=user)
+        stored = {
+            (row['user_id'], row['ingredient_id']): row['amount']
+            for row in stored.values(
+                'user_id', 'ingredient_id', 'amount'
+            ).iterator()
+        }
+        mismatches = 0
+        for row in CartIngredient.objects.live_totals(user).iterator():
+            key = (row['user_id'], row['ingredient_id'])
+            amount = stored.pop(key, None)
+            if amount != row['total']:
+                mismatches += 1
+                self.stdout.write(
+                    f'user={key[0]} ingredient={key[1]}: '
+                    f'в таблице {amount}, должно быть {row["total"]}'
+                )
+        for (user_id, ingredient_id), amount in stored.items():
+            mismatches += 1
+            self.stdout.write(
+                f'user={user_id} ingredient={ingredient_id}: '
+                f'в таблице {amount}, должно быть None'
+            )
+        if mismatches:
+            raise CommandError(
+                f'Расхождений: {mismatches}, выполните rebuild-cart-totals'
+            )
+        self.stdout.write(self.style.SUCCESS('Расхождений нет'))
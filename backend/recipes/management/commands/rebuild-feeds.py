@@ -0,0 +1,26 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+from recipes.feed import rebuild_feeds
+from recipes.models import FeedItem
+
+
+class Command(BaseCommand):
+    help = 'Пересборка лент подписок'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--purge', action='store_true',
+            help='Только удалить строки авторов с подмешиванием при чтении'
+        )
+
+    def handle(self, *args, **options):
+        if options['purge']:
+            count = FeedItem.objects.purge_pulled(options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(
+                f'Удалено строк из лент: {count}'
+            ))
+            return
+        with transaction.atomic():
+            count = rebuild_feeds(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Строк в лентах: {count}'))
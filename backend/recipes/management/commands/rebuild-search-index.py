@@ -0,0 +1,16 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+from recipes.search import rebuild_index
+from recipes.signals import data_changed
+
+
+class Command(BaseCommand):
+    help = 'Пересборка полнотекстового индекса рецептов'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            count = rebuild_index()
+        data_changed.send(sender=self.__class__, names=('catalog',))
+        self.stdout.write(self.style.SUCCESS(
+            f'Проиндексировано рецептов: {count}'
+        ))
@@ -0,0 +1,33 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from recipes.models import Favorite, Recipes, ShoppingCart, Subscriptions
+from users.models import User
+
+
+def count_of(model, field):
+    """Подзапрос с числом строк model, ссылающихся на текущую запись."""
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).order_by().values(
+            field
+        ).annotate(total=Count('pk')).values('total')
+    ), 0)
+
+
+class Command(BaseCommand):
+    help = 'Пересчёт счётчиков избранного, покупок, рецептов и подписчиков'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            recipes = Recipes.objects.update(
+                favorites_count=count_of(Favorite, 'recipe'),
+                in_carts_count=count_of(ShoppingCart, 'recipe'),
+            )
+            users = User.objects.update(
+                recipes_count=count_of(Recipes, 'author'),
+                followers_count=count_of(Subscriptions, 'author'),
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Счётчики пересчитаны: рецептов {recipes}, юзеров {users}'
+        ))
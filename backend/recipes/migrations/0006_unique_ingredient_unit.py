@@ -0,0 +1,53 @@
+# Generated by Django 2.2.16 on 2026-10-18 19:32
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicates(apps, schema_editor):
+    """Сливает одинаковые ингредиенты в запись с меньшим id."""
+    Ingredients = apps.get_model('recipes', 'Ingredients')
+    IngredientInRecipe = apps.get_model('recipes', 'IngredientInRecipe')
+    CartIngredient = apps.get_model('recipes', 'CartIngredient')
+    groups = Ingredients.objects.values(
+        'name', 'measurement_unit'
+    ).order_by().annotate(keep_id=Min('id'), total=Count('id')).filter(
+        total__gt=1
+    )
+    for group in groups:
+        keep_id = group['keep_id']
+        duplicate_ids = list(Ingredients.objects.filter(
+            name=group['name'], measurement_unit=group['measurement_unit']
+        ).exclude(id=keep_id).values_list('id', flat=True))
+        for model in (IngredientInRecipe, CartIngredient):
+            owner = 'recipe_id' if model is IngredientInRecipe else 'user_id'
+            rows = model.objects.filter(
+                ingredient_id__in=duplicate_ids
+            ).order_by('id')
+            for row in rows:
+                kept = model.objects.filter(
+                    **{owner: getattr(row, owner)}, ingredient_id=keep_id
+                ).first()
+                if kept is None:
+                    row.ingredient_id = keep_id
+                    row.save(update_fields=['ingredient'])
+                else:
+                    kept.amount += row.amount
+                    kept.save(update_fields=['amount'])
+                    row.delete()
+        Ingredients.objects.filter(id__in=duplicate_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingredients',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient_unit'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.16 on 2026-10-18 19:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_unique_ingredient_unit'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipes',
+            name='image_derivatives_ready',
+            field=models.BooleanField(default=False, verbose_name='Уменьшенные копии картинки готовы'),
+        ),
+    ]
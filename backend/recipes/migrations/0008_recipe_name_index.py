@@ -0,0 +1,18 @@
+# Generated by Django 2.2.16 on 2026-10-18 19:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_image_derivatives_ready'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipes',
+            name='name',
+            field=models.CharField(db_index=True, help_text='укажите название рецепта', max_length=200, verbose_name='Название'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations
+
+from recipes.search import TABLE, get_backend, rebuild_index
+
+
+def create_search_table(apps, schema_editor):
+    backend = get_backend(schema_editor.connection)
+    if backend is not None:
+        backend.create_table(schema_editor)
+        rebuild_index(apps)
+
+
+def drop_search_table(apps, schema_editor):
+    if get_backend(schema_editor.connection) is not None:
+        schema_editor.execute(f'DROP TABLE {TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_recipe_name_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_table, drop_search_table),
+    ]
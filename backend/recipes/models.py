@@ -1,5 +1,10 @@
+from contextlib import contextmanager
+
+from django.conf import settings
 from django.core.validators import MinValueValidator, RegexValidator
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Exists, F, OuterRef, Prefetch, Sum, Value
+from django.db.models.functions import Greatest
 from users.models import User
 
 
@@ -50,11 +55,58 @@ class Ingredients(models.Model):
         ordering = ('name', )
         verbose_name = "Ингредиенты"
         verbose_name_plural = "Ингредиенты"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient_unit'
+            )
+        ]
 
     def __str__(self):
         return self.name
 
 
+class RecipesQuerySet(models.QuerySet):
+    """Выборки рецептов для API без запросов на каждую строку."""
+
+    def with_related(self, author=True, tags=True, ingredients=True):
+        """Автор, теги и состав; ненужное можно выключить.
+
+        Теги идут по id, ингредиенты - в порядке добавления в рецепт.
+        """
+        queryset = self.select_related('author') if author else self
+        if tags:
+            queryset = queryset.prefetch_related(Prefetch(
+                'tags', queryset=Tags.objects.order_by('id')
+            ))
+        if ingredients:
+            queryset = queryset.prefetch_related(Prefetch(
+                'ingredientinrecipe',
+                queryset=IngredientInRecipe.objects.select_related(
+                    'ingredient'
+                ).order_by('id')
+            ))
+        return queryset
+
+    def with_user_flags(self, user, is_favorited=True,
+                        is_in_shopping_cart=True):
+        flags = (
+            ('is_favorited', is_favorited, Favorite),
+            ('is_in_shopping_cart', is_in_shopping_cart, ShoppingCart),
+        )
+        annotations = {}
+        for flag, needed, model in flags:
+            if not needed:
+                continue
+            if user.is_anonymous:
+                annotations[flag] = Value(False, models.BooleanField())
+            else:
+                annotations[flag] = Exists(model.objects.filter(
+                    user=user, recipe=OuterRef('pk')
+                ))
+        return self.annotate(**annotations)
+
+
 class Recipes(models.Model):
     author = models.ForeignKey(
         User,
@@ -64,6 +116,7 @@ class Recipes(models.Model):
     )
     name = models.CharField(
         max_length=200,
+        db_index=True,
         verbose_name='Название',
         help_text='укажите название рецепта'
     )
@@ -73,6 +126,15 @@ class Recipes(models.Model):
         upload_to='recipes/',
         blank=True
     )
+    image_derivatives_ready = models.BooleanField(
+        verbose_name='Уменьшенные копии картинки готовы',
+        default=False
+    )
+    similar_outdated = models.BooleanField(
+        verbose_name='Нужно пересчитать похожие рецепты',
+        default=True,
+        db_index=True
+    )
     ingredients = models.ManyToManyField(
         Ingredients,
         through='IngredientInRecipe',
@@ -94,6 +156,18 @@ class Recipes(models.Model):
         verbose_name='Дата публикации',
         auto_now_add=True
     )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='Раз в избранном',
+        default=0,
+        db_index=True
+    )
+    in_carts_count = models.PositiveIntegerField(
+        verbose_name='Раз в списках покупок',
+        default=0,
+        db_index=True
+    )
+
+    objects = RecipesQuerySet.as_manager()
 
     class Meta:
         ordering = ['-pub_date']
@@ -146,6 +220,63 @@ class RecipeTags(models.Model):
         ]
 
 
+def lock_user(user):
+    """Блокирует строку юзера до конца транзакции.
+
+    Так изменения его избранного и списка покупок идут по очереди:
+    параллельный запрос увидит строки, записанные предыдущим.
+    """
+    list(User.objects.select_for_update().filter(
+        pk=user.pk
+    ).values_list('pk', flat=True))
+
+
+class UserRecipeListManager(models.Manager):
+    """Избранное и список покупок вместе со счётчиками рецептов.
+
+    Счётчики и сводный список покупок меняются по строкам, которые
+    действительно вставлены или удалены, а не по прочитанным до
+    записи.
+    """
+
+    def add(self, user, recipe_ids):
+        """Добавляет рецепты, возвращает id добавленных сейчас."""
+        with transaction.atomic():
+            lock_user(user)
+            present = set(self.filter(
+                user=user, recipe_id__in=recipe_ids
+            ).values_list('recipe_id', flat=True))
+            added = [pk for pk in recipe_ids if pk not in present]
+            if added:
+                self.bulk_create(
+                    self.model(user=user, recipe_id=pk) for pk in added
+                )
+                Recipes.objects.filter(pk__in=added).update(**{
+                    self.model.counter_field:
+                        F(self.model.counter_field) + 1
+                })
+                if self.model is ShoppingCart:
+                    CartIngredient.objects.add_recipes(user, added)
+        return added
+
+    def remove(self, user, recipe_ids):
+        """Убирает рецепты, возвращает множество id убранных сейчас."""
+        with transaction.atomic():
+            lock_user(user)
+            rows = self.filter(user=user, recipe_id__in=recipe_ids)
+            removed = set(rows.values_list('recipe_id', flat=True))
+            if removed:
+                rows.delete()
+                Recipes.objects.filter(pk__in=removed).update(**{
+                    self.model.counter_field: Greatest(
+                        F(self.model.counter_field) - 1, 0
+                    )
+                })
+                if self.model is ShoppingCart:
+                    CartIngredient.objects.remove_recipes(user, removed)
+        return removed
+
+
 class Favorite(models.Model):
     user = models.ForeignKey(
         User, on_delete=models.CASCADE, related_name='favorite',
@@ -156,6 +287,10 @@ class Favorite(models.Model):
         verbose_name='Рецепт в избранном',
     )
 
+    counter_field = 'favorites_count'
+
+    objects = UserRecipeListManager()
+
     class Meta:
         verbose_name = 'Избранное'
         verbose_name_plural = 'Избранное'
@@ -179,6 +314,10 @@ class ShoppingCart(models.Model):
         verbose_name='Рецепт в список покупок',
     )
 
+    counter_field = 'in_carts_count'
+
+    objects = UserRecipeListManager()
+
     class Meta:
         verbose_name_plural = 'Список покупок'
         constraints = [
@@ -188,6 +327,172 @@ class ShoppingCart(models.Model):
         ]
 
 
+class CartIngredientManager(models.Manager):
+    """Поддержка сводной таблицы списка покупок.
+
+    Методы вызываются внутри транзакции вместе с изменением
+    ShoppingCart или ингредиентов рецепта.
+    """
+
+    def add_recipes(self, user, recipe_ids, sign=1):
+        amounts = IngredientInRecipe.objects.filter(
+            recipe_id__in=recipe_ids
+        ).order_by().values('ingredient_id').annotate(
+            total=Sum('amount')
+        ).values_list('ingredient_id', 'total')
+        self.apply(user, {
+            ingredient_id: sign * total for ingredient_id, total in amounts
+        })
+
+    def remove_recipes(self, user, recipe_ids):
+        self.add_recipes(user, recipe_ids, sign=-1)
+
+    def add_recipe(self, user, recipe):
+        self.add_recipes(user, [recipe.id])
+
+    def remove_recipe(self, user, recipe):
+        self.remove_recipes(user, [recipe.id])
+
+    def apply(self, user, delta):
+        """Прибавляет к суммам юзера delta: {ingredient_id: amount}.
+
+        Недостающие строки сначала вставляются с нулём в обход
+        конфликтов: параллельная вставка той же строки не роняет
+        запрос, а прибавка идёт через F() по заблокированным строкам.
+        """
+        delta = {key: value for key, value in delta.items() if value}
+        if not delta:
+            return
+        subtracting = min(delta.values()) < 0
+        self.bulk_create((
+            CartIngredient(user=user, ingredient_id=key, amount=0)
+            for key, value in delta.items() if value > 0
+        ), ignore_conflicts=True)
+        rows = list(self.select_for_update().filter(
+            user=user, ingredient_id__in=delta
+        ))
+        for row in rows:
+            row.amount = Greatest(F('amount') + delta[row.ingredient_id], 0)
+        self.bulk_update(rows, ['amount'])
+        if subtracting:
+            self.filter(user=user, amount__lte=0).delete()
+
+    def recipe_amounts(self, recipe_id):
+        return dict(IngredientInRecipe.objects.filter(
+            recipe_id=recipe_id
+        ).values_list('ingredient_id', 'amount'))
+
+    def apply_recipe_change(self, recipe, old_amounts, new_amounts):
+        """Переносит изменение ингредиентов рецепта в списки покупок.
+
+        Число запросов зависит от числа изменённых ингредиентов,
+        а не от числа юзеров, у которых рецепт в списке покупок.
+        """
+        user_ids = list(ShoppingCart.objects.filter(
+            recipe=recipe
+        ).values_list('user_id', flat=True))
+        if user_ids:
+            self.apply_to_users(user_ids, old_amounts, new_amounts)
+
+    @contextmanager
+    def recipe_changes(self, recipe_ids):
+        """Переносит в списки покупок изменения состава рецептов,
+        сделанные внутри блока, например, формами админки."""
+        recipe_ids = set(recipe_ids)
+        with transaction.atomic():
+            before = {pk: self.recipe_amounts(pk) for pk in recipe_ids}
+            yield
+            for pk in recipe_ids:
+                self.apply_recipe_change(
+                    pk, before[pk], self.recipe_amounts(pk)
+                )
+
+    def apply_to_users(self, user_ids, old_amounts, new_amounts):
+        """Разница сумм рецепта - одним UPDATE на ингредиент для всех."""
+        for ingredient_id in old_amounts.keys() | new_amounts.keys():
+            value = (
+                new_amounts.get(ingredient_id, 0)
+                - old_amounts.get(ingredient_id, 0)
+            )
+            if not value:
+                continue
+            if value > 0:
+                self.bulk_create((
+                    CartIngredient(
+                        user_id=user_id, ingredient_id=ingredient_id,
+                        amount=0
+                    )
+                    for user_id in user_ids
+                ), ignore_conflicts=True)
+            self.filter(
+                user_id__in=user_ids, ingredient_id=ingredient_id
+            ).update(amount=Greatest(F('amount') + value, 0))
+        self.filter(user_id__in=user_ids, amount__lte=0).delete()
+
+    def remove_recipe_from_carts(self, recipe):
+        """Убирает удаляемый рецепт из всех списков покупок разом."""
+        user_ids = list(ShoppingCart.objects.filter(
+            recipe=recipe
+        ).values_list('user_id', flat=True))
+        if user_ids:
+            self.apply_to_users(
+                user_ids, self.recipe_amounts(recipe.id), {}
+            )
+
+    def live_totals(self, user=None):
+        """Суммы, посчитанные заново по ShoppingCart."""
+        queryset = IngredientInRecipe.objects.all()
+        if user is not None:
+            queryset = queryset.filter(recipe__shopping_cart__user=user)
+        return queryset.values(
+            'ingredient_id', user_id=F('recipe__shopping_cart__user')
+        ).filter(user_id__isnull=False).order_by().annotate(
+            total=Sum('amount')
+        )
+
+    def rebuild(self, user=None, batch_size=5000):
+        queryset = self.all() if user is None else self.filter(user=user)
+        queryset.delete()
+        rows = []
+        for row in self.live_totals(user).iterator():
+            rows.append(CartIngredient(
+                user_id=row['user_id'],
+                ingredient_id=row['ingredient_id'],
+                amount=row['total'],
+            ))
+            if len(rows) >= batch_size:
+                self.bulk_create(rows)
+                rows = []
+        self.bulk_create(rows)
+
+
+class CartIngredient(models.Model):
+    """Сумма ингредиента по всем рецептам в списке покупок юзера."""
+    user = models.ForeignKey(
+        User, related_name='cart_ingredients',
+        on_delete=models.CASCADE
+    )
+    ingredient = models.ForeignKey(
+        Ingredients, related_name='cart_ingredients',
+        on_delete=models.CASCADE
+    )
+    amount = models.PositiveIntegerField(verbose_name='Количество')
+
+    objects = CartIngredientManager()
+
+    class Meta:
+        verbose_name = 'Ингредиент в списке покупок'
+        verbose_name_plural = 'Сводный список покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'], name='unique_cart_ingredient'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.ingredient} - {self.amount}'
+
+
 class Subscriptions(models.Model):
     user = models.ForeignKey(
         User,
@@ -212,3 +517,165 @@ class Subscriptions(models.Model):
 
     def __str__(self):
         return f'{self.user} follows {self.author}'
+
+
+def keyset_before(key, id_field):
+    """Строки строго после key = (pub_date, id) в порядке убывания."""
+    pub_date, pk = key
+    return models.Q(pub_date__lt=pub_date) | models.Q(
+        pub_date=pub_date, **{f'{id_field}__lt': pk}
+    )
+
+
+class FeedItemManager(models.Manager):
+    """Ленты подписок: рецепт раскладывается по лентам подписчиков при
+    публикации (fan-out on write).
+
+    Рецепты авторов с флагом feed_fanout_on_read в ленты не пишутся и
+    подмешиваются при чтении, иначе одна публикация стоила бы записи
+    в ленту каждого из тысяч подписчиков.
+    """
+
+    def fan_out(self, recipe):
+        # Флаг читается из базы: у автора из кеша токенов он может
+        # отставать.
+        self.bulk_create((
+            FeedItem(
+                user_id=user_id, recipe=recipe,
+                author_id=recipe.author_id, pub_date=recipe.pub_date
+            )
+            for user_id in Subscriptions.objects.filter(
+                author_id=recipe.author_id,
+                author__feed_fanout_on_read=False
+            ).values_list('user_id', flat=True)
+        ), ignore_conflicts=True)
+
+    def backfill(self, user, author):
+        """Последние рецепты автора в ленту нового подписчика."""
+        self.bulk_create((
+            FeedItem(
+                user=user, recipe_id=recipe_id,
+                author=author, pub_date=pub_date
+            )
+            for recipe_id, pub_date in Recipes.objects.filter(
+                author=author, author__feed_fanout_on_read=False
+            ).order_by('-pub_date', '-id').values_list(
+                'id', 'pub_date'
+            )[:settings.FEED_BACKFILL_RECIPES]
+        ), ignore_conflicts=True)
+
+    def trim(self, user, author):
+        self.filter(user=user, author=author).delete()
+
+    def switch_to_read(self, author):
+        """Переводит автора на подмешивание при чтении, если у него
+        стало слишком много подписчиков. Возвращает True, если перевела.
+
+        Строки автора в лентах timeline() дальше пропускает, а удаляет
+        их пачками rebuild-feeds --purge, не запрос подписки.
+        """
+        if (author.feed_fanout_on_read
+                or author.followers_count
+                <= settings.FEED_FANOUT_MAX_FOLLOWERS):
+            return False
+        User.objects.filter(pk=author.pk).update(feed_fanout_on_read=True)
+        author.feed_fanout_on_read = True
+        return True
+
+    def purge_pulled(self, batch_size=5000):
+        """Удаляет строки авторов с подмешиванием при чтении.
+
+        Каждая пачка удаляется отдельным запросом, чтобы не держать
+        долгих блокировок. Возвращает число удалённых строк.
+        """
+        total = 0
+        while True:
+            ids = list(self.filter(
+                author__feed_fanout_on_read=True
+            ).values_list('id', flat=True)[:batch_size])
+            if not ids:
+                return total
+            total += self.filter(id__in=ids).delete()[0]
+
+    def timeline(self, user, before=None):
+        """Строки ленты {recipe_id, pub_date}, новые первыми.
+
+        before - ключ (pub_date, recipe_id) последней выданной строки:
+        для следующей страницы условие ставится в обе части
+        объединения, к самому объединению фильтр не применить.
+        Без «тяжёлых» авторов это один проход по индексу
+        (user, -pub_date, -recipe).
+        """
+        pushed = self.filter(user=user)
+        if before is not None:
+            pushed = pushed.filter(keyset_before(before, 'recipe_id'))
+        pulled = Subscriptions.objects.filter(
+            user=user, author__feed_fanout_on_read=True
+        ).values('author_id')
+        if pulled.exists():
+            recipes = Recipes.objects.filter(author_id__in=pulled)
+            if before is not None:
+                recipes = recipes.filter(keyset_before(before, 'id'))
+            return pushed.exclude(author_id__in=pulled).values(
+                'recipe_id', 'pub_date'
+            ).union(
+                recipes.order_by().values('id', 'pub_date')
+            ).order_by('-pub_date', '-recipe_id')
+        return pushed.values('recipe_id', 'pub_date').order_by(
+            '-pub_date', '-recipe_id'
+        )
+
+
+class FeedItem(models.Model):
+    """Рецепт в ленте подписок юзера."""
+    user = models.ForeignKey(
+        User, related_name='feed', on_delete=models.CASCADE
+    )
+    recipe = models.ForeignKey(
+        Recipes, related_name='feed_items', on_delete=models.CASCADE
+    )
+    author = models.ForeignKey(
+        User, related_name='+', on_delete=models.CASCADE
+    )
+    pub_date = models.DateTimeField()
+
+    objects = FeedItemManager()
+
+    class Meta:
+        verbose_name = 'Рецепт в ленте'
+        verbose_name_plural = 'Ленты подписок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'], name='unique_feed_item'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-recipe'],
+                name='feed_item_timeline'
+            ),
+        ]
+
+
+class SimilarRecipe(models.Model):
+    """Предпосчитанный сосед рецепта, rank 0 - самый похожий."""
+    recipe = models.ForeignKey(
+        Recipes, related_name='similar', on_delete=models.CASCADE
+    )
+    similar = models.ForeignKey(
+        Recipes, related_name='+', on_delete=models.CASCADE
+    )
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'similar'], name='unique_similar_recipe'
+            )
+        ]
+        indexes = [
+            models.Index(fields=['recipe', 'rank'], name='similar_by_rank'),
+        ]
@@ -0,0 +1,224 @@
+"""Полнотекстовый поиск рецептов.
+
+Документ рецепта - название, описание, названия ингредиентов и тегов.
+Он хранится в отдельной таблице recipes_recipesearch: в PostgreSQL это
+tsvector с русской морфологией и GIN-индексом, в SQLite (DEBUG) -
+виртуальная таблица FTS5. Таблица обновляется явно: при записи рецепта
+через API и админку, при переименовании ингредиентов и тегов и
+командой rebuild-search-index.
+"""
+import re
+
+from django.apps import apps as global_apps
+from django.db import connection
+from django.db.models import FloatField
+from django.db.models.expressions import RawSQL
+
+TABLE = 'recipes_recipesearch'
+CHUNK_SIZE = 500
+WORD_RE = re.compile(r'\w+')
+# Окончания для грубого стемминга в SQLite, длинные раньше коротких.
+RUSSIAN_ENDINGS = (
+    'ами', 'ями', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'ая', 'яя',
+    'ое', 'ее', 'ой', 'ей', 'ий', 'ый', 'ые', 'ие', 'ам', 'ям', 'ах',
+    'ях', 'ов', 'ев', 'ом', 'ем', 'ую', 'юю', 'а', 'я', 'о', 'е', 'ы',
+    'и', 'у', 'ю', 'ь',
+)
+MIN_STEM_LENGTH = 3
+
+
+def normalize(text):
+    return text.lower().replace('ё', 'е')
+
+
+class PostgresSearch:
+    """tsvector с весами: название A, ингредиенты B, теги C, текст D."""
+
+    def create_table(self, schema_editor):
+        schema_editor.execute(
+            f'CREATE TABLE {TABLE} ('
+            f'recipe_id integer PRIMARY KEY, document tsvector NOT NULL)'
+        )
+        schema_editor.execute(
+            f'CREATE INDEX {TABLE}_document ON {TABLE} USING gin (document)'
+        )
+
+    def write(self, cursor, documents):
+        cursor.executemany(
+            f'INSERT INTO {TABLE} (recipe_id, document) VALUES (%s, '
+            f"setweight(to_tsvector('russian', %s), 'A') || "
+            f"setweight(to_tsvector('russian', %s), 'B') || "
+            f"setweight(to_tsvector('russian', %s), 'C') || "
+            f"setweight(to_tsvector('russian', %s), 'D')) "
+            f'ON CONFLICT (recipe_id) DO UPDATE '
+            f'SET document = EXCLUDED.document',
+            [
+                (recipe_id, name, ingredients, tags, text)
+                for recipe_id, name, text, ingredients, tags in documents
+            ]
+        )
+
+    def search(self, queryset, query):
+        # extra(where=...), а не id__in=RawSQL(...): последний даёт
+        # IN ((SELECT ...)), что читается как скалярный подзапрос.
+        match = "plainto_tsquery('russian', %s)"
+        return queryset.extra(where=[
+            f'recipes_recipes.id IN (SELECT recipe_id FROM {TABLE} '
+            f'WHERE document @@ {match})'
+        ], params=[query]).annotate(search_rank=RawSQL(
+            f'SELECT ts_rank(document, {match}) FROM {TABLE} '
+            f'WHERE recipe_id = recipes_recipes.id',
+            (query,), output_field=FloatField()
+        ))
+
+
+class SQLiteSearch:
+    """FTS5 для разработки: стемминг заменён поиском по префиксу."""
+
+    def create_table(self, schema_editor):
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE {TABLE} USING fts5('
+            f'name, ingredients, tags, text, '
+            f"tokenize = 'unicode61 remove_diacritics 2')"
+        )
+
+    def write(self, cursor, documents):
+        cursor.executemany(
+            f'INSERT INTO {TABLE} (rowid, name, ingredients, tags, text) '
+            f'VALUES (%s, %s, %s, %s, %s)',
+            [
+                (recipe_id, normalize(name), normalize(ingredients),
+                 normalize(tags), normalize(text))
+                for recipe_id, name, text, ingredients, tags in documents
+            ]
+        )
+
+    def stem(self, word):
+        for ending in RUSSIAN_ENDINGS:
+            if (word.endswith(ending)
+                    and len(word) - len(ending) >= MIN_STEM_LENGTH):
+                return word[:-len(ending)]
+        return word
+
+    def match_expression(self, query):
+        return ' '.join(
+            f'"{self.stem(word)}"*'
+            for word in WORD_RE.findall(normalize(query))
+        )
+
+    def search(self, queryset, query):
+        match = self.match_expression(query)
+        if not match:
+            return queryset.none()
+        return queryset.extra(where=[
+            f'recipes_recipes.id IN (SELECT rowid FROM {TABLE} '
+            f'WHERE {TABLE} MATCH %s)'
+        ], params=[match]).annotate(search_rank=RawSQL(
+            f'SELECT -bm25({TABLE}, 10.0, 4.0, 2.0, 1.0) FROM {TABLE} '
+            f'WHERE {TABLE} MATCH %s AND rowid = recipes_recipes.id',
+            (match,), output_field=FloatField()
+        ))
+
+
+BACKENDS = {'postgresql': PostgresSearch, 'sqlite': SQLiteSearch}
+
+
+def get_backend(db_connection=connection):
+    backend_class = BACKENDS.get(db_connection.vendor)
+    return backend_class() if backend_class else None
+
+
+def search_recipes(queryset, query):
+    """Рецепты, подходящие под запрос, с аннотацией search_rank."""
+    backend = get_backend()
+    if backend is None:
+        return queryset.filter(name__icontains=query).annotate(
+            search_rank=RawSQL('0', (), output_field=FloatField())
+        )
+    return backend.search(queryset, query)
+
+
+def collect_documents(recipe_ids, apps=global_apps):
+    """Тексты документов: (id, название, текст, ингредиенты, теги)."""
+    recipes = apps.get_model('recipes', 'Recipes')
+    recipe_ingredients = apps.get_model('recipes', 'IngredientInRecipe')
+    recipe_tags = apps.get_model('recipes', 'RecipeTags')
+    ingredients = {}
+    for recipe_id, name in recipe_ingredients.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values_list('recipe_id', 'ingredient__name'):
+        ingredients.setdefault(recipe_id, []).append(name)
+    tags = {}
+    for recipe_id, name in recipe_tags.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values_list('recipe_id', 'tag__name'):
+        tags.setdefault(recipe_id, []).append(name)
+    return [
+        (recipe_id, name, text, ' '.join(ingredients.get(recipe_id, ())),
+         ' '.join(tags.get(recipe_id, ())))
+        for recipe_id, name, text in recipes.objects.filter(
+            id__in=recipe_ids
+        ).values_list('id', 'name', 'text')
+    ]
+
+
+def delete_documents(cursor, recipe_ids):
+    column = 'rowid' if connection.vendor == 'sqlite' else 'recipe_id'
+    placeholders = ', '.join(['%s'] * len(recipe_ids))
+    cursor.execute(
+        f'DELETE FROM {TABLE} WHERE {column} IN ({placeholders})',
+        list(recipe_ids)
+    )
+
+
+def write_documents(documents):
+    """Заменяет документы в индексе: два запроса на пачку."""
+    backend = get_backend()
+    if backend is None or not documents:
+        return
+    with connection.cursor() as cursor:
+        for start in range(0, len(documents), CHUNK_SIZE):
+            chunk = documents[start:start + CHUNK_SIZE]
+            delete_documents(cursor, [document[0] for document in chunk])
+            backend.write(cursor, chunk)
+
+
+def recipe_document(recipe, ingredients, tags):
+    """Документ по уже загруженным рецепту, ингредиентам и тегам."""
+    return (
+        recipe.id, recipe.name, recipe.text,
+        ' '.join(ingredient.name for ingredient in ingredients),
+        ' '.join(tag.name for tag in tags),
+    )
+
+
+def index_recipes(recipe_ids, apps=global_apps):
+    """Пересчитывает документы рецептов по данным из базы."""
+    recipe_ids = list(recipe_ids)
+    if get_backend() is None:
+        return
+    for start in range(0, len(recipe_ids), CHUNK_SIZE):
+        write_documents(
+            collect_documents(recipe_ids[start:start + CHUNK_SIZE], apps)
+        )
+
+
+def unindex_recipes(recipe_ids):
+    recipe_ids = list(recipe_ids)
+    if get_backend() is None or not recipe_ids:
+        return
+    with connection.cursor() as cursor:
+        delete_documents(cursor, recipe_ids)
+
+
+def rebuild_index(apps=global_apps):
+    """Индексирует все рецепты заново, возвращает их число."""
+    if get_backend() is None:
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE}')
+    recipe_ids = list(apps.get_model('recipes', 'Recipes').objects.order_by(
+        'id'
+    ).values_list('id', flat=True))
+    index_recipes(recipe_ids, apps)
+    return len(recipe_ids)
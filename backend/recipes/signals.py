@@ -0,0 +1,78 @@
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import Signal, receiver
+from users.models import User
+
+from .models import (CartIngredient, Favorite, Recipes, ShoppingCart,
+                     Subscriptions)
+
+# Данные изменены в обход сигналов моделей (bulk_create, update() и т.п.).
+# Аргумент names - изменённые наборы данных, например ('catalog',);
+# по ним api сбрасывает версии и кеши.
+data_changed = Signal()
+
+
+@receiver(pre_delete, sender=Recipes)
+def remove_recipe_from_carts(instance, **kwargs):
+    """Удаление рецепта откуда угодно - из API, админки или каскадом
+    вместе с автором - убирает его из сводных списков покупок."""
+    CartIngredient.objects.remove_recipe_from_carts(instance)
+
+
+def shift_counter(queryset, field, step):
+    """Сдвигает счётчик в базе, не опуская его ниже нуля."""
+    queryset.update(**{field: Greatest(F(field) + step, 0)})
+
+
+# Счётчики автора: рецепты и подписчики.
+AUTHOR_COUNTERS = {
+    Recipes: 'recipes_count',
+    Subscriptions: 'followers_count',
+}
+
+
+def shift_author_counter(sender, author_id, step):
+    if author_id is not None:
+        shift_counter(
+            User.objects.filter(pk=author_id), AUTHOR_COUNTERS[sender], step
+        )
+
+
+def remember_author(sender, instance, **kwargs):
+    """Автора могут сменить в админке: запоминаем прежнего."""
+    instance._counted_author_id = instance.pk and sender.objects.filter(
+        pk=instance.pk
+    ).values_list('author_id', flat=True).first()
+
+
+def count_saved(sender, instance, **kwargs):
+    previous = getattr(instance, '_counted_author_id', None)
+    if previous != instance.author_id:
+        shift_author_counter(sender, previous, -1)
+        shift_author_counter(sender, instance.author_id, 1)
+
+
+def count_deleted(sender, instance, **kwargs):
+    """В том числе каскадом при удалении автора или подписчика."""
+    shift_author_counter(sender, instance.author_id, -1)
+
+
+for model in AUTHOR_COUNTERS:
+    pre_save.connect(remember_author, sender=model)
+    post_save.connect(count_saved, sender=model)
+    post_delete.connect(count_deleted, sender=model)
+
+
+@receiver(pre_delete, sender=User)
+def release_user_lists(instance, **kwargs):
+    """Избранное и список покупок удаляемого юзера уходят каскадом,
+    мимо менеджера: счётчики рецептов уменьшаются заранее."""
+    for model in (Favorite, ShoppingCart):
+        shift_counter(
+            Recipes.objects.filter(pk__in=model.objects.filter(
+                user=instance
+            ).values('recipe_id')),
+            model.counter_field, -1
+        )
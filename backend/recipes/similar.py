@@ -0,0 +1,137 @@
+"""Похожие рецепты по составу и тегам.
+
+Рецепт - строка разреженной матрицы признаков (ингредиенты и теги)
+с весами TF-IDF, нормированная по длине. Близость - косинус, то есть
+скалярное произведение строк: близости пачки рецептов ко всем
+остальным - одно произведение разреженных матриц (scipy.sparse),
+в котором участвуют только рецепты с общими признаками. Ингредиенты,
+которые встречаются почти везде (соль, вода), в произведение
+не попадают; тегов мало, каждый общий для многих рецептов, поэтому
+их это ограничение не касается.
+"""
+import numpy as np
+from django.db.models import Count
+from scipy import sparse
+
+from .models import IngredientInRecipe, Recipes, RecipeTags, SimilarRecipe
+
+TAG_WEIGHT = 0.5
+MAX_DOCUMENT_FREQUENCY = 0.2
+MIN_DOCUMENT_FREQUENCY_CAP = 50
+
+# Индекс строится до запуска воркеров и достаётся им при fork.
+_index = None
+
+
+class SimilarityIndex:
+    """Нормированные векторы рецептов - строки разреженной матрицы."""
+
+    def __init__(self, features):
+        """features: {recipe_id: [признак, ...]}; тег - отрицательный id."""
+        self.recipe_ids = np.array(list(features), dtype=np.int64)
+        self.rows = {
+            recipe_id: row for row, recipe_id in enumerate(features)
+        }
+        columns = {}
+        row_index = []
+        column_index = []
+        for row, recipe_features in enumerate(features.values()):
+            for feature in set(recipe_features):
+                row_index.append(row)
+                column_index.append(columns.setdefault(feature, len(columns)))
+        total = len(features)
+        matrix = sparse.csr_matrix(
+            (np.ones(len(row_index)), (row_index, column_index)),
+            shape=(total, len(columns))
+        )
+        frequency = np.bincount(matrix.indices, minlength=len(columns))
+        weights = np.log((1 + total) / np.maximum(frequency, 1))
+        is_tag = np.fromiter(columns, dtype=np.int64) < 0
+        weights[is_tag] *= TAG_WEIGHT
+        matrix = matrix @ sparse.diags(weights)
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)))
+        norms[norms == 0] = 1.0
+        matrix = sparse.diags(1 / norms.ravel()) @ matrix
+        max_frequency = max(
+            MIN_DOCUMENT_FREQUENCY_CAP, total * MAX_DOCUMENT_FREQUENCY
+        )
+        matrix = matrix @ sparse.diags(
+            ((frequency <= max_frequency) | is_tag).astype(float)
+        )
+        matrix.eliminate_zeros()
+        self.matrix = matrix.tocsr()
+        self.transposed = self.matrix.T.tocsr()
+
+    def top_k(self, recipe_id, k):
+        return self.top_k_many([recipe_id], k)[0]
+
+    def top_k_many(self, recipe_ids, k):
+        """[(id, близость), ...] для каждого рецепта, самые похожие
+        первыми, при равной близости - меньший id."""
+        known = [recipe_id for recipe_id in recipe_ids
+                 if recipe_id in self.rows]
+        rows = [self.rows[recipe_id] for recipe_id in known]
+        scores = (self.matrix[rows] @ self.transposed).tocsr()
+        neighbours = dict.fromkeys(recipe_ids, [])
+        for position, recipe_id in enumerate(known):
+            start, end = scores.indptr[position:position + 2]
+            other_rows = scores.indices[start:end]
+            values = scores.data[start:end]
+            other = other_rows != rows[position]
+            other_rows, values = other_rows[other], values[other]
+            if len(values) > k > 0:
+                # Отбор до сортировки, равные k-й близости остаются.
+                best = values >= np.partition(values, -k)[-k]
+                other_rows, values = other_rows[best], values[best]
+            other_ids = self.recipe_ids[other_rows]
+            order = np.lexsort((other_ids, -values))[:k]
+            neighbours[recipe_id] = [
+                (int(other_ids[index]), float(values[index]))
+                for index in order
+            ]
+        return [neighbours[recipe_id] for recipe_id in recipe_ids]
+
+
+def load_features():
+    """Признаки всех рецептов: id ингредиентов и минус id тегов."""
+    features = {
+        recipe_id: []
+        for recipe_id in Recipes.objects.values_list('id', flat=True)
+    }
+    links = (
+        IngredientInRecipe.objects.values_list('recipe_id', 'ingredient_id'),
+        RecipeTags.objects.values_list('recipe_id', 'tag_id'),
+    )
+    for sign, queryset in zip((1, -1), links):
+        for recipe_id, feature in queryset.order_by().iterator():
+            features[recipe_id].append(sign * feature)
+    return features
+
+
+def set_index(index):
+    global _index
+    _index = index
+
+
+def top_k_batch(recipe_ids, k):
+    """Соседи для пачки рецептов; вызывается в процессе-воркере."""
+    return list(zip(recipe_ids, _index.top_k_many(recipe_ids, k)))
+
+
+def similar_recipe_ids(recipe_id, limit):
+    """id похожих рецептов: предпосчитанные, а для ещё не посчитанных
+    рецептов - по числу общих ингредиентов, одним запросом."""
+    similar_ids = list(SimilarRecipe.objects.filter(
+        recipe_id=recipe_id
+    ).order_by('rank').values_list('similar_id', flat=True)[:limit])
+    if similar_ids:
+        return similar_ids
+    return list(IngredientInRecipe.objects.filter(
+        ingredient_id__in=IngredientInRecipe.objects.filter(
+            recipe_id=recipe_id
+        ).values('ingredient_id')
+    ).exclude(recipe_id=recipe_id).values('recipe_id').annotate(
+        shared=Count('id')
+    ).order_by('-shared', '-recipe_id').values_list(
+        'recipe_id', flat=True
+    )[:limit])
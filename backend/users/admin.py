@@ -27,6 +27,8 @@ class CustomAdmin(UserAdmin):
         'last_name',
         'id',
         'role',
+        'recipes_count',
+        'followers_count',
     ]
 
     list_filter = [
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.16 on 2026-10-18 19:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='feed_fanout_on_read',
+            field=models.BooleanField(default=False, verbose_name='рецепты в ленты подписчиков подмешиваются при чтении'),
+        ),
+    ]
@@ -36,6 +36,17 @@ class User(AbstractUser):
         default=DEFAULT_ROLE
     )
 
+    recipes_count = models.PositiveIntegerField('число рецептов', default=0)
+
+    followers_count = models.PositiveIntegerField(
+        'число подписчиков', default=0
+    )
+
+    feed_fanout_on_read = models.BooleanField(
+        'рецепты в ленты подписчиков подмешиваются при чтении',
+        default=False
+    )
+
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ('first_name', 'last_name', 'username', )
 